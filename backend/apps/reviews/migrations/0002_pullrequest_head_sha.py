@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pullrequest',
+            name='head_sha',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0002_pullrequest_head_sha'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pullrequest',
+            name='reviewed_head_sha',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
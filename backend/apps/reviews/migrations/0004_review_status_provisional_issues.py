@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0003_pullrequest_reviewed_head_sha'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aireview',
+            name='status',
+            field=models.CharField(choices=[('running', 'Running'), ('complete', 'Complete')], default='complete', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='reviewissue',
+            name='provisional',
+            field=models.BooleanField(default=False),
+        ),
+    ]
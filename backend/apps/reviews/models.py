@@ -25,6 +25,8 @@ class PullRequest(models.Model):
     source_branch = models.CharField(max_length=255)
     target_branch = models.CharField(max_length=255)
     url = models.URLField()
+    head_sha = models.CharField(max_length=64, blank=True, default='')
+    reviewed_head_sha = models.CharField(max_length=64, blank=True, default='')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -44,6 +46,11 @@ class PullRequest(models.Model):
 class AIReview(models.Model):
     """Model for AI-generated reviews of pull requests"""
     
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('complete', 'Complete'),
+    ]
+    
     pull_request = models.OneToOneField(
         PullRequest,
         on_delete=models.CASCADE,
@@ -53,6 +60,7 @@ class AIReview(models.Model):
     summary = models.TextField()
     deployment_ready = models.BooleanField(default=False)
     analysis_data = models.JSONField(default=dict)  # Store full AI response
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='complete')
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -87,6 +95,7 @@ class ReviewIssue(models.Model):
     file_path = models.CharField(max_length=500)
     line_number = models.IntegerField(null=True, blank=True)
     suggestion = models.TextField()
+    provisional = models.BooleanField(default=False)  # Streamed while the review is running
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
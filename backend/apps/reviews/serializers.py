@@ -15,6 +15,7 @@ class ReviewIssueSerializer(serializers.ModelSerializer):
             'file_path',
             'line_number',
             'suggestion',
+            'provisional',
             'created_at'
         ]
         read_only_fields = ['id', 'created_at']
@@ -35,6 +36,7 @@ class AIReviewSerializer(serializers.ModelSerializer):
             'summary',
             'deployment_ready',
             'analysis_data',
+            'status',
             'issues',
             'issues_count',
             'high_severity_count',
@@ -1,3 +1,117 @@
 from django.contrib import admin
 
-# Register your models here.
+from . import inbox
+from .models import GitMirror, ProviderApiStats, ProviderTokenBudget, TriageStats, WebhookDelivery
+
+
+@admin.register(WebhookDelivery)
+class WebhookDeliveryAdmin(admin.ModelAdmin):
+    """Admin interface for the webhook inbox"""
+
+    list_display = [
+        'id',
+        'provider',
+        'event',
+        'delivery_id',
+        'status',
+        'attempts',
+        'received_at',
+        'processed_at'
+    ]
+
+    list_filter = [
+        'provider',
+        'status',
+        'event'
+    ]
+
+    search_fields = [
+        'delivery_id',
+        'event',
+        'last_error'
+    ]
+
+    readonly_fields = [
+        'provider',
+        'event',
+        'delivery_id',
+        'headers',
+        'status',
+        'attempts',
+        'last_error',
+        'locked_at',
+        'processed_at',
+        'received_at'
+    ]
+
+    exclude = ['payload']
+    actions = ['redrive_deliveries']
+
+    def redrive_deliveries(self, request, queryset):
+        """Reset selected deliveries to pending and drain the inbox"""
+        count = inbox.redrive(queryset)
+        inbox.enqueue_drain()
+        self.message_user(request, f"{count} deliveries re-queued")
+    redrive_deliveries.short_description = 'Re-drive selected deliveries'
+
+
+@admin.register(TriageStats)
+class TriageStatsAdmin(admin.ModelAdmin):
+    """Diff triage savings per repository"""
+
+    list_display = [
+        'repository',
+        'files_skipped',
+        'bytes_skipped',
+        'tokens_skipped',
+        'reviews_skipped',
+        'updated_at'
+    ]
+
+    readonly_fields = list_display
+
+
+@admin.register(ProviderApiStats)
+class ProviderApiStatsAdmin(admin.ModelAdmin):
+    """Provider API requests, cache revalidations and remaining rate limit per host"""
+
+    list_display = [
+        'host',
+        'requests',
+        'not_modified',
+        'rate_limit_remaining',
+        'rate_limit_limit',
+        'updated_at'
+    ]
+
+    readonly_fields = list_display
+
+
+@admin.register(GitMirror)
+class GitMirrorAdmin(admin.ModelAdmin):
+    """Local git mirrors and their disk use"""
+
+    list_display = [
+        'repository',
+        'size_bytes',
+        'fetched_at',
+        'last_used_at'
+    ]
+
+    readonly_fields = list_display
+
+
+@admin.register(ProviderTokenBudget)
+class ProviderTokenBudgetAdmin(admin.ModelAdmin):
+    """Remaining provider rate limit per access token"""
+
+    list_display = [
+        'token',
+        'host',
+        'remaining',
+        'limit',
+        'reset_at',
+        'updated_at'
+    ]
+
+    readonly_fields = list_display
@@ -1,75 +1,600 @@
 # apps/webhooks/ai_analyzer.py
-import anthropic
+import logging
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+
 from django.conf import settings
 
-def analyze_pr_with_ai(pr_data, diff_content):
-    """Analyze PR using Anthropic Claude"""
-    
-    client = anthropic.Anthropic(api_key=settings.ANTHROPIC_API_KEY)
-    
-    prompt = f"""Analyze this pull request and provide a structured review.
+from . import context_packer, llm, rate_limit, review_cache, static_checks
+from .diffs import CHARS_PER_TOKEN, DiffChunk, chunk_diff, parse_diff
+from .response_parser import StreamingAnalysisParser
 
-PR Title: {pr_data.get('title')}
-PR Description: {pr_data.get('description', 'No description')}
+logger = logging.getLogger(__name__)
 
-Code Changes:
-{diff_content[:5000]}  # Limit to 5000 chars
+# Bump whenever the prompt changes meaningfully; it is part of the review cache key
+PROMPT_VERSION = '2'
+
+SEVERITY_RANK = {'high': 0, 'medium': 1, 'low': 2}
+# Risk score of a file reviewed alongside others, from its worst issue
+SEVERITY_RISK = {'high': 80, 'medium': 50, 'low': 20}
+
+
+def fallback_analysis(summary='AI analysis unavailable'):
+    """Result used when the model cannot produce a usable analysis"""
+    return {
+        'summary': summary,
+        'riskScore': 50,
+        'issues': [],
+        'recommendations': [],
+        'blockers': [],
+        'deploymentReady': False,
+        'incomplete': True,
+    }
+
+
+# Stable system prompt shared by every review call. It is sent as a
+# prompt-cache prefix (AI_PROMPT_CACHE), so keep anything that varies per
+# PR out of it, and keep it above the provider's minimum cacheable length
+# (PROMPT_CACHE_MIN_TOKENS) or the cache marker is silently ignored.
+REVIEW_INSTRUCTIONS = """You are a senior software engineer reviewing a pull request before it is merged and deployed.
+You receive the PR title and description followed by a unified git diff, or one part of a large diff.
+Review only the changes shown. Lines starting with "+" were added, lines starting with "-" were removed,
+and lines starting with a space are unchanged context included to help you understand the change.
+
+What to look for, in order of importance:
+
+1. Security
+   - Injection: SQL built with string formatting, shell commands with shell=True or unsanitized input,
+     template rendering of user input without escaping (mark_safe, |safe), eval/exec, unsafe
+     deserialization (pickle, yaml.load without SafeLoader).
+   - Authentication and authorization: views or endpoints that lose permission checks, AllowAny or
+     csrf_exempt on state-changing endpoints, object access without ownership checks (IDOR).
+   - Secrets: API keys, passwords, tokens or private keys committed in code, settings or fixtures;
+     secrets written to logs or error messages.
+   - Transport and crypto: verify=False, disabled certificate checks, weak hashes (md5, sha1) used for
+     passwords or signatures, non-constant-time comparison of signatures or tokens, predictable
+     random values used for security purposes.
+   - Webhook and API handling: missing signature verification, trusting client-supplied identifiers.
+
+2. Correctness
+   - Logic errors, off-by-one errors, inverted conditions, wrong operator precedence.
+   - Unhandled None or empty values, missing error handling around I/O and network calls, exceptions
+     swallowed so that failures pass silently.
+   - Race conditions: check-then-act on shared state, missing transactions or row locks, non-atomic
+     counters, work scheduled before the surrounding transaction commits.
+   - Data migrations that can fail on existing rows, lose data, or lock large tables for a long time;
+     schema changes that are incompatible with code still running during a rolling deploy.
+   - API or behaviour changes that break existing callers, serializers or stored data.
+
+3. Performance and reliability
+   - Database queries inside loops (N+1), missing select_related/prefetch_related, unbounded querysets,
+     missing indexes on new filter or ordering columns.
+   - Network calls without timeouts or retries, blocking calls inside async code, unbounded memory use
+     such as reading whole files or responses into memory when streaming would do.
+   - Work repeated on every request that could be cached or done once.
+
+4. Maintainability
+   - Dead code, duplicated logic, misleading names, missing tests for new behaviour or bug fixes.
+   Report maintainability issues only when they are likely to cause real problems; do not report
+   matters of taste or formatting.
+
+Severity:
+- "high": exploitable security problems, data loss or corruption, crashes on common paths, or changes
+  that will break production. A PR with any high issue is not ready to deploy.
+- "medium": bugs on less common paths, performance problems likely to matter under real load,
+  missing validation or error handling with a limited blast radius.
+- "low": minor robustness improvements, missing tests, small clarity issues.
 
-Provide analysis in this JSON format:
-{{
+Rules for issues:
+- Every issue must point at a file from the diff and, where possible, the line number in the new
+  version of the file (count from the "+" side of the hunk header).
+- Each issue needs a short specific title and a concrete suggestion describing how to fix it.
+- Do not report the same problem more than once; do not report issues in code the diff does not show.
+- If the diff looks correct, return an empty issues list rather than inventing problems.
+
+riskScore is 0-100: 0-20 for trivial or well-contained changes, 21-50 for ordinary changes with some
+risk, 51-80 for changes touching security, data or many components, 81-100 for changes likely to cause
+an incident. deploymentReady is false when there is any high severity issue or blocker.
+Blockers are the problems that must be fixed before merging, as short sentences.
+
+Respond with a single JSON object and nothing else, in exactly this format:
+{
   "summary": "Brief overview",
   "riskScore": 0-100,
   "issues": [
-    {{
+    {
       "severity": "high|medium|low",
       "title": "Issue title",
       "file": "file path",
       "line": line_number,
       "suggestion": "How to fix"
-    }}
+    }
   ],
   "recommendations": ["rec 1", "rec 2"],
   "blockers": ["blocker 1"],
   "deploymentReady": true/false
-}}
+}"""
 
-Focus on security, performance, and best practices."""
-    
-    try:
-        message = client.messages.create(
-            model=settings.ANTHROPIC_MODEL,
-            max_tokens=1024,
-            messages=[{"role": "user", "content": prompt}]
+# Claude Sonnet/Opus do not cache prefixes shorter than this
+PROMPT_CACHE_MIN_TOKENS = 1024
+
+
+def build_prompt(pr_data, diff_content, part=None, omitted=None, hints=None):
+    """
+    Build the per-PR part of the review prompt for one diff chunk
+
+    The instructions live in REVIEW_INSTRUCTIONS, sent as the system
+    prompt. ``omitted`` lists stubs for lower-risk changes left out of
+    the prompt; ``hints`` lists static check findings already reported
+    """
+    scope = ''
+    if pr_data.get('since'):
+        scope += (
+            f"\nOnly the changes pushed since commit {pr_data['since'][:12]} are shown; "
+            f"earlier changes were already reviewed.\n"
+        )
+    if part:
+        index, total = part
+        scope += f"\nThis is part {index} of {total} of the diff; review only the changes shown.\n"
+    if omitted:
+        scope += (
+            "\nThese lower-risk changes are not shown; do not report issues in them:\n"
+            f"{context_packer.format_stubs(omitted)}\n"
         )
-        
-        content = message.content[0].text
-        return parse_ai_response(content)
-        
+    if hints:
+        scope += (
+            "\nStatic checks already reported these; do not report them again:\n"
+            f"{static_checks.format_hints(hints)}\n"
+        )
+
+    return f"""PR Title: {pr_data.get('title')}
+PR Description: {pr_data.get('description', 'No description')}
+{scope}
+Code Changes:
+{diff_content}"""
+
+
+def analyze_pr_with_ai(pr_data, diff_content, on_issue=None):
+    """
+    Analyze PR using Anthropic Claude
+
+    The diff is split into per-file/per-hunk chunks under
+    AI_CHUNK_TOKEN_BUDGET; chunks are analyzed concurrently (at most
+    AI_MAX_PARALLEL_CALLS in flight) and the results merged, so wall-clock
+    time tracks the slowest chunk rather than the sum of all of them.
+    Files whose normalized diff was reviewed before are served from the
+    review cache and never reach the model. When the rest exceeds
+    AI_CONTEXT_TOKEN_BUDGET, the riskiest hunks are sent first and the
+    others are listed as stubs (see context_packer.py).
+
+    Local static checks run first; their findings are issues of their own
+    and are listed in the prompts as already reported (see static_checks.py).
+
+    Responses are streamed; ``on_issue`` is called in the calling thread
+    with each issue as soon as it is parsed (static findings and cached
+    issues first).
+    """
+    plan = plan_review(pr_data, diff_content)
+    if on_issue:
+        for finding in plan.findings:
+            on_issue(finding)
+        for entry in plan.cached:
+            for issue in entry.get('issues') or []:
+                on_issue(issue)
+    return finish_review(plan, run_model_calls(plan.prompts, on_issue))
+
+
+@dataclass
+class ReviewPlan:
+    """
+    The model calls one review needs, and what merging their results needs
+
+    Everything but ``prompts`` is JSON-serializable via ``to_dict``, so a
+    plan can be stored while its prompts run elsewhere (batch_review.py).
+    """
+    prompts: list = field(default_factory=list)
+    chunk_paths: list = field(default_factory=list)  # file paths per prompt
+    keys: dict = field(default_factory=dict)         # path -> review cache key
+    cached: list = field(default_factory=list)       # review cache entries reused
+    skipped_chunks: int = 0
+    omitted_hunks: int = 0
+    omitted_paths: list = field(default_factory=list)
+    findings: list = field(default_factory=list)     # static check findings
+    raw: bool = False                                # not a git diff
+
+    def to_dict(self):
+        data = asdict(self)
+        del data['prompts']
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+def plan_review(pr_data, diff_content):
+    """
+    Look up the review cache, pack and chunk the diff, and build the prompts
+
+    Returns:
+        ReviewPlan: Prompts still to run; pass their results to ``finish_review``
+    """
+    files = parse_diff(diff_content)
+    if not files:
+        # Not a git diff; review what fits in one chunk
+        text = diff_content[:settings.AI_CHUNK_TOKEN_BUDGET * CHARS_PER_TOKEN]
+        return ReviewPlan(prompts=[build_prompt(pr_data, text)], chunk_paths=[[]], raw=True)
+
+    findings = static_checks.check_files(files) if settings.STATIC_CHECKS else []
+
+    cache = review_cache.get_backend()
+    keys = {
+        f.path: review_cache.file_cache_key(f, settings.ANTHROPIC_MODEL, PROMPT_VERSION)
+        for f in files
+    }
+    cached = cache.get_many(set(keys.values())) if cache else {}
+    pending = [f for f in files if keys[f.path] not in cached]
+    cached_entries = [cached[keys[f.path]] for f in files if keys[f.path] in cached]
+    if cache:
+        logger.info(f"Review cache: {len(cached_entries)} of {len(files)} files unchanged")
+
+    packed = context_packer.pack(pending, settings.AI_CONTEXT_TOKEN_BUDGET)
+    if packed.stubs:
+        logger.info(f"Context packer left out {packed.omitted_hunks} lower-risk hunks in {len(packed.stubs)} files")
+
+    chunks = chunk_diff(packed.files, settings.AI_CHUNK_TOKEN_BUDGET)
+    skipped = chunks[settings.AI_MAX_CHUNKS:]
+    chunks = chunks[:settings.AI_MAX_CHUNKS]
+
+    def hints(chunk):
+        return [f for f in findings if f['file'] in chunk.paths]
+
+    if len(chunks) == 1 and not cached_entries:
+        prompts = [build_prompt(pr_data, chunks[0].text, omitted=packed.stubs, hints=hints(chunks[0]))]
+    else:
+        prompts = [
+            build_prompt(pr_data, chunk.text, part=(i + 1, len(chunks)),
+                         omitted=packed.stubs if i == 0 else None, hints=hints(chunk))
+            for i, chunk in enumerate(chunks)
+        ]
+
+    return ReviewPlan(
+        prompts=prompts,
+        chunk_paths=[chunk.paths for chunk in chunks],
+        keys=keys if cache else {},
+        cached=cached_entries,
+        skipped_chunks=len(skipped),
+        omitted_hunks=packed.omitted_hunks,
+        omitted_paths=sorted(packed.omitted_paths),
+        findings=findings,
+    )
+
+
+def finish_review(plan, results):
+    """
+    Cache per-file results and merge the analyses of a plan's prompts,
+    then add the static check findings
+
+    Args:
+        plan: ReviewPlan from ``plan_review``
+        results: Parsed analysis (or None on failure) per prompt, in order
+    """
+    if plan.raw:
+        return results[0] or fallback_analysis()
+
+    cache = review_cache.get_backend() if plan.keys else None
+    if cache:
+        # Files with hunks left out were not fully reviewed
+        chunks = [DiffChunk(text='', paths=paths) for paths in plan.chunk_paths]
+        cache.set_many({
+            plan.keys[path]: entry
+            for path, entry in per_file_entries(chunks, results).items()
+            if path not in plan.omitted_paths
+        })
+
+    if len(results) == 1 and not plan.cached and not plan.skipped_chunks and not plan.omitted_hunks:
+        analysis = results[0] or fallback_analysis()
+    else:
+        analysis = merge_analyses(results, skipped_chunks=plan.skipped_chunks, cached=plan.cached,
+                                  omitted_hunks=plan.omitted_hunks)
+    return static_checks.merge_findings(analysis, plan.findings)
+
+
+def per_file_entries(chunks, results):
+    """
+    Split chunk analyses into per-file cache entries
+
+    Issues are attributed to the file they name (unattributable ones to the
+    chunk's first file). A file reviewed in a chunk of its own keeps the
+    chunk's summary, score and lists; in a chunk shared with other files it
+    gets only its own issues, scored by the worst of them, so it is never
+    replayed with a blocker or score another file earned. A file split
+    over several chunks merges its parts. Files touched by a failed chunk
+    are not cached.
+    """
+    entries = {}
+    failed = set()
+
+    for chunk, result in zip(chunks, results):
+        if not result:
+            failed.update(chunk.paths)
+            continue
+
+        issues = {path: [] for path in chunk.paths}
+        for issue in result.get('issues') or []:
+            if isinstance(issue, dict):
+                issues[match_issue_path(str(issue.get('file', '')), chunk.paths)].append(issue)
+
+        for path in chunk.paths:
+            part = result if len(chunk.paths) == 1 else file_analysis(issues[path])
+            entry = entries.setdefault(path, {
+                'summary': part.get('summary', ''),
+                'riskScore': 0,
+                'issues': [],
+                'recommendations': [],
+                'blockers': [],
+                'deploymentReady': True,
+            })
+            try:
+                entry['riskScore'] = max(entry['riskScore'], int(part.get('riskScore', 50)))
+            except (TypeError, ValueError):
+                entry['riskScore'] = max(entry['riskScore'], 50)
+            entry['issues'] += issues[path]
+            entry['recommendations'] += [r for r in part.get('recommendations') or [] if r not in entry['recommendations']]
+            entry['blockers'] += [b for b in part.get('blockers') or [] if b not in entry['blockers']]
+            entry['deploymentReady'] = entry['deploymentReady'] and bool(part.get('deploymentReady'))
+
+    return {path: entry for path, entry in entries.items() if path not in failed}
+
+
+def file_analysis(issues):
+    """Analysis of one file of a shared chunk, from its own issues"""
+    severities = [str(i.get('severity', 'low')).lower() for i in issues]
+    return {
+        'summary': '',
+        'riskScore': max([SEVERITY_RISK.get(s, 20) for s in severities], default=0),
+        'deploymentReady': 'high' not in severities,
+    }
+
+
+def match_issue_path(issue_file, paths):
+    """Map the file named by an issue onto one of the chunk's paths"""
+    issue_file = issue_file.strip().removeprefix('./').lstrip('/')
+    for path in paths:
+        if issue_file and (path == issue_file or path.endswith('/' + issue_file) or issue_file.endswith(path)):
+            return path
+    return paths[0]
+
+
+def run_model_calls(prompts, on_issue=None):
+    """
+    Analyze prompts concurrently, at most AI_MAX_PARALLEL_CALLS at a time
+    (scaled down while the shared rate limiter is backing off)
+
+    Uses the shared sync client on a thread pool, or with AI_ASYNC_CALLS
+    the shared async client on the worker's event loop, where calls from
+    all reviews in the process also share AI_MAX_INFLIGHT_PER_WORKER.
+    Issues parsed from the streams are passed to ``on_issue`` from the
+    calling thread, so it may use the database.
+
+    Returns:
+        list: Parsed analysis (or None on failure) per prompt, in order
+
+    Raises:
+        rate_limit.RateLimited: A call could not get model capacity; requeue the review
+    """
+    limit = settings.AI_MAX_PARALLEL_CALLS
+    if settings.AI_RATE_LIMIT:
+        limit = rate_limit.limiter.concurrency(limit)
+    limit = max(1, min(limit, len(prompts)))
+    found = queue.SimpleQueue()
+    emit = found.put if on_issue else None
+
+    if settings.AI_ASYNC_CALLS:
+        futures = [llm.runner.submit(analyze_chunks_async(prompts, limit, emit))]
+    else:
+        client = llm.get_client()
+        pool = ThreadPoolExecutor(max_workers=limit)
+        futures = [pool.submit(analyze_chunk, client, prompt, emit) for prompt in prompts]
+        pool.shutdown(wait=False)
+
+    # A call's issues are queued before its future completes, so once every
+    # future has reported done the queue holds nothing more
+    for future in futures:
+        future.add_done_callback(lambda _: found.put(CALL_DONE))
+    remaining = len(futures)
+    while remaining:
+        item = found.get()
+        if item is CALL_DONE:
+            remaining -= 1
+        else:
+            on_issue(item)
+
+    results = [future.result() for future in futures]
+    return results[0] if settings.AI_ASYNC_CALLS else results
+
+
+CALL_DONE = object()
+
+
+def model_request(prompt):
+    """Keyword arguments for one review call"""
+    return {
+        'model': settings.ANTHROPIC_MODEL,
+        'max_tokens': 1024,
+        'system': system_prompt(),
+        'messages': [{"role": "user", "content": prompt}],
+    }
+
+
+def system_prompt():
+    """REVIEW_INSTRUCTIONS, marked as a cacheable prefix when AI_PROMPT_CACHE is on"""
+    if not settings.AI_PROMPT_CACHE:
+        return REVIEW_INSTRUCTIONS
+    return [{'type': 'text', 'text': REVIEW_INSTRUCTIONS, 'cache_control': {'type': 'ephemeral'}}]
+
+
+def analyze_chunk(client, prompt, emit=None):
+    """
+    Run one streamed model call, through the shared rate limiter when
+    AI_RATE_LIMIT is on
+
+    Args:
+        emit: Called with each issue as soon as it is parsed
+
+    Returns:
+        dict: Parsed analysis, or None if the call failed
+
+    Raises:
+        rate_limit.RateLimited: No model capacity within the limiter's wait
+    """
+    request = model_request(prompt)
+
+    def send():
+        parser = StreamingAnalysisParser()
+        with client.messages.stream(**request) as stream:
+            for text in stream.text_stream:
+                for issue in parser.feed(text):
+                    if emit:
+                        emit(issue)
+            usage = stream.get_final_message().usage
+        return parser, usage
+
+    try:
+        if settings.AI_RATE_LIMIT:
+            parser, usage = rate_limit.limiter.call(request, send)
+            rate_limit.limiter.settle(request, usage)
+        else:
+            parser, usage = send()
+        llm.usage.record(usage)
+        return checked(parser.result())
+
+    except rate_limit.RateLimited:
+        raise
     except Exception as e:
-        print(f"AI analysis error: {e}")
-        return {
-            'summary': 'AI analysis unavailable',
-            'riskScore': 50,
-            'issues': [],
-            'recommendations': [],
-            'blockers': [],
-            'deploymentReady': False
-        }
-
-def parse_ai_response(text):
-    """Parse AI response into JSON"""
-    import json
-    
+        logger.error(f"AI analysis error: {e}")
+        return None
+
+
+async def analyze_chunks_async(prompts, limit, emit=None):
+    """Coroutine behind run_model_calls' async mode; runs on llm.runner's loop"""
+    client = llm.get_async_client()
+    return await llm.runner.gather_limited(
+        [lambda prompt=prompt: analyze_chunk_async(client, prompt, emit) for prompt in prompts],
+        limit
+    )
+
+
+async def analyze_chunk_async(client, prompt, emit=None):
+    """Async counterpart of analyze_chunk"""
+    request = model_request(prompt)
+
+    async def send():
+        parser = StreamingAnalysisParser()
+        async with client.messages.stream(**request) as stream:
+            async for text in stream.text_stream:
+                for issue in parser.feed(text):
+                    if emit:
+                        emit(issue)
+            usage = (await stream.get_final_message()).usage
+        return parser, usage
+
     try:
-        # Remove markdown code blocks if present
-        clean_text = text.replace('```json', '').replace('```', '').strip()
-        return json.loads(clean_text)
-    except:
-        return {
-            'summary': text[:500],
-            'riskScore': 50,
-            'issues': [],
-            'recommendations': [],
-            'blockers': [],
-            'deploymentReady': False
-        }
\ No newline at end of file
+        if settings.AI_RATE_LIMIT:
+            parser, usage = await rate_limit.limiter.call_async(request, send)
+            rate_limit.limiter.settle(request, usage)
+        else:
+            parser, usage = await send()
+        llm.usage.record(usage)
+        return checked(parser.result())
+
+    except rate_limit.RateLimited:
+        raise
+    except Exception as e:
+        logger.error(f"AI analysis error: {e}")
+        return None
+
+
+def checked(analysis):
+    """Log analyses that had to be repaired; they are kept rather than re-requested"""
+    if analysis['salvaged']:
+        logger.warning(f"Salvaged malformed model output: {', '.join(analysis['salvaged'])}")
+    return analysis
+
+
+def merge_analyses(results, skipped_chunks=0, cached=(), omitted_hunks=0):
+    """
+    Reduce per-chunk analyses into a single review
+
+    Issues, recommendations and blockers are concatenated with duplicates
+    dropped. The risk score is the riskiest chunk's score: a PR is as risky
+    as its riskiest part, and averaging would dilute one dangerous file
+    among many trivial ones. ``cached`` holds per-file entries reused from
+    the review cache and is merged like any other analysis;
+    ``omitted_hunks`` counts lower-risk hunks the context packer left out.
+    """
+    analyses = [r for r in results if r] + list(cached)
+    if not analyses:
+        return fallback_analysis()
+
+    issues, seen_issues = [], set()
+    for analysis in analyses:
+        for issue in analysis.get('issues') or []:
+            if not isinstance(issue, dict):
+                continue
+            key = (issue.get('file'), issue.get('line'), issue.get('title'))
+            if key not in seen_issues:
+                seen_issues.add(key)
+                issues.append(issue)
+    issues.sort(key=lambda i: SEVERITY_RANK.get(str(i.get('severity', 'low')).lower(), 3))
+
+    def merged_list(name):
+        merged = []
+        for analysis in analyses:
+            for item in analysis.get(name) or []:
+                if item not in merged:
+                    merged.append(item)
+        return merged
+
+    scores = []
+    for analysis in analyses:
+        try:
+            scores.append(int(analysis.get('riskScore', 50)))
+        except (TypeError, ValueError):
+            scores.append(50)
+
+    blockers = merged_list('blockers')
+    failed = sum(1 for r in results if not r)
+
+    summaries = []
+    for analysis in analyses:
+        text = str(analysis.get('summary', '')).strip()
+        if text and text not in summaries:
+            summaries.append(text)
+
+    summary = f"Reviewed in {len(results)} parts." if results else "All files matched earlier reviews."
+    if cached:
+        summary += f" {len(cached)} unchanged file(s) reused from earlier reviews."
+    if failed:
+        summary += f" {failed} part(s) could not be analyzed."
+    if skipped_chunks:
+        summary += f" {skipped_chunks} part(s) exceeded the review size limit and were skipped."
+    if omitted_hunks:
+        summary += f" {omitted_hunks} lower-risk hunk(s) were not reviewed to stay within the size limit."
+    summary = '\n'.join([summary] + [f"- {s}" for s in summaries])
+
+    analysis = {
+        'summary': summary,
+        'riskScore': max(scores),
+        'issues': issues,
+        'recommendations': merged_list('recommendations'),
+        'blockers': blockers,
+        'deploymentReady': (
+            not blockers and not failed and not skipped_chunks and not omitted_hunks
+            and all(a.get('deploymentReady') for a in analyses)
+        )
+    }
+    if failed or skipped_chunks or omitted_hunks:
+        analysis['incomplete'] = True
+    return analysis
@@ -1,7 +1,12 @@
 from django.apps import AppConfig
+from django.core import checks
 
 
 class WebhooksConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.webhooks'  # CHANGED from 'webhooks'
-    verbose_name = 'Webhooks'
\ No newline at end of file
+    verbose_name = 'Webhooks'
+
+    def ready(self):
+        from .checks import check_shared_caches
+        checks.register(check_shared_caches, checks.Tags.caches)
@@ -0,0 +1,548 @@
+# apps/webhooks/async_provider.py
+"""
+Asyncio provider API client
+
+``ultis`` makes provider calls one after another, so a review waits for
+the PR's metadata, its diff and each file in turn. AsyncProviderClient
+makes the same GitHub and Bitbucket calls with an ``httpx.AsyncClient``;
+independent calls run concurrently through ``gather``, at most
+PROVIDER_ASYNC_CONCURRENCY at a time per client.
+
+Calls behave like their ``ultis`` counterparts: provider timeouts and
+5xx retries, ETag revalidation through provider_cache, the token budget
+of provider_budget (BudgetExhausted is raised), git mirrors when
+GIT_MIRRORS is on, and None / False when a call fails. Database work goes
+through ``sync_to_async``, so the client can be used from async views.
+
+An httpx client belongs to the event loop it was opened on: open one with
+``async with AsyncProviderClient() as client`` where it is awaited.
+Synchronous code (Celery tasks) uses ``run``; ``handler.review_pull_request``
+reads the PR's diff and its target branch's .gitattributes that way.
+"""
+import asyncio
+import json
+import logging
+import zlib
+from dataclasses import dataclass, field
+
+import httpx
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from . import git_mirror, payloads, provider_budget, provider_cache, publisher
+from .diff_stream import SpooledDiff
+from .models import ProviderResponseCache
+from .ultis import BITBUCKET_LIST_STATES, GITHUB_LIST_STATES
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS = (500, 502, 503, 504)
+# Retried on any failure; POSTs only when the connection could not be made
+IDEMPOTENT = ('GET', 'PUT')
+READ_CHUNK = 64 * 1024
+
+
+@dataclass
+class Target:
+    """What a call needs from the database, loaded before going async"""
+    provider: str
+    full_name: str
+    access_token: str
+
+    @property
+    def api_url(self):
+        if self.provider == 'github':
+            return f"{settings.GITHUB_API_URL}/repos/{self.full_name}"
+        workspace, repo_slug = self.full_name.split('/', 1)
+        return f"{settings.BITBUCKET_API_URL}/repositories/{workspace}/{repo_slug}"
+
+    def headers(self, accept='application/vnd.github.v3+json'):
+        if self.provider == 'github':
+            return {'Authorization': f'token {self.access_token}', 'Accept': accept}
+        return {'Authorization': f'Bearer {self.access_token}'}
+
+
+def load_target(repository):
+    """Target for a repository's calls, or None (logged) if they cannot be made"""
+    access_token = repository.owner.profile.access_token
+    if not access_token:
+        logger.error(f"No access token for user {repository.owner.id}")
+        return None
+    if repository.provider not in ('github', 'bitbucket'):
+        logger.error(f"Unknown provider: {repository.provider}")
+        return None
+    return Target(repository.provider, repository.full_name, access_token)
+
+
+@dataclass
+class ReviewInputs:
+    fields: dict = None   # PullRequest fields, None if the read failed
+    diff: SpooledDiff = None  # to be closed by the caller; None if the read failed
+    files: dict = field(default_factory=dict)  # path -> content at the ref, None if missing
+
+
+async def read_body(response, chunks):
+    return response, b''.join([chunk async for chunk in chunks])
+
+
+async def read_diff(response, chunks):
+    """Stream a diff response into a SpooledDiff, stopping at REVIEW_DIFF_MAX_BYTES"""
+    response.raise_for_status()
+    diff = SpooledDiff()
+    try:
+        async for chunk in chunks:
+            if not diff.write(chunk):
+                logger.warning(f"Diff from {response.url} exceeds {diff.max_bytes} bytes, truncating")
+                break
+    except Exception:
+        diff.close()
+        raise
+    return diff
+
+
+async def replay(body):
+    yield body
+
+
+async def capture(key, response, chunks):
+    """Pass a 200 body through, storing it compressed once all of it was read"""
+    compressor, parts, size = zlib.compressobj(provider_cache.COMPRESS_LEVEL), [], 0
+    async for chunk in chunks:
+        if compressor is not None:
+            size += len(chunk)
+            if size > settings.PROVIDER_CACHE_MAX_ENTRY_BYTES:
+                compressor, parts = None, []
+            else:
+                parts.append(compressor.compress(chunk))
+        yield chunk
+    if compressor is not None:
+        parts.append(compressor.flush())
+        await sync_to_async(provider_cache.store)(key, response, compressed=b''.join(parts))
+
+
+def account(url, headers, response, cached, not_modified):
+    """Provider API stats and token budget for one response"""
+    try:
+        if cached:
+            provider_cache.record(url, response, not_modified)
+        if settings.PROVIDER_BUDGET:
+            provider_budget.budget.observe(url, headers, response)
+    except Exception as e:
+        logger.warning(f"Could not record provider API use: {str(e)}")
+
+
+def touch(entry):
+    ProviderResponseCache.objects.filter(pk=entry.pk).update(last_used_at=timezone.now())
+
+
+class AsyncProviderClient:
+    """Provider API calls on one event loop, at most ``concurrency`` in flight"""
+
+    def __init__(self, concurrency=None):
+        self.concurrency = concurrency or settings.PROVIDER_ASYNC_CONCURRENCY
+        self.http = None
+        self.semaphore = None
+        self.targets = {}
+
+    async def __aenter__(self):
+        self.http = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.PROVIDER_HTTP_POOL_SIZE,
+                max_keepalive_connections=settings.PROVIDER_HTTP_POOL_SIZE,
+            ),
+            timeout=httpx.Timeout(settings.PROVIDER_HTTP_READ_TIMEOUT, connect=settings.PROVIDER_HTTP_CONNECT_TIMEOUT),
+        )
+        self.semaphore = asyncio.Semaphore(max(1, self.concurrency))
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.http.aclose()
+
+    @staticmethod
+    async def gather(*calls):
+        """Await independent calls concurrently; results in call order"""
+        return await asyncio.gather(*calls)
+
+    async def target(self, repository):
+        if repository.pk not in self.targets:
+            self.targets[repository.pk] = await sync_to_async(load_target)(repository)
+        return self.targets[repository.pk]
+
+    async def pull_request_target(self, pull_request):
+        repository = await sync_to_async(lambda: pull_request.repository)()
+        return await self.target(repository)
+
+    async def send(self, method, url, headers, params=None, json=None):
+        """Open a streamed response, retrying like the sync sessions do"""
+        retries = settings.PROVIDER_HTTP_RETRIES
+        idempotent = method in IDEMPOTENT
+        for attempt in range(retries + 1):
+            if attempt:
+                await asyncio.sleep(settings.PROVIDER_HTTP_BACKOFF * 2 ** (attempt - 1))
+            request = self.http.build_request(method, url, headers=headers, params=params, json=json)
+            try:
+                response = await self.http.send(request, stream=True)
+            except httpx.TransportError as e:
+                if attempt < retries and (idempotent or isinstance(e, httpx.ConnectError)):
+                    continue
+                raise
+            if idempotent and response.status_code in RETRY_STATUS and attempt < retries:
+                await response.aclose()
+                continue
+            return response
+
+    async def call(self, method, url, headers, params=None, json=None, consume=read_body):
+        """
+        One provider API call under the client's semaphore and the token's budget
+
+        GETs revalidate a stored response when PROVIDER_HTTP_CACHE is on; a
+        304 is answered from the stored body.
+
+        Args:
+            consume: ``await consume(response, chunks)`` reads the body from
+                the async iterator ``chunks``; by default the call returns
+                ``(response, body bytes)``
+
+        Raises:
+            provider_budget.BudgetExhausted: Too little budget left at the current priority
+            httpx.HTTPError: The request failed
+        """
+        headers, key, entry = dict(headers), None, None
+        cached = method == 'GET' and settings.PROVIDER_HTTP_CACHE
+        if cached:
+            key = provider_cache.cache_key(url, params, headers)
+            entry = await sync_to_async(provider_cache.lookup)(key)
+            if entry is not None:
+                if entry.etag:
+                    headers['If-None-Match'] = entry.etag
+                if entry.last_modified:
+                    headers['If-Modified-Since'] = entry.last_modified
+
+        async with self.semaphore:
+            if settings.PROVIDER_BUDGET:
+                provider_budget.budget.spend(url, headers)
+            response = await self.send(method, url, headers, params, json)
+            try:
+                not_modified = response.status_code == 304 and entry is not None
+                await sync_to_async(account)(url, headers, response, cached, not_modified)
+                if not_modified:
+                    # Read the empty body so the connection goes back to the pool
+                    await response.aread()
+                    await sync_to_async(touch)(entry)
+                    stored_headers = {name: value for name, value in response.headers.items()
+                                      if name.lower() not in ('content-encoding', 'content-length')}
+                    if entry.content_type:
+                        stored_headers['Content-Type'] = entry.content_type
+                    # The body is read from ``chunks``
+                    reply = httpx.Response(200, headers=stored_headers, request=response.request)
+                    chunks = replay(zlib.decompress(entry.body))
+                else:
+                    reply, chunks = response, response.aiter_bytes(READ_CHUNK)
+                    if cached and response.status_code == 200 and (
+                            response.headers.get('ETag') or response.headers.get('Last-Modified')):
+                        chunks = capture(key, response, chunks)
+                return await consume(reply, chunks)
+            finally:
+                await response.aclose()
+
+    async def pull_request_fields(self, pull_request):
+        """
+        The PR as the provider has it now
+
+        Returns:
+            dict: PullRequest model fields, or None if failed
+        """
+        target = await self.pull_request_target(pull_request)
+        if target is None:
+            return None
+        if target.provider == 'github':
+            url, decode = f"{target.api_url}/pulls/{pull_request.pr_number}", payloads.decode_github_pull_request_object
+        else:
+            url, decode = f"{target.api_url}/pullrequests/{pull_request.pr_number}", payloads.decode_bitbucket_pull_request_object
+        try:
+            response, body = await self.call('GET', url, target.headers())
+            response.raise_for_status()
+            return decode(body)
+        except (httpx.HTTPError, *payloads.DECODE_ERRORS) as e:
+            logger.error(f"Fetching PR #{pull_request.pr_number} of {target.full_name} failed: {str(e)}")
+            return None
+
+    async def pr_diff(self, pull_request):
+        """
+        Stream a pull request's diff, like ``ultis.fetch_pr_diff_stream``
+
+        Returns:
+            SpooledDiff: The diff, to be closed by the caller, or None if failed
+        """
+        target = await self.pull_request_target(pull_request)
+        if target is None:
+            return None
+        if settings.GIT_MIRRORS and target.provider in git_mirror.GIT_URLS:
+            try:
+                return await sync_to_async(git_mirror.pr_diff)(pull_request, target.access_token)
+            except git_mirror.GitError as e:
+                logger.warning(f"{str(e)}; falling back to the API")
+
+        if target.provider == 'github':
+            url = f"{target.api_url}/pulls/{pull_request.pr_number}"
+        else:
+            url = f"{target.api_url}/pullrequests/{pull_request.pr_number}/diff"
+        try:
+            return await self.call('GET', url, target.headers('application/vnd.github.v3.diff'), consume=read_diff)
+        except httpx.HTTPError as e:
+            logger.error(f"Diff fetch of PR #{pull_request.pr_number} failed: {str(e)}")
+            return None
+
+    async def compare_diff(self, pull_request, base_sha, head_sha):
+        """
+        Diff between two commits, like ``ultis.fetch_compare_diff``
+
+        Returns:
+            str: Diff content or None if failed (or larger than REVIEW_DIFF_MAX_BYTES)
+        """
+        target = await self.pull_request_target(pull_request)
+        if target is None:
+            return None
+        if settings.GIT_MIRRORS and target.provider in git_mirror.GIT_URLS:
+            try:
+                diff = await sync_to_async(git_mirror.compare_diff)(pull_request, target.access_token, base_sha, head_sha)
+                with diff:
+                    return None if diff.truncated else diff.text()
+            except git_mirror.GitError as e:
+                logger.warning(f"{str(e)}; falling back to the API")
+
+        if target.provider == 'github':
+            url = f"{target.api_url}/compare/{base_sha}...{head_sha}"
+        else:
+            # Bitbucket specs are source..destination
+            url = f"{target.api_url}/diff/{head_sha}..{base_sha}"
+        try:
+            diff = await self.call('GET', url, target.headers('application/vnd.github.v3.diff'), consume=read_diff)
+        except httpx.HTTPError as e:
+            logger.error(f"Error fetching compare diff {base_sha[:7]}..{head_sha[:7]}: {str(e)}")
+            return None
+        with diff:
+            # A partial interdiff would pass missing files off as unchanged
+            return None if diff.truncated else diff.text()
+
+    async def file(self, pull_request, path, ref):
+        """
+        One file at a commit, like ``ultis.fetch_file``
+
+        Returns:
+            str: File content, or None if it does not exist or the fetch failed
+        """
+        target = await self.pull_request_target(pull_request)
+        if target is None:
+            return None
+        if settings.GIT_MIRRORS and target.provider in git_mirror.GIT_URLS:
+            try:
+                return await sync_to_async(git_mirror.file_content)(pull_request, target.access_token, path, ref)
+            except git_mirror.GitError as e:
+                logger.warning(f"{str(e)}; falling back to the API")
+
+        if target.provider == 'github':
+            url, params = f"{target.api_url}/contents/{path}", {'ref': ref}
+        else:
+            url, params = f"{target.api_url}/src/{ref}/{path}", None
+        try:
+            response, body = await self.call('GET', url, target.headers('application/vnd.github.v3.raw'), params=params)
+            if response.status_code == 404:
+                return None
+            response.raise_for_status()
+            return body.decode(response.encoding or 'utf-8', errors='replace')
+        except httpx.HTTPError as e:
+            logger.error(f"Error fetching {path} at {ref[:7]}: {str(e)}")
+            return None
+
+    async def list_pull_requests(self, repository, state='all', limit=None):
+        """
+        A repository's pull requests, newest first, like ``ultis.list_pull_requests``
+
+        Pages follow one another: each one says whether there is a next.
+
+        Returns:
+            list: (pr_number, PullRequest fields) pairs; empty if listing failed
+        """
+        target = await self.target(repository)
+        if target is None:
+            return []
+
+        found = []
+        try:
+            if target.provider == 'github':
+                page = 1
+                while limit is None or len(found) < limit:
+                    response, body = await self.call('GET', f"{target.api_url}/pulls", target.headers(), params={
+                        'state': GITHUB_LIST_STATES[state], 'sort': 'created', 'direction': 'desc',
+                        'per_page': 100, 'page': page,
+                    })
+                    response.raise_for_status()
+                    batch = payloads.decode_github_pull_request_list(body)
+                    found += batch
+                    if len(batch) < 100:
+                        break
+                    page += 1
+            else:
+                url = f"{target.api_url}/pullrequests"
+                params = [('state', s) for s in BITBUCKET_LIST_STATES[state]] + [('pagelen', 50)]
+                while url and (limit is None or len(found) < limit):
+                    response, body = await self.call('GET', url, target.headers(), params=params)
+                    response.raise_for_status()
+                    batch, url = payloads.decode_bitbucket_pull_request_page(body)
+                    found += batch
+                    params = None  # the next URL carries them
+        except (httpx.HTTPError, *payloads.DECODE_ERRORS) as e:
+            logger.error(f"Listing pull requests of {target.full_name} failed: {str(e)}")
+            return []
+
+        return found[:limit]
+
+    async def publish_review(self, pull_request, review, body, commentable=None):
+        """
+        Publish a review on the PR, editing the earlier publication if there
+        is one, like ``publisher.publish_review``
+
+        Returns:
+            bool: True if the summary was published
+        """
+        target = await self.pull_request_target(pull_request)
+        if target is None:
+            return False
+        publication, already_posted, comments = await sync_to_async(publisher.pending_publication)(
+            pull_request, review, commentable
+        )
+        try:
+            with provider_budget.priority(provider_budget.PUBLISH):
+                if target.provider == 'github':
+                    comment_id, posted = await self.publish_github(target, pull_request, body, comments, publication)
+                else:
+                    comment_id, posted = await self.publish_bitbucket(target, pull_request, body, comments, publication)
+        except (httpx.HTTPError, provider_budget.BudgetExhausted, KeyError, ValueError) as e:
+            logger.error(f"Failed to publish review of PR #{pull_request.pr_number}: {str(e)}")
+            return False
+
+        await sync_to_async(publisher.save_publication)(pull_request, publication, already_posted, comment_id, posted)
+        return True
+
+    async def publish_github(self, target, pull_request, body, comments, publication):
+        """
+        Submit or update the PR's GitHub review, like ``publisher.publish_github``
+
+        Returns:
+            tuple: (review id, keys of the inline comments posted)
+        """
+        url = f"{target.api_url}/pulls/{pull_request.pr_number}/reviews"
+        headers = target.headers()
+
+        if publication:
+            response, _ = await self.call('PUT', f"{url}/{publication.comment_id}", headers, json={'body': body})
+            if response.status_code != 404:
+                response.raise_for_status()
+                if not comments:
+                    return publication.comment_id, set()
+                summary = publisher.new_issues_summary(pull_request, comments)
+                response, _ = await self.call(
+                    'POST', url, headers, json=publisher.github_review(pull_request, summary, comments)
+                )
+                if response.status_code == 422:
+                    logger.warning(f"GitHub rejected inline comments on PR #{pull_request.pr_number}")
+                    return publication.comment_id, set()
+                response.raise_for_status()
+                return publication.comment_id, {c.key for c in comments}
+            logger.info(f"Review {publication.comment_id} on PR #{pull_request.pr_number} is gone, resubmitting")
+
+        response, data = await self.call('POST', url, headers, json=publisher.github_review(pull_request, body, comments))
+        if response.status_code == 422 and comments:
+            # One comment off the diff fails the whole review
+            logger.warning(f"GitHub rejected inline comments on PR #{pull_request.pr_number}, submitting the summary alone")
+            comments = []
+            response, data = await self.call('POST', url, headers, json=publisher.github_review(pull_request, body, []))
+        response.raise_for_status()
+        return json.loads(data)['id'], {c.key for c in comments}
+
+    async def publish_bitbucket(self, target, pull_request, body, comments, publication):
+        """
+        Create or edit the PR's Bitbucket summary comment and post new inline
+        comments concurrently, like ``publisher.publish_bitbucket``
+
+        Returns:
+            tuple: (summary comment id, keys of the inline comments posted)
+        """
+        url = f"{target.api_url}/pullrequests/{pull_request.pr_number}/comments"
+        headers = target.headers()
+
+        comment_id = publication.comment_id if publication else None
+        if comment_id:
+            response, _ = await self.call('PUT', f"{url}/{comment_id}", headers, json={'content': {'raw': body}})
+            if response.status_code == 404:
+                logger.info(f"Comment {comment_id} on PR #{pull_request.pr_number} is gone, posting a new one")
+                comment_id = None
+            else:
+                response.raise_for_status()
+        if not comment_id:
+            response, data = await self.call('POST', url, headers, json={'content': {'raw': body}})
+            response.raise_for_status()
+            comment_id = json.loads(data)['id']
+
+        limit = asyncio.Semaphore(max(1, settings.REVIEW_PUBLISH_CONCURRENCY))
+
+        async def post_inline(comment):
+            data = {'content': {'raw': comment.body}, 'inline': {'path': comment.path, 'to': comment.line}}
+            try:
+                async with limit:
+                    response, _ = await self.call('POST', url, headers, json=data)
+                response.raise_for_status()
+            except (httpx.HTTPError, provider_budget.BudgetExhausted) as e:
+                logger.warning(f"Failed to post inline comment on {comment.path}:{comment.line}: {str(e)}")
+                return None
+            return comment.key
+
+        posted = await self.gather(*(post_inline(comment) for comment in comments))
+        return comment_id, {key for key in posted if key}
+
+    async def review_inputs(self, pull_request, paths=(), ref=None, with_fields=True):
+        """
+        The PR's fields, its diff and ``paths`` at ``ref``, fetched concurrently
+
+        ``ref`` defaults to the PR's head. Files a PR must not be able to
+        change for its own review, like .gitattributes, are read at the
+        target branch instead.
+
+        Returns:
+            ReviewInputs: Whose diff the caller closes
+        """
+        ref = ref or pull_request.head_sha
+        paths = list(paths) if ref else []
+        results = await asyncio.gather(
+            self.pull_request_fields(pull_request) if with_fields else none(),
+            self.pr_diff(pull_request),
+            *(self.file(pull_request, path, ref) for path in paths),
+            return_exceptions=True,
+        )
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            if isinstance(results[1], SpooledDiff):
+                results[1].close()
+            raise errors[0]
+        fields, diff, *contents = results
+        return ReviewInputs(fields, diff, dict(zip(paths, contents)))
+
+
+async def none():
+    return None
+
+
+def run(work, concurrency=None):
+    """
+    ``await work(client)`` with a new client, from synchronous code (Celery tasks)
+
+    For example ``run(lambda client: client.review_inputs(pull_request, ['.gitattributes'],
+    ref=pull_request.target_branch))``.
+    """
+    async def main():
+        async with AsyncProviderClient(concurrency) as client:
+            return await work(client)
+
+    return async_to_sync(main)()
@@ -0,0 +1,256 @@
+# apps/webhooks/batch_review.py
+"""
+Bulk (offline) reviews through the provider's Message Batches API
+
+Backfilling hundreds of PRs through the interactive path would eat the
+rate limit live reviews depend on. Backfills instead plan every PR the
+usual way (review cache, context packing, chunking) and submit all chunk
+prompts as message batches, which run on a separate, cheaper quota.
+``poll_batches`` runs periodically; once a batch has ended, its results
+are merged per PR and bulk-inserted as AIReview/ReviewIssue rows.
+
+Backfilled reviews are stored only; no PR comments are posted.
+"""
+import logging
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from apps.reviews.models import AIReview, PullRequest, ReviewIssue
+
+from . import llm, provider_budget, triage
+from .ai_analyzer import ReviewPlan, checked, finish_review, model_request, plan_review
+from .handler import build_review_issue, save_review, upsert_pull_request
+from .models import ReviewBatch, ReviewBatchItem
+from .response_parser import parse_ai_response
+from .ultis import fetch_pr_diff, list_pull_requests
+
+logger = logging.getLogger(__name__)
+
+
+def custom_id(item, index):
+    return f"item{item.pk}-{index}"
+
+
+def backfill_repository(repository, state='all', limit=None):
+    """
+    Submit batch reviews for a repository's pull requests that have none
+
+    Pull requests are listed from the provider and stored like webhook
+    events would store them. Provider calls are BACKGROUND priority.
+
+    Returns:
+        list: ReviewBatch rows submitted
+
+    Raises:
+        provider_budget.BudgetExhausted: Too little provider budget to list
+    """
+    with provider_budget.priority(provider_budget.BACKGROUND):
+        listed = list_pull_requests(repository, state=state, limit=limit)
+    pull_requests = [
+        upsert_pull_request(repository.provider, repository.full_name, number, fields)
+        for number, fields in listed
+    ]
+    unreviewed = [
+        pr for pr in pull_requests
+        if pr is not None and not AIReview.objects.filter(pull_request=pr).exists()
+        and not ReviewBatchItem.objects.filter(pull_request=pr, batch__status__in=['pending', 'submitted']).exists()
+    ]
+    logger.info(f"Backfill of {repository.full_name}: {len(listed)} PRs listed, {len(unreviewed)} to review")
+    with provider_budget.priority(provider_budget.BACKGROUND):
+        return submit_reviews(unreviewed)
+
+
+def submit_reviews(pull_requests):
+    """
+    Plan each PR's review and submit the prompts as message batches of
+    at most REVIEW_BATCH_MAX_REQUESTS requests
+
+    PRs with nothing left after triage are reviewed locally right away.
+    When the provider budget runs low, the PRs not planned yet are left
+    for the next backfill. Any other error marks the batch being planned
+    'failed', so its PRs are picked up by the next backfill too, and is
+    re-raised.
+
+    Returns:
+        list: ReviewBatch rows submitted
+    """
+    batches = []
+    batch, requests = None, []
+
+    try:
+        for index, pull_request in enumerate(pull_requests):
+            try:
+                diff_content = fetch_pr_diff(pull_request)
+                if not diff_content:
+                    logger.warning(f"No diff for PR #{pull_request.pr_number}, leaving it out of the backfill")
+                    continue
+
+                triaged = triage.triage_pull_request(pull_request, diff_content)
+            except provider_budget.BudgetExhausted as e:
+                logger.warning(f"{str(e)}; leaving {len(pull_requests) - index} PRs for the next backfill")
+                break
+            if triaged and triaged.skipped:
+                triage.record(pull_request.repository, triaged, completed_locally=not triaged.kept)
+                if not triaged.kept:
+                    save_review(pull_request, triage.local_analysis(triaged), pull_request.head_sha)
+                    continue
+                diff_content = triaged.diff
+
+            plan = plan_review({'title': pull_request.title, 'description': pull_request.description}, diff_content)
+            if batch and len(requests) + len(plan.prompts) > settings.REVIEW_BATCH_MAX_REQUESTS:
+                batches.append(submit_batch(batch, requests))
+                batch, requests = None, []
+            if batch is None:
+                batch = ReviewBatch.objects.create()
+
+            item = ReviewBatchItem.objects.create(
+                batch=batch,
+                pull_request=pull_request,
+                head_sha=pull_request.head_sha,
+                plan=plan.to_dict(),
+            )
+            requests += [
+                {'custom_id': custom_id(item, index), 'params': model_request(prompt)}
+                for index, prompt in enumerate(plan.prompts)
+            ]
+    except Exception as e:
+        # Never leave a half-planned batch 'pending': backfill would skip its PRs forever
+        if batch:
+            logger.error(f"Planning review batch {batch.pk} failed: {str(e)}")
+            batch.status = 'failed'
+            batch.last_error = str(e)
+            batch.save(update_fields=['status', 'last_error'])
+        raise
+
+    if batch:
+        batches.append(submit_batch(batch, requests))
+    return batches
+
+
+def submit_batch(batch, requests):
+    """Send one batch to the provider; the row records the outcome"""
+    batch.request_count = len(requests)
+    if not requests:
+        # Every file was in the review cache: nothing to wait for
+        batch.status = 'submitted'
+        batch.save(update_fields=['request_count', 'status'])
+        import_batch(batch, {})
+        return batch
+
+    try:
+        created = llm.get_client().messages.batches.create(requests=requests)
+    except Exception as e:
+        logger.error(f"Submitting review batch {batch.pk} failed: {str(e)}")
+        batch.status = 'failed'
+        batch.last_error = str(e)
+        batch.save(update_fields=['request_count', 'status', 'last_error'])
+        return batch
+
+    batch.batch_id = created.id
+    batch.status = 'submitted'
+    batch.submitted_at = timezone.now()
+    batch.save(update_fields=['request_count', 'batch_id', 'status', 'submitted_at'])
+    logger.info(f"Submitted review batch {created.id} with {len(requests)} requests")
+    return batch
+
+
+def poll_batches():
+    """
+    Import every submitted batch the provider reports as ended
+
+    Returns:
+        int: Number of batches imported
+    """
+    client = llm.get_client()
+    imported = 0
+
+    for batch in ReviewBatch.objects.filter(status='submitted').exclude(batch_id=''):
+        try:
+            status = client.messages.batches.retrieve(batch.batch_id)
+            if status.processing_status != 'ended':
+                continue
+            results = {entry.custom_id: entry_analysis(entry) for entry in client.messages.batches.results(batch.batch_id)}
+        except Exception as e:
+            # Transient provider errors: try again on the next poll
+            logger.error(f"Polling review batch {batch.batch_id} failed: {str(e)}")
+            continue
+
+        import_batch(batch, results)
+        imported += 1
+    return imported
+
+
+def entry_analysis(entry):
+    """Parsed analysis of one batch result line, or None if the request did not succeed"""
+    if entry.result.type != 'succeeded':
+        logger.warning(f"Batch request {entry.custom_id} {entry.result.type}")
+        return None
+    message = entry.result.message
+    llm.usage.record(message.usage)
+    text = ''.join(block.text for block in message.content if block.type == 'text')
+    return checked(parse_ai_response(text))
+
+
+def import_batch(batch, results):
+    """
+    Merge a batch's results per PR and bulk-insert the reviews
+
+    PRs whose requests all failed, or that were reviewed some other way
+    since submission, are left as they are.
+
+    Args:
+        batch: Submitted ReviewBatch
+        results: custom_id -> parsed analysis or None
+    """
+    items = list(batch.items.select_related('pull_request'))
+    already_reviewed = set(
+        AIReview.objects.filter(pull_request__in=[item.pull_request for item in items])
+        .values_list('pull_request_id', flat=True)
+    )
+
+    analyses = []
+    for item in items:
+        plan = ReviewPlan.from_dict(item.plan)
+        item_results = [results.get(custom_id(item, index)) for index in range(len(plan.chunk_paths))]
+        if item.pull_request_id in already_reviewed:
+            continue
+        if item_results and not any(item_results):
+            continue
+        analyses.append((item, finish_review(plan, item_results)))
+
+    with transaction.atomic():
+        reviews = AIReview.objects.bulk_create([
+            AIReview(
+                pull_request=item.pull_request,
+                risk_score=analysis.get('riskScore', 50),
+                summary=analysis.get('summary', ''),
+                deployment_ready=bool(analysis.get('deploymentReady', False)),
+                analysis_data=analysis,
+                status='complete',
+            )
+            for item, analysis in analyses
+        ])
+        ReviewIssue.objects.bulk_create([
+            build_review_issue(review, issue)
+            for review, (_, analysis) in zip(reviews, analyses)
+            for issue in analysis.get('issues', [])
+            if isinstance(issue, dict)
+        ], batch_size=500)
+
+        # A complete review of the current head is a base for incremental reviews
+        by_head = defaultdict(list)
+        for item, analysis in analyses:
+            if not analysis.get('incomplete') and item.head_sha:
+                by_head[item.head_sha].append(item.pull_request_id)
+        for head_sha, ids in by_head.items():
+            PullRequest.objects.filter(pk__in=ids, head_sha=head_sha).update(reviewed_head_sha=head_sha)
+
+        batch.status = 'imported'
+        batch.ended_at = timezone.now()
+        batch.save(update_fields=['status', 'ended_at'])
+
+    logger.info(f"Imported review batch {batch.batch_id or batch.pk}: {len(reviews)} of {len(items)} PRs reviewed")
+    return reviews
@@ -0,0 +1,43 @@
+# apps/webhooks/checks.py
+"""
+System checks for the webhooks app
+"""
+from django.conf import settings
+from django.core.checks import Warning
+
+# Cache backends whose data each process keeps to itself
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+# (cache alias setting, whether the settings use it); the alias must be
+# shared by every process for the limits, totals and entries it holds to
+# cover all of them
+SHARED_CACHE_SETTINGS = [
+    ('AI_RATE_LIMIT_CACHE', lambda s: s.AI_RATE_LIMIT),
+    ('PROVIDER_BUDGET_CACHE', lambda s: s.PROVIDER_BUDGET),
+    ('STATS_CACHE', lambda s: True),
+    ('REVIEW_CACHE_ALIAS', lambda s: s.REVIEW_CACHE_BACKEND == 'cache'),
+]
+
+
+def check_shared_caches(app_configs, **kwargs):
+    """Warn when a cache that must be shared across processes is process-local"""
+    if settings.DEBUG:
+        # A development server is a single process
+        return []
+    warnings = []
+    for alias_setting, in_use in SHARED_CACHE_SETTINGS:
+        if not in_use(settings):
+            continue
+        alias = getattr(settings, alias_setting)
+        backend = settings.CACHES.get(alias, {}).get('BACKEND', '')
+        if backend in PROCESS_LOCAL_BACKENDS:
+            warnings.append(Warning(
+                f"{alias_setting} uses the process-local '{alias}' cache ({backend.rsplit('.', 1)[-1]})",
+                hint="Each process then keeps its own copy. Set SHARED_CACHE_URL to a Redis URL, "
+                     "or point the setting at a cache shared by every process.",
+                id='webhooks.W001',
+            ))
+    return warnings
@@ -0,0 +1,51 @@
+# apps/webhooks/counters.py
+"""
+Monitoring counters shared by every process
+
+Web and worker processes each count what they do (deduplicated
+deliveries, model cache tokens), but the stats endpoint is served by
+whichever web process gets the request. Counters are therefore kept in
+a Django cache (STATS_CACHE, the 'shared' alias by default) with atomic
+``incr``, so every process adds to and reads the same totals.
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+
+class SharedCounters:
+    """Named integer counters under one cache prefix"""
+
+    def __init__(self, name, fields):
+        self.prefix = f'stats:{name}:'
+        self.fields = tuple(fields)
+
+    @property
+    def cache(self):
+        return caches[settings.STATS_CACHE]
+
+    def add(self, **deltas):
+        """Add to counters, e.g. ``add(misses=1)``; a cache failure only loses the count"""
+        for field, delta in deltas.items():
+            if not delta:
+                continue
+            key = self.prefix + field
+            try:
+                self.cache.add(key, 0, timeout=None)
+                self.cache.incr(key, delta)
+            except ValueError:
+                # Evicted between add and incr
+                self.cache.add(key, delta, timeout=None)
+            except Exception as e:
+                logger.warning(f"Could not update counter {key}: {str(e)}")
+
+    def values(self):
+        """{field: total} over every process"""
+        stored = self.cache.get_many([self.prefix + field for field in self.fields])
+        return {field: int(stored.get(self.prefix + field, 0)) for field in self.fields}
+
+    def reset(self):
+        self.cache.delete_many([self.prefix + field for field in self.fields])
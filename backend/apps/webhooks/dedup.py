@@ -0,0 +1,102 @@
+# apps/webhooks/dedup.py
+"""
+Delivery-ID deduplication for webhook ingestion
+
+Providers redeliver webhooks on timeouts and retries. Each delivery is
+keyed on ``X-GitHub-Delivery`` / ``X-Request-UUID``; a bounded in-process
+LRU answers repeat deliveries without touching the database, and the
+partial unique index on ``WebhookDelivery(provider, delivery_id)`` catches
+the ones this process has not seen. Hit and miss counts are summed over
+every process (counters.py).
+"""
+import logging
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .counters import SharedCounters
+
+logger = logging.getLogger(__name__)
+
+
+class DeliveryDeduplicator:
+    """Bounded LRU of recently seen delivery ids with hit/miss counters"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = SharedCounters('dedup', ('lru_hits', 'db_hits', 'misses'))
+
+    def seen(self, key):
+        """Return True (and count an LRU hit) if ``key`` is in the LRU"""
+        with self._lock:
+            if key in self._seen:
+                self._seen.move_to_end(key)
+            else:
+                return False
+        self.counters.add(lru_hits=1)
+        return True
+
+    def remember(self, key):
+        """Add ``key`` to the LRU, evicting the least recently seen entry"""
+        with self._lock:
+            self._seen[key] = True
+            self._seen.move_to_end(key)
+            while len(self._seen) > self.max_size:
+                self._seen.popitem(last=False)
+
+    def insert_once(self, key, create):
+        """
+        Run ``create`` unless ``key`` was already ingested
+
+        Args:
+            key: (provider, delivery_id) tuple
+            create: Callable performing the unique-indexed insert
+
+        Returns:
+            The result of ``create``, or None for a duplicate
+        """
+        if self.seen(key):
+            return None
+
+        try:
+            with transaction.atomic():
+                result = create()
+        except IntegrityError:
+            self.counters.add(db_hits=1)
+            self.remember(key)
+            return None
+
+        self.counters.add(misses=1)
+        self.remember(key)
+        return result
+
+    def stats(self):
+        """
+        Counters for monitoring how much work deduplication saves; hits and
+        misses are totals over every process, the LRU is this process's
+        """
+        counts = self.counters.values()
+        duplicates = counts['lru_hits'] + counts['db_hits']
+        total = duplicates + counts['misses']
+        with self._lock:
+            lru_size = len(self._seen)
+        return dict(
+            counts,
+            duplicates_dropped=duplicates,
+            duplicate_ratio=round(duplicates / total, 4) if total else 0.0,
+            lru_size=lru_size,
+            lru_max_size=self.max_size,
+        )
+
+    def reset(self):
+        """Clear the LRU and counters"""
+        with self._lock:
+            self._seen.clear()
+        self.counters.reset()
+
+
+deduplicator = DeliveryDeduplicator(settings.WEBHOOK_DEDUP_LRU_SIZE)
@@ -0,0 +1,160 @@
+# apps/webhooks/diff_stream.py
+"""
+Streamed PR diffs with a size cap
+
+Vendored or generated PRs can have diffs of hundreds of megabytes, and
+``response.text`` held all of it (plus its decoded copy) in the worker.
+Diffs are now read in chunks into a SpooledDiff: in memory up to
+REVIEW_DIFF_SPILL_BYTES, then in a temporary file read back through
+``mmap``, so the pages stay in the page cache instead of the heap.
+Reading stops at REVIEW_DIFF_MAX_BYTES; the diff is then ``truncated``
+and only the files that arrived whole are used.
+
+``files()`` parses the diff one ``diff --git`` section at a time, so
+callers that drop most files (triage) never hold the whole diff.
+"""
+import logging
+import mmap
+import tempfile
+
+from django.conf import settings
+
+from .diffs import iter_file_diffs
+
+logger = logging.getLogger(__name__)
+
+FILE_HEADER = b'diff --git '
+
+
+class SpooledDiff:
+    """Diff bytes read in chunks, spilled to a memory-mapped temp file past a threshold"""
+
+    def __init__(self, max_bytes=None, spill_bytes=None):
+        self.max_bytes = settings.REVIEW_DIFF_MAX_BYTES if max_bytes is None else max_bytes
+        self.spill_bytes = settings.REVIEW_DIFF_SPILL_BYTES if spill_bytes is None else spill_bytes
+        self.size = 0
+        self.truncated = False
+        self.buffer = bytearray()
+        self.file = None
+        self.map = None
+
+    @classmethod
+    def from_text(cls, text, **kwargs):
+        diff = cls(**kwargs)
+        diff.write(text.encode())
+        return diff
+
+    @property
+    def spilled(self):
+        return self.file is not None
+
+    def write(self, chunk):
+        """
+        Append a chunk of the diff
+
+        Returns:
+            bool: False once the size cap is reached; stop reading then
+        """
+        if self.max_bytes and self.size + len(chunk) > self.max_bytes:
+            chunk = chunk[:self.max_bytes - self.size]
+            self.truncated = True
+        self.size += len(chunk)
+
+        if self.file is None and self.size > self.spill_bytes:
+            self.file = tempfile.TemporaryFile(prefix='pitcrew-diff-')
+            self.file.write(self.buffer)
+            self.buffer = bytearray()
+        if self.file is not None:
+            self.file.write(chunk)
+        else:
+            self.buffer += chunk
+        return not self.truncated
+
+    def view(self):
+        """The bytes read so far: the in-memory buffer or a read-only mmap of the spill file"""
+        if self.file is None:
+            return self.buffer
+        if self.map is None:
+            self.file.flush()
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.map
+
+    def file_texts(self):
+        """
+        Yield the text of each file section, one at a time
+
+        The last section of a truncated diff is incomplete and left out.
+        """
+        view = self.view()
+        if view[:len(FILE_HEADER)] == FILE_HEADER:
+            start = 0
+        else:
+            start = view.find(b'\n' + FILE_HEADER) + 1
+            if not start:
+                return
+        while True:
+            end = view.find(b'\n' + FILE_HEADER, start)
+            if end < 0:
+                break
+            yield view[start:end + 1].decode('utf-8', errors='replace')
+            start = end + 1
+        if not self.truncated:
+            yield view[start:self.size].decode('utf-8', errors='replace')
+
+    def files(self):
+        """Yield one FileDiff per file section, parsed as it is reached"""
+        for text in self.file_texts():
+            yield from iter_file_diffs(text.splitlines())
+
+    def text(self):
+        """The whole diff as text (complete files only when truncated)"""
+        if self.truncated:
+            return ''.join(self.file_texts())
+        return self.view()[:self.size].decode('utf-8', errors='replace')
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.buffer = bytearray()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_chunks(chunks, source):
+    """
+    Read an iterable of byte chunks into a SpooledDiff, stopping at REVIEW_DIFF_MAX_BYTES
+
+    Args:
+        chunks: Byte chunks of the diff
+        source: What the diff comes from, for the log
+    """
+    diff = SpooledDiff()
+    try:
+        for chunk in chunks:
+            if not diff.write(chunk):
+                logger.warning(f"Diff from {source} exceeds {diff.max_bytes} bytes, truncating")
+                break
+    except Exception:
+        diff.close()
+        raise
+    return diff
+
+
+def read_response(response, chunk_size=64 * 1024):
+    """
+    Stream a ``requests`` response (made with ``stream=True``) into a SpooledDiff
+
+    Stops reading, and closes the response, at REVIEW_DIFF_MAX_BYTES.
+    """
+    try:
+        return read_chunks(response.iter_content(chunk_size=chunk_size), response.url)
+    finally:
+        response.close()
@@ -0,0 +1,209 @@
+# apps/webhooks/diffs.py
+"""
+Unified diff parsing and chunking
+
+Splits a PR diff into per-file records and hunks, and packs them into
+chunks that fit a model token budget.
+"""
+import re
+from dataclasses import dataclass, field
+
+HUNK_HEADER = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+DIFF_HEADER = re.compile(r'^diff --git a/(.*?) b/(.*)$')
+
+# Rough chars-per-token ratio for code; good enough for budgeting
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    """Cheap token estimate for budgeting prompt size"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+@dataclass
+class Hunk:
+    header: str
+    old_start: int
+    old_count: int
+    new_start: int
+    new_count: int
+    lines: list = field(default_factory=list)
+
+    @property
+    def text(self):
+        return '\n'.join([self.header] + self.lines)
+
+
+@dataclass
+class FileDiff:
+    path: str
+    old_path: str
+    header_lines: list = field(default_factory=list)
+    hunks: list = field(default_factory=list)
+    is_binary: bool = False
+
+    @property
+    def header(self):
+        return '\n'.join(self.header_lines)
+
+    @property
+    def text(self):
+        return '\n'.join(self.header_lines + [hunk.text for hunk in self.hunks])
+
+    @property
+    def is_deleted(self):
+        return any(
+            line.startswith('deleted file mode') or line == '+++ /dev/null'
+            for line in self.header_lines
+        )
+
+    @property
+    def additions(self):
+        return sum(1 for h in self.hunks for line in h.lines if line.startswith('+'))
+
+    @property
+    def deletions(self):
+        return sum(1 for h in self.hunks for line in h.lines if line.startswith('-'))
+
+
+def parse_diff(diff_text):
+    """
+    Parse a unified git diff into FileDiff records
+
+    Args:
+        diff_text: Output of ``git diff`` / the provider diff endpoint
+
+    Returns:
+        list: FileDiff instances in diff order
+    """
+    return list(iter_file_diffs(diff_text.splitlines()))
+
+
+def iter_file_diffs(lines):
+    """Incrementally parse an iterable of diff lines, yielding one FileDiff per file"""
+    current = None
+    hunk = None
+
+    for line in lines:
+        match = DIFF_HEADER.match(line)
+        if match:
+            if current is not None:
+                yield current
+            current = FileDiff(path=match.group(2), old_path=match.group(1), header_lines=[line])
+            hunk = None
+            continue
+
+        if current is None:
+            continue
+
+        hunk_match = HUNK_HEADER.match(line)
+        if hunk_match:
+            old_start, old_count, new_start, new_count = hunk_match.groups()
+            hunk = Hunk(
+                header=line,
+                old_start=int(old_start),
+                old_count=int(old_count) if old_count is not None else 1,
+                new_start=int(new_start),
+                new_count=int(new_count) if new_count is not None else 1,
+            )
+            current.hunks.append(hunk)
+        elif hunk is not None:
+            hunk.lines.append(line)
+        else:
+            current.header_lines.append(line)
+            if line.startswith('Binary files') or line.startswith('GIT binary patch'):
+                current.is_binary = True
+            elif line.startswith('+++ ') and line[4:] != '/dev/null':
+                current.path = line[4:].removeprefix('b/')
+
+    if current is not None:
+        yield current
+
+
+@dataclass
+class DiffChunk:
+    text: str
+    paths: list = field(default_factory=list)
+
+
+def chunk_diff(files, token_budget):
+    """
+    Pack file diffs into chunks of at most ``token_budget`` estimated tokens
+
+    Whole files are kept together where they fit; larger files are split
+    on hunk boundaries (repeating the file header), and a single oversized
+    hunk is split on line boundaries.
+
+    Returns:
+        list: DiffChunk instances in diff order
+    """
+    chunks = []
+    current = []
+    paths = []
+    current_tokens = 0
+
+    def flush():
+        nonlocal current, paths, current_tokens
+        if current:
+            chunks.append(DiffChunk(text='\n'.join(current), paths=paths))
+        current = []
+        paths = []
+        current_tokens = 0
+
+    for path, piece in _pieces(files, token_budget):
+        tokens = estimate_tokens(piece)
+        if current_tokens + tokens > token_budget:
+            flush()
+        current.append(piece)
+        if path not in paths:
+            paths.append(path)
+        current_tokens += tokens
+
+    flush()
+    return chunks
+
+
+def _pieces(files, token_budget):
+    """Yield (path, text) pairs of file- or hunk-sized diff texts within ``token_budget``"""
+    for file_diff in files:
+        path = file_diff.path
+        text = file_diff.text
+        if estimate_tokens(text) <= token_budget:
+            yield path, text
+            continue
+
+        header = file_diff.header
+        for hunk in file_diff.hunks:
+            piece = f"{header}\n{hunk.text}"
+            if estimate_tokens(piece) <= token_budget:
+                yield path, piece
+                continue
+
+            # Oversized hunk: split its lines, repeating file + hunk headers
+            prefix = f"{header}\n{hunk.header}"
+            room = max(1, token_budget - estimate_tokens(prefix)) * CHARS_PER_TOKEN
+            part = []
+            size = 0
+            for line in split_long_lines(hunk.lines, room):
+                if part and size + len(line) + 1 > room:
+                    yield path, '\n'.join([prefix] + part)
+                    part = []
+                    size = 0
+                part.append(line)
+                size += len(line) + 1
+            if part:
+                yield path, '\n'.join([prefix] + part)
+
+
+def split_long_lines(lines, width):
+    """
+    Hunk lines with any line over ``width`` characters split into
+    consecutive lines carrying the same +/-/space marker, so no code is cut
+    """
+    for line in lines:
+        if len(line) <= width:
+            yield line
+            continue
+        marker, body = line[:1], line[1:]
+        for start in range(0, len(body), width - 1):
+            yield marker + body[start:start + width - 1]
@@ -0,0 +1,260 @@
+# apps/webhooks/git_mirror.py
+"""
+Local bare-mirror git cache
+
+With GIT_MIRRORS on, each Repository gets a bare mirror under
+GIT_MIRROR_ROOT, brought up to date with an incremental ``git fetch``
+before use. PR diffs, interdiffs and file contents are then computed with
+local git instead of the provider's REST API, which is slow for large PRs
+and limited to three lines of context (GIT_MIRROR_CONTEXT_LINES sets it
+here).
+
+Mirrors are evicted least recently used first once together they take
+more than GIT_MIRROR_QUOTA_BYTES on disk. Failures raise GitError, and
+callers fall back to the API.
+
+The access token is passed to git as an HTTP header through
+``GIT_CONFIG_*`` environment variables: it never lands in the mirror's
+config or in a process's argument list.
+"""
+import base64
+import fcntl
+import logging
+import os
+import shutil
+import subprocess
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Sum
+from django.utils import timezone
+
+from .diff_stream import read_chunks
+from .models import GitMirror
+
+logger = logging.getLogger(__name__)
+
+GIT_USERS = {'github': 'x-access-token', 'bitbucket': 'x-token-auth'}
+GIT_URLS = {'github': 'GITHUB_GIT_URL', 'bitbucket': 'BITBUCKET_GIT_URL'}
+READ_CHUNK = 64 * 1024
+
+
+class GitError(Exception):
+    pass
+
+
+def mirror_path(repository):
+    return Path(settings.GIT_MIRROR_ROOT) / f"{repository.pk}.git"
+
+
+def remote_url(repository):
+    return f"{getattr(settings, GIT_URLS[repository.provider]).rstrip('/')}/{repository.full_name}.git"
+
+
+def git_env(repository, access_token):
+    """Environment for git: no prompts, and the token as an HTTP Authorization header"""
+    env = dict(os.environ, GIT_TERMINAL_PROMPT='0')
+    if access_token:
+        credentials = base64.b64encode(f"{GIT_USERS[repository.provider]}:{access_token}".encode()).decode()
+        env.update(
+            GIT_CONFIG_COUNT='1',
+            GIT_CONFIG_KEY_0='http.extraHeader',
+            GIT_CONFIG_VALUE_0=f"Authorization: Basic {credentials}",
+        )
+    return env
+
+
+def git(path, *args, env=None):
+    """Run git in ``path``; returns stdout bytes"""
+    result = subprocess.run(
+        ['git', '-C', str(path), *args],
+        capture_output=True,
+        env=env,
+        timeout=settings.GIT_MIRROR_TIMEOUT,
+    )
+    if result.returncode != 0:
+        raise GitError(f"git {args[0]} failed: {result.stderr.decode(errors='replace').strip()}")
+    return result.stdout
+
+
+def has_commit(path, sha):
+    if not sha:
+        return False
+    result = subprocess.run(['git', '-C', str(path), 'cat-file', '-e', f"{sha}^{{commit}}"],
+                            capture_output=True, timeout=settings.GIT_MIRROR_TIMEOUT)
+    return result.returncode == 0
+
+
+@contextmanager
+def locked(path, blocking=True):
+    """Exclusive lock on a mirror across worker processes; yields False if not blocking and busy"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(f"{path}.lock", 'w') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def disk_usage(path):
+    return sum(f.stat().st_size for f in path.rglob('*') if f.is_file())
+
+
+def update_mirror(pull_request, access_token, want=(), refresh=False):
+    """
+    Create or fetch the repository's mirror so it has the PR's commits
+
+    Args:
+        want: Commit SHAs needed; unless ``refresh``, no fetch is made
+            when all are present
+        refresh: Fetch anyway (branches may have moved)
+
+    Returns:
+        Path: The mirror
+    """
+    repository = pull_request.repository
+    path = mirror_path(repository)
+    with locked(path):
+        created = not path.exists()
+        if created:
+            git(path.parent, 'init', '--bare', '--quiet', path.name)
+            git(path, 'config', 'gc.auto', '0')
+            logger.info(f"Created git mirror of {repository.full_name}")
+
+        if refresh or not all(has_commit(path, sha) for sha in want):
+            try:
+                fetch(pull_request, access_token, path, want)
+            except Exception:
+                if created:
+                    # A mirror that never fetched would sit outside the quota
+                    shutil.rmtree(path, ignore_errors=True)
+                raise
+            mirror, _ = GitMirror.objects.get_or_create(repository=repository)
+            mirror.size_bytes = disk_usage(path)
+            mirror.fetched_at = timezone.now()
+            mirror.save()
+        else:
+            GitMirror.objects.update_or_create(repository=repository, defaults={})
+
+    evict(keep=repository.pk)
+    return path
+
+
+def fetch(pull_request, access_token, path, want=()):
+    """Fetch every branch, and on GitHub the PR ref if a wanted commit is still missing"""
+    repository = pull_request.repository
+    env = git_env(repository, access_token)
+    # Set on every fetch: the repository may have been renamed
+    git(path, 'config', 'remote.origin.url', remote_url(repository))
+    git(path, 'fetch', '--quiet', '--prune', 'origin', '+refs/heads/*:refs/heads/*', env=env)
+    if repository.provider == 'github' and not all(has_commit(path, sha) for sha in want):
+        # Fork PRs: the head commit is only reachable from the PR ref
+        ref = f"refs/pull/{pull_request.pr_number}/head"
+        git(path, 'fetch', '--quiet', 'origin', f"+{ref}:{ref}", env=env)
+
+
+def evict(keep=None):
+    """Delete least recently used mirrors while their total size exceeds GIT_MIRROR_QUOTA_BYTES"""
+    excess = (GitMirror.objects.aggregate(total=Sum('size_bytes'))['total'] or 0) - settings.GIT_MIRROR_QUOTA_BYTES
+    if excess <= 0:
+        return
+    for mirror in GitMirror.objects.exclude(repository_id=keep).select_related('repository').order_by('last_used_at'):
+        path = mirror_path(mirror.repository)
+        with locked(path, blocking=False) as acquired:
+            if not acquired:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            mirror.delete()
+        logger.info(f"Evicted git mirror of {mirror.repository.full_name} ({mirror.size_bytes} bytes)")
+        excess -= mirror.size_bytes
+        if excess <= 0:
+            break
+
+
+def stream_diff(path, *args):
+    """Run ``git diff`` and read its output into a SpooledDiff (capped like API diffs)"""
+    process = subprocess.Popen(
+        ['git', '-C', str(path), 'diff', '--no-color', '--no-ext-diff', f"-U{settings.GIT_MIRROR_CONTEXT_LINES}",
+         *args],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    try:
+        diff = read_chunks(iter(lambda: process.stdout.read(READ_CHUNK), b''), f"git diff {' '.join(args)}")
+        if diff.truncated:
+            process.kill()
+        returncode = process.wait(timeout=settings.GIT_MIRROR_TIMEOUT)
+        if returncode != 0 and not diff.truncated:
+            diff.close()
+            raise GitError(f"git diff failed: {process.stderr.read().decode(errors='replace').strip()}")
+        return diff
+    finally:
+        process.stdout.close()
+        process.stderr.close()
+        if process.poll() is None:
+            process.kill()
+
+
+@contextmanager
+def git_errors(action):
+    """Raise failures of ``action`` as GitError, for callers to fall back to the API"""
+    try:
+        yield
+    except (GitError, OSError, subprocess.SubprocessError) as e:
+        raise GitError(f"{action}: {str(e)}") from e
+
+
+def pr_diff(pull_request, access_token):
+    """
+    PR diff from the mirror: the head against its merge base with the target branch
+
+    Returns:
+        SpooledDiff: The diff, to be closed by the caller
+
+    Raises:
+        GitError: git failed
+    """
+    with git_errors(f"Mirror diff of {pull_request.repository.full_name}#{pull_request.pr_number}"):
+        head = pull_request.head_sha
+        path = update_mirror(pull_request, access_token, want=(head,) if head else (), refresh=True)
+        if not has_commit(path, head):
+            head = f"refs/heads/{pull_request.source_branch}"
+        return stream_diff(path, f"refs/heads/{pull_request.target_branch}...{head}")
+
+
+def compare_diff(pull_request, access_token, base_sha, head_sha):
+    """
+    Diff between two commits from the mirror, like the provider's compare
+
+    Returns:
+        SpooledDiff: The diff, to be closed by the caller
+
+    Raises:
+        GitError: git failed
+    """
+    with git_errors(f"Mirror compare {base_sha[:7]}..{head_sha[:7]}"):
+        path = update_mirror(pull_request, access_token, want=(base_sha, head_sha))
+        return stream_diff(path, f"{base_sha}...{head_sha}")
+
+
+def file_content(pull_request, access_token, path_in_repo, ref):
+    """
+    One file at a commit from the mirror
+
+    Returns:
+        str: File content, or None if the file does not exist at ``ref``
+
+    Raises:
+        GitError: git failed
+    """
+    with git_errors(f"Mirror read of {path_in_repo} at {ref[:7]}"):
+        path = update_mirror(pull_request, access_token, want=(ref,))
+        if not git(path, 'ls-tree', ref, '--', path_in_repo):
+            return None
+        return git(path, 'show', f"{ref}:{path_in_repo}").decode('utf-8', errors='replace')
@@ -1,10 +1,388 @@
 # Backend/webhooks/handlers.py
-from django.http import JsonResponse
-from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_http_methods
-import json
+"""
+Webhook event handlers
+
+Runs on Celery workers (see tasks.py), never inside the webhook request.
+"""
+import logging
+
+from django.conf import settings
+from django.db import transaction
+
 from apps.repos.models import Repository  # CHANGED from backend.repos.models
 from apps.reviews.models import PullRequest, AIReview, ReviewIssue  # CHANGED from backend.reviews.models
+from . import async_provider, payloads, static_checks, triage
 from .ai_analyzer import analyze_pr_with_ai
+from .diffs import iter_file_diffs
+from .interdiff import carry_forward, restrict_to_paths
+from .publisher import commentable_lines, publish_review
+from .scheduler import ensure_current, schedule_review
+from .ultis import fetch_compare_diff
+
+logger = logging.getLogger(__name__)
+
+
+def process_delivery(delivery):
+    """
+    Process one inbox delivery
+
+    Args:
+        delivery: WebhookDelivery model instance
+    """
+    body = bytes(delivery.payload)
+
+    try:
+        if delivery.provider == 'github':
+            if delivery.event != 'pull_request':
+                logger.info(f"Ignoring GitHub event: {delivery.event}")
+                return
+            event = payloads.decode_github_pull_request(body)
+        elif delivery.provider == 'bitbucket':
+            if not delivery.event.startswith('pullrequest:'):
+                logger.info(f"Ignoring Bitbucket event: {delivery.event}")
+                return
+            event = payloads.decode_bitbucket_pull_request(delivery.event, body)
+        else:
+            logger.error(f"Unknown provider: {delivery.provider}")
+            return
+    except payloads.DECODE_ERRORS as e:
+        # Retrying cannot fix a malformed payload; the raw body stays in the inbox
+        logger.error(f"Malformed {delivery.provider} payload in delivery {delivery.pk}: {str(e)}")
+        return
+
+    handle_pull_request_event(event)
+
+
+def handle_pull_request_event(event):
+    """Store a decoded PR event and schedule its review when needed"""
+    pull_request = upsert_pull_request(event.provider, event.full_name, event.pr_number, event.fields)
+    if pull_request and event.should_review:
+        schedule_review(pull_request, event.fields['head_sha'])
+
+
+def upsert_pull_request(provider, full_name, pr_number, fields):
+    """
+    Create or update the PullRequest row for a webhook event
+
+    Returns:
+        PullRequest: The stored pull request, or None if the repository is not tracked
+    """
+    if not full_name or pr_number is None:
+        logger.warning(f"Malformed {provider} pull request payload")
+        return None
+
+    repository = Repository.objects.filter(
+        provider=provider,
+        full_name=full_name,
+        is_active=True
+    ).first()
+
+    if not repository:
+        logger.info(f"Ignoring webhook for untracked repository {provider}/{full_name}")
+        return None
+
+    pull_request, _ = PullRequest.objects.update_or_create(
+        repository=repository,
+        pr_number=pr_number,
+        defaults=fields
+    )
+    return pull_request
+
+
+def review_pull_request(pull_request, generation=None):
+    """
+    Fetch the diff, run the AI analysis and publish the review
+
+    When the PR was reviewed before at another head, only the interdiff
+    since that head is analyzed and the earlier issues are carried forward
+    (see interdiff.py). Lockfiles, generated code, docs and the like are
+    triaged out first; if nothing else changed, the review is completed
+    without a model call (see triage.py). While the model runs the AIReview
+    is ``running`` and each streamed issue is stored as a provisional
+    ReviewIssue.
+
+    Args:
+        pull_request: PullRequest model instance
+        generation: ScheduledReview generation being run; when given, the
+            review raises ReviewSuperseded as soon as a newer head arrives
+
+    Returns:
+        AIReview: The stored review, or None if the diff could not be fetched
+    """
+    inputs = fetch_review_inputs(pull_request)
+    diff = inputs.diff
+    if diff is None or not diff.size:
+        logger.warning(f"No diff for PR #{pull_request.pr_number}, skipping review")
+        return None
+
+    with diff:
+        if generation is not None:
+            ensure_current(pull_request.pk, generation)
+
+        pr_data = {
+            'title': pull_request.title,
+            'description': pull_request.description,
+        }
+        head_sha = pull_request.head_sha
+        previous = incremental_base(pull_request)
+        interdiff_files = None
+
+        # A truncated diff does not list every file the interdiff must be limited to
+        if previous and not diff.truncated:
+            base_sha = pull_request.reviewed_head_sha
+            interdiff_files = fetch_interdiff(pull_request, base_sha, head_sha, diff)
+            if interdiff_files == []:
+                logger.info(f"No changes to PR #{pull_request.pr_number} since {base_sha[:7]}, keeping review")
+                return previous
+            if interdiff_files:
+                pr_data['since'] = base_sha
+
+        # Files are parsed one at a time; only the ones kept for review are held
+        triaged = triage.triage_pull_request(
+            pull_request, interdiff_files or diff.files(), gitattributes=inputs.files.get('.gitattributes') or ''
+        )
+        if triaged:
+            diff_content = triaged.diff
+        elif interdiff_files:
+            diff_content = '\n'.join(f.text for f in interdiff_files) + '\n'
+        else:
+            diff_content = diff.text()
+        truncated = diff.truncated
+
+    if triaged and triaged.skipped:
+        triage.record(pull_request.repository, triaged, completed_locally=not triaged.kept)
+
+    if triaged and not triaged.kept:
+        logger.info(f"PR #{pull_request.pr_number} has no reviewable changes, completing review locally")
+        analysis = triage.local_analysis(triaged)
+    else:
+        review, created = start_review(pull_request)
+        try:
+            analysis = analyze_pr_with_ai(
+                pr_data, diff_content, on_issue=lambda issue: save_provisional_issue(review, issue)
+            )
+
+            if generation is not None:
+                ensure_current(pull_request.pk, generation)
+        except Exception:
+            abandon_review(review, created)
+            raise
+        if triaged and triaged.skipped:
+            analysis['triaged'] = [path for path, _, _, _ in triaged.skipped]
+            analysis = static_checks.merge_findings(analysis, triaged.findings)
+
+    if interdiff_files:
+        analysis = carry_forward(previous, analysis, interdiff_files, base_sha, head_sha)
+    if truncated:
+        mark_truncated(analysis)
+
+    # An incomplete analysis cannot serve as the base of the next interdiff
+    reviewed_head_sha = '' if analysis.get('incomplete') else head_sha
+    review = save_review(pull_request, analysis, reviewed_head_sha)
+    commentable = commentable_lines(iter_file_diffs(diff_content.splitlines()))
+    publish_review(pull_request, review, format_review_comment(review), commentable)
+    return review
+
+
+def fetch_review_inputs(pull_request):
+    """
+    The PR's diff and, when triage is on, the .gitattributes of its target
+    branch, fetched concurrently by an async provider client rather than
+    one after the other
+
+    Returns:
+        async_provider.ReviewInputs: Whose diff the caller closes
+    """
+    base = pull_request.target_branch
+    paths = ['.gitattributes'] if base and triage.skip_categories() else []
+    return async_provider.run(
+        lambda client: client.review_inputs(pull_request, paths, ref=base, with_fields=False)
+    )
+
+
+def start_review(pull_request):
+    """
+    Mark the PR's AIReview as running, creating an empty one if needed
+
+    Provisional issues left by an abandoned run are cleared; the issues of
+    the last completed review stay until this run is saved.
+
+    Returns:
+        tuple: (AIReview, whether this run created it)
+    """
+    with transaction.atomic():
+        review, created = AIReview.objects.get_or_create(
+            pull_request=pull_request,
+            defaults={'summary': '', 'status': 'running'}
+        )
+        if not created:
+            review.issues.filter(provisional=True).delete()
+            review.status = 'running'
+            review.save(update_fields=['status'])
+    return review, created
+
+
+def save_provisional_issue(review, issue):
+    """Persist one streamed issue while the review is still running"""
+    if isinstance(issue, dict):
+        row = build_review_issue(review, issue)
+        row.provisional = True
+        row.save()
+
+
+def abandon_review(review, created):
+    """
+    Undo ``start_review`` for a failed or superseded run: drop its
+    provisional issues, and the review itself if this run created it
+    """
+    if created:
+        review.delete()
+        return
+    review.issues.filter(provisional=True).delete()
+    AIReview.objects.filter(pk=review.pk, status='running').update(status='complete')
+
+
+def incremental_base(pull_request):
+    """The PR's existing AIReview when an incremental review is possible, else None"""
+    if not settings.REVIEW_INCREMENTAL:
+        return None
+    if not pull_request.head_sha or not pull_request.reviewed_head_sha:
+        return None
+    return AIReview.objects.filter(pull_request=pull_request).first()
+
+
+def mark_truncated(analysis):
+    """
+    Flag an analysis of a diff cut off at REVIEW_DIFF_MAX_BYTES
+
+    The files past the cap were not seen, so the review is neither
+    deployment ready nor a base for the next interdiff.
+    """
+    analysis['truncated'] = settings.REVIEW_DIFF_MAX_BYTES
+    analysis['incomplete'] = True
+    analysis['deploymentReady'] = False
+
+
+def fetch_interdiff(pull_request, base_sha, head_sha, diff):
+    """
+    FileDiffs changed between two heads of a PR
+
+    Args:
+        diff: SpooledDiff of the whole PR
+
+    Returns:
+        list: FileDiff list (empty when nothing changed), or None when a
+            full review is the better option: the compare failed or the
+            interdiff is no smaller than the PR diff (e.g. after a rebase)
+    """
+    if base_sha == head_sha:
+        return []
+
+    interdiff = fetch_compare_diff(pull_request, base_sha, head_sha)
+    if interdiff is None:
+        return None
+
+    pr_paths = set()
+    for file_diff in diff.files():
+        pr_paths.update((file_diff.path, file_diff.old_path))
+    files = restrict_to_paths(interdiff, pr_paths)
+
+    if sum(len(f.text) for f in files) >= diff.size:
+        logger.info(f"Interdiff for PR #{pull_request.pr_number} is not smaller than the PR diff, reviewing in full")
+        return None
+    return files
+
+
+def save_review(pull_request, analysis, reviewed_head_sha=''):
+    """
+    Persist an analysis result as the PR's AIReview and ReviewIssue rows
+
+    ``reviewed_head_sha`` is recorded on the PR as the base for the next
+    incremental review; pass '' to force the next review to be a full one.
+    """
+    with transaction.atomic():
+        review, _ = AIReview.objects.update_or_create(
+            pull_request=pull_request,
+            defaults={
+                'risk_score': analysis.get('riskScore', 50),
+                'summary': analysis.get('summary', ''),
+                'deployment_ready': bool(analysis.get('deploymentReady', False)),
+                'analysis_data': analysis,
+                'status': 'complete',
+            }
+        )
+        review.issues.all().delete()
+        ReviewIssue.objects.bulk_create([
+            build_review_issue(review, issue)
+            for issue in analysis.get('issues', [])
+            if isinstance(issue, dict)
+        ])
+        PullRequest.objects.filter(pk=pull_request.pk).update(reviewed_head_sha=reviewed_head_sha)
+        pull_request.reviewed_head_sha = reviewed_head_sha
+    return review
+
+
+def build_review_issue(review, issue):
+    """Build an unsaved ReviewIssue from one entry of the analysis ``issues`` list"""
+    severity = str(issue.get('severity', 'low')).lower()
+    if severity not in dict(ReviewIssue.SEVERITY_CHOICES):
+        severity = 'low'
+
+    try:
+        line_number = int(issue.get('line'))
+    except (TypeError, ValueError):
+        line_number = None
+
+    return ReviewIssue(
+        ai_review=review,
+        severity=severity,
+        title=str(issue.get('title', ''))[:500],
+        file_path=str(issue.get('file', ''))[:500],
+        line_number=line_number,
+        suggestion=str(issue.get('suggestion', '')),
+    )
+
+
+def format_review_comment(review):
+    """Render an AIReview as a markdown PR comment"""
+    lines = [
+        '## 🏁 PitCrew AI Review',
+        '',
+        f"**Risk score:** {review.risk_score}/100",
+        f"**Deployment ready:** {'✅ Yes' if review.deployment_ready else '❌ No'}",
+        '',
+        review.summary,
+    ]
+
+    issues = list(review.issues.all())
+    if issues:
+        lines += ['', '### Issues']
+        for issue in issues:
+            location = issue.file_path
+            if issue.line_number:
+                location = f"{location}:{issue.line_number}"
+            lines.append(f"- **{issue.severity.upper()}** {issue.title} (`{location}`)")
+            if issue.suggestion:
+                lines.append(f"  - {issue.suggestion}")
+
+    blockers = review.analysis_data.get('blockers', [])
+    if blockers:
+        lines += ['', '### Blockers']
+        lines += [f"- {blocker}" for blocker in blockers]
+
+    recommendations = review.analysis_data.get('recommendations', [])
+    if recommendations:
+        lines += ['', '### Recommendations']
+        lines += [f"- {rec}" for rec in recommendations]
+
+    triaged = review.analysis_data.get('triaged', [])
+    if triaged:
+        shown = ', '.join(f"`{path}`" for path in triaged[:10])
+        more = f" and {len(triaged) - 10} more" if len(triaged) > 10 else ''
+        lines += ['', f"_Not reviewed (lockfiles, generated, vendored or non-code files): {shown}{more}_"]
+
+    truncated = review.analysis_data.get('truncated')
+    if truncated:
+        lines += ['', f"_The diff exceeds {truncated // (1024 * 1024)} MB; files past that point were not reviewed._"]
 
-# ... rest of the file
\ No newline at end of file
+    return '\n'.join(lines)
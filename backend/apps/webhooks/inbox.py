@@ -0,0 +1,158 @@
+# apps/webhooks/inbox.py
+"""
+Durable webhook inbox
+
+Webhook views only append the raw delivery here and enqueue a drain task;
+Celery workers claim pending rows in batches and process them. Rows are
+never deleted by processing, so the table doubles as a replayable log.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .dedup import deduplicator
+from .models import WebhookDelivery
+
+logger = logging.getLogger(__name__)
+
+# Headers worth keeping alongside the payload; everything else is dropped
+KEPT_HEADERS = (
+    'Content-Type',
+    'User-Agent',
+    'X-GitHub-Event',
+    'X-GitHub-Delivery',
+    'X-Hub-Signature-256',
+    'X-Hub-Signature',
+    'X-Event-Key',
+    'X-Request-UUID',
+    'X-Hook-UUID',
+)
+
+
+def record_delivery(provider, event, headers, body, delivery_id=''):
+    """
+    Append a raw webhook delivery to the inbox
+
+    Deliveries carrying an id already in the inbox are dropped, so provider
+    redeliveries never reach diff fetching or the model.
+
+    Args:
+        provider: 'github' or 'bitbucket'
+        event: Provider event name
+        headers: Request headers mapping
+        body: Raw request body bytes
+        delivery_id: Provider delivery id used for deduplication
+
+    Returns:
+        WebhookDelivery: The stored inbox row, or None for a duplicate
+    """
+    kept = {name: headers[name] for name in KEPT_HEADERS if name in headers}
+
+    def create():
+        return WebhookDelivery.objects.create(
+            provider=provider,
+            event=event,
+            delivery_id=delivery_id or '',
+            headers=kept,
+            payload=body,
+        )
+
+    if not delivery_id:
+        return create()
+    return deduplicator.insert_once((provider, delivery_id), create)
+
+
+def claim_batch(batch_size=None):
+    """
+    Claim up to ``batch_size`` deliveries for processing
+
+    Pending rows and rows whose lease expired (a worker died mid-batch)
+    are both claimable. Claimed rows are marked ``processing``.
+
+    Returns:
+        list: Claimed WebhookDelivery instances, oldest first
+    """
+    batch_size = batch_size or settings.WEBHOOK_INBOX_BATCH_SIZE
+    now = timezone.now()
+    stale_before = now - timedelta(seconds=settings.WEBHOOK_INBOX_LEASE_SECONDS)
+
+    with transaction.atomic():
+        batch = list(
+            WebhookDelivery.objects
+            .select_for_update(skip_locked=True)
+            .filter(
+                Q(status='pending') |
+                Q(status='processing', locked_at__lt=stale_before)
+            )
+            .order_by('id')[:batch_size]
+        )
+        claimed = []
+        for delivery in batch:
+            # Compare-and-set on the state we read, so concurrent drains on
+            # backends without row locks (SQLite) never claim the same row
+            won = WebhookDelivery.objects.filter(
+                pk=delivery.pk,
+                status=delivery.status,
+                locked_at=delivery.locked_at,
+            ).update(status='processing', locked_at=now)
+            if won:
+                delivery.status = 'processing'
+                delivery.locked_at = now
+                claimed.append(delivery)
+    return claimed
+
+
+def mark_processed(delivery):
+    """Mark a delivery as successfully processed"""
+    delivery.status = 'processed'
+    delivery.attempts += 1
+    delivery.last_error = ''
+    delivery.locked_at = None
+    delivery.processed_at = timezone.now()
+    delivery.save(update_fields=['status', 'attempts', 'last_error', 'locked_at', 'processed_at'])
+
+
+def mark_failed(delivery, error):
+    """Record a processing failure, returning the row to the queue until attempts run out"""
+    delivery.attempts += 1
+    delivery.last_error = str(error)[:2000]
+    delivery.locked_at = None
+    if delivery.attempts >= settings.WEBHOOK_INBOX_MAX_ATTEMPTS:
+        delivery.status = 'failed'
+        logger.error(f"Webhook delivery {delivery.pk} failed permanently: {error}")
+    else:
+        delivery.status = 'pending'
+    delivery.save(update_fields=['status', 'attempts', 'last_error', 'locked_at'])
+
+
+def redrive(queryset=None):
+    """
+    Reset deliveries back to ``pending`` so the next drain reprocesses them
+
+    Args:
+        queryset: Deliveries to re-drive (defaults to all failed ones)
+
+    Returns:
+        int: Number of rows reset
+    """
+    if queryset is None:
+        queryset = WebhookDelivery.objects.filter(status='failed')
+    return queryset.update(status='pending', attempts=0, last_error='', locked_at=None)
+
+
+def enqueue_drain():
+    """Ask a Celery worker to drain the inbox once the current transaction commits"""
+    from .tasks import drain_webhook_inbox
+
+    def _send():
+        try:
+            drain_webhook_inbox.delay()
+        except Exception as e:
+            # The delivery is already durable; the periodic drain picks it up
+            logger.error(f"Failed to enqueue webhook drain: {str(e)}")
+
+    transaction.on_commit(_send)
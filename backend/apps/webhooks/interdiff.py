@@ -0,0 +1,179 @@
+# apps/webhooks/interdiff.py
+"""
+Incremental review support
+
+When a PR moves from an already reviewed head A to a new head B, only the
+A..B interdiff is sent to the model. Issues from the previous review are
+carried forward onto B's line numbers through the interdiff; issues whose
+lines were edited or removed are retired, since the fresh analysis of
+those hunks re-flags them if they still apply.
+"""
+import logging
+
+from .diffs import parse_diff
+
+logger = logging.getLogger(__name__)
+
+
+class LineMap:
+    """Maps line numbers of a file at the old head onto the new head"""
+
+    def __init__(self, file_diff):
+        self.hunks = sorted(file_diff.hunks, key=lambda h: h.old_start)
+
+    def map(self, line):
+        """
+        New line number for old ``line``
+
+        Returns:
+            int: The line number at the new head, or None if the line was
+                changed or removed
+        """
+        offset = 0
+        for hunk in self.hunks:
+            # A pure insertion (count 0) sits after old_start rather than on it
+            first = hunk.old_start if hunk.old_count else hunk.old_start + 1
+            if line < first:
+                break
+            if line >= first + hunk.old_count:
+                offset += hunk.new_count - hunk.old_count
+                continue
+
+            old_line, new_line = hunk.old_start, hunk.new_start
+            for text in hunk.lines:
+                if text.startswith('+'):
+                    new_line += 1
+                elif text.startswith('-'):
+                    if old_line == line:
+                        return None
+                    old_line += 1
+                elif not text.startswith('\\'):
+                    if old_line == line:
+                        return new_line
+                    old_line += 1
+                    new_line += 1
+            return None
+        return line + offset
+
+
+def find_file(files_by_old_path, issue_path):
+    """The interdiff FileDiff for the file an issue names, if any"""
+    issue_path = issue_path.strip().removeprefix('./').lstrip('/')
+    if not issue_path:
+        return None
+    if issue_path in files_by_old_path:
+        return files_by_old_path[issue_path]
+    for old_path, file_diff in files_by_old_path.items():
+        if old_path.endswith('/' + issue_path) or issue_path.endswith('/' + old_path):
+            return file_diff
+    return None
+
+
+def remap_issues(issues, interdiff_files):
+    """
+    Carry previous issues across the interdiff
+
+    Args:
+        issues: Issue dicts (``file``, ``line``, ...) from the previous review
+        interdiff_files: FileDiff list for old head..new head
+
+    Returns:
+        tuple: (carried issue dicts with updated file/line, retired count)
+    """
+    files_by_old_path = {f.old_path: f for f in interdiff_files}
+    line_maps = {}
+    carried = []
+    retired = 0
+
+    for issue in issues:
+        file_diff = find_file(files_by_old_path, str(issue.get('file', '')))
+        if file_diff is None:
+            # File untouched since the last review: the issue stands as-is
+            carried.append(issue)
+            continue
+
+        if file_diff.is_deleted or issue.get('line') is None:
+            retired += 1
+            continue
+
+        if file_diff.old_path not in line_maps:
+            line_maps[file_diff.old_path] = LineMap(file_diff)
+        line = line_maps[file_diff.old_path].map(issue['line'])
+        if line is None:
+            retired += 1
+            continue
+
+        carried.append(dict(issue, file=file_diff.path, line=line))
+
+    return carried, retired
+
+
+def restrict_to_paths(interdiff_text, paths):
+    """
+    FileDiffs of the interdiff limited to files the PR itself changes
+
+    Drops files that only moved because the base branch was merged into
+    the PR branch between the two heads.
+    """
+    paths = set(paths)
+    return [
+        f for f in parse_diff(interdiff_text)
+        if f.path in paths or f.old_path in paths or f.is_deleted
+    ]
+
+
+def carry_forward(previous, analysis, interdiff_files, base_sha, head_sha):
+    """
+    Combine the interdiff analysis with the previous review's surviving issues
+
+    Args:
+        previous: AIReview for ``base_sha``
+        analysis: Analysis dict for the interdiff
+        interdiff_files: FileDiff list the analysis covered
+        base_sha: Previously reviewed head
+        head_sha: Head being reviewed now
+
+    Returns:
+        dict: Analysis for the full PR at ``head_sha``
+    """
+    previous_issues = [
+        {
+            'severity': issue.severity,
+            'title': issue.title,
+            'file': issue.file_path,
+            'line': issue.line_number,
+            'suggestion': issue.suggestion,
+        }
+        for issue in previous.issues.filter(provisional=False)
+    ]
+    carried, retired = remap_issues(previous_issues, interdiff_files)
+
+    new_issues = [i for i in analysis.get('issues') or [] if isinstance(i, dict)]
+    seen = {(i.get('file'), i.get('line'), i.get('title')) for i in new_issues}
+    carried = [i for i in carried if (i['file'], i['line'], i['title']) not in seen]
+
+    try:
+        risk_score = int(analysis.get('riskScore', 50))
+    except (TypeError, ValueError):
+        risk_score = 50
+    if carried:
+        risk_score = max(risk_score, previous.risk_score)
+
+    summary = (
+        f"Incremental review of {base_sha[:7]}..{head_sha[:7]}: "
+        f"{len(carried)} earlier issue(s) carried forward, {retired} resolved or superseded.\n"
+        f"{analysis.get('summary', '')}"
+    )
+    logger.info(f"Incremental review {base_sha[:7]}..{head_sha[:7]}: carried {len(carried)}, retired {retired}")
+
+    return dict(
+        analysis,
+        summary=summary,
+        riskScore=risk_score,
+        issues=new_issues + carried,
+        deploymentReady=(
+            bool(analysis.get('deploymentReady'))
+            and not any(i.get('severity') == 'high' for i in carried)
+        ),
+        reviewedFrom=base_sha,
+    )
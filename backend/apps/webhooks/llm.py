@@ -0,0 +1,199 @@
+# apps/webhooks/llm.py
+"""
+Process-wide Anthropic clients
+
+Building an ``anthropic.Anthropic`` per review means a fresh connection
+pool, and so a fresh TCP + TLS handshake, for every review. Clients here
+are created once per worker process and reused, keeping HTTP connections
+alive between reviews.
+
+The async variant runs an ``AsyncAnthropic`` client on one event loop
+thread per process. Every model call made through it shares a
+process-wide semaphore (AI_MAX_INFLIGHT_PER_WORKER), so a Celery worker
+can keep many requests in flight without one review starving the rest.
+
+Registries are keyed by PID: Celery's prefork pool forks after import and
+a forked child must not reuse its parent's sockets.
+
+``usage`` totals the token usage reported by every call, including the
+prompt-cache read and write counts, over all web and worker processes.
+"""
+import asyncio
+import logging
+import os
+import threading
+
+import anthropic
+import httpx
+from django.conf import settings
+
+from .counters import SharedCounters
+
+logger = logging.getLogger(__name__)
+
+
+def _limits():
+    return httpx.Limits(
+        max_connections=settings.AI_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.AI_HTTP_MAX_CONNECTIONS,
+    )
+
+
+class ClientRegistry:
+    """Lazily built sync clients, one per (api key, base URL) per process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.clients = {}
+
+    def get(self, api_key, base_url=None):
+        with self.lock:
+            if self.pid != os.getpid():
+                # Forked: drop the parent's clients without closing its sockets
+                self.pid = os.getpid()
+                self.clients = {}
+
+            key = (api_key, base_url)
+            client = self.clients.get(key)
+            if client is None:
+                client = anthropic.Anthropic(
+                    api_key=api_key,
+                    base_url=base_url,
+                    http_client=anthropic.DefaultHttpxClient(limits=_limits()),
+                )
+                self.clients[key] = client
+                logger.info(f"Created Anthropic client for {base_url or 'default endpoint'}")
+            return client
+
+    def reset(self):
+        """Close and forget every client (tests, settings changes)"""
+        with self.lock:
+            clients, self.clients = self.clients, {}
+        if self.pid == os.getpid():
+            for client in clients.values():
+                client.close()
+
+
+class AsyncRunner:
+    """
+    Event loop thread owning the async client and the in-flight semaphore
+
+    Synchronous code (Celery tasks) submits coroutines with ``run`` or ``submit``.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid = None
+        self.loop = None
+        self.clients = {}
+        self.semaphore = None
+
+    def _ensure_loop(self):
+        with self.lock:
+            if self.loop is not None and self.pid == os.getpid():
+                return self.loop
+
+            self.pid = os.getpid()
+            self.clients = {}
+            self.loop = asyncio.new_event_loop()
+            self.semaphore = asyncio.Semaphore(settings.AI_MAX_INFLIGHT_PER_WORKER)
+            thread = threading.Thread(target=self.loop.run_forever, name='anthropic-async', daemon=True)
+            thread.start()
+            return self.loop
+
+    def submit(self, coro):
+        """Schedule ``coro`` on the runner's loop; returns a concurrent Future"""
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(coro, loop)
+
+    def run(self, coro):
+        """Run ``coro`` on the runner's loop and wait for its result"""
+        return self.submit(coro).result()
+
+    def client(self, api_key, base_url=None):
+        """Async client for the runner's loop; call from coroutines running on it"""
+        key = (api_key, base_url)
+        client = self.clients.get(key)
+        if client is None:
+            client = anthropic.AsyncAnthropic(
+                api_key=api_key,
+                base_url=base_url,
+                http_client=anthropic.DefaultAsyncHttpxClient(limits=_limits()),
+            )
+            self.clients[key] = client
+        return client
+
+    async def gather_limited(self, factories, limit):
+        """
+        Await coroutine factories with at most ``limit`` running for this
+        caller, and at most AI_MAX_INFLIGHT_PER_WORKER across the process
+        """
+        local = asyncio.Semaphore(max(1, limit))
+
+        async def run_one(factory):
+            async with local, self.semaphore:
+                return await factory()
+
+        return await asyncio.gather(*(run_one(f) for f in factories))
+
+    def reset(self):
+        """Stop the loop and forget its clients"""
+        with self.lock:
+            loop, clients = self.loop, self.clients
+            self.loop, self.clients = None, {}
+        if loop is not None and self.pid == os.getpid():
+            for client in clients.values():
+                asyncio.run_coroutine_threadsafe(client.close(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+
+
+class UsageMeter:
+    """
+    Token counters across every model call, summed over all processes
+
+    Calls run in Celery workers while the stats endpoint is served by a
+    web process, so the totals live in SharedCounters.
+    """
+
+    FIELDS = ('input_tokens', 'output_tokens', 'cache_creation_input_tokens', 'cache_read_input_tokens')
+
+    def __init__(self):
+        self.counters = SharedCounters('model_usage', ('calls',) + self.FIELDS)
+
+    def record(self, usage):
+        """Add one response's ``usage`` (an SDK Usage object or a dict)"""
+        if isinstance(usage, dict):
+            values = [usage.get(name) or 0 for name in self.FIELDS]
+        else:
+            values = [getattr(usage, name, None) or 0 for name in self.FIELDS]
+        self.counters.add(calls=1, **dict(zip(self.FIELDS, values)))
+
+    def stats(self):
+        """Totals plus the share of prompt tokens served from the prompt cache"""
+        totals = self.counters.values()
+        prompt_tokens = (
+            totals['input_tokens'] + totals['cache_creation_input_tokens'] + totals['cache_read_input_tokens']
+        )
+        totals['cache_read_ratio'] = (
+            round(totals['cache_read_input_tokens'] / prompt_tokens, 4) if prompt_tokens else 0.0
+        )
+        return totals
+
+    def reset(self):
+        self.counters.reset()
+
+
+registry = ClientRegistry()
+runner = AsyncRunner()
+usage = UsageMeter()
+
+
+def get_client():
+    """Shared sync client for the configured API key and endpoint"""
+    return registry.get(settings.ANTHROPIC_API_KEY, settings.ANTHROPIC_BASE_URL)
+
+
+def get_async_client():
+    """Shared async client; only valid inside coroutines run by ``runner``"""
+    return runner.client(settings.ANTHROPIC_API_KEY, settings.ANTHROPIC_BASE_URL)
@@ -0,0 +1,794 @@
+# apps/webhooks/loadtest.py
+"""
+Building blocks for webhook record-and-replay load tests
+
+Used by the record_webhooks and replay_webhooks management commands.
+Segments are gzip-compressed JSON lines, one delivery per line, rolled
+over once a segment holds ``max_bytes`` of uncompressed data.
+
+``ProviderStub`` is a local fake of the Anthropic Messages API and the
+GitHub/Bitbucket endpoints, with configurable latency distributions,
+token throughput, prompt caching, 429/529 injection, canned or
+diff-derived reviews and an emulation of message batches. It backs the
+benchmark commands and the fake_llm_server command.
+"""
+import base64
+import gzip
+import hashlib
+import itertools
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs
+
+from .context_packer import CODE_RULES, risky_code
+from .diffs import estimate_tokens, parse_diff
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PATTERN = 'webhooks-*.jsonl.gz'
+
+
+class SegmentWriter:
+    """Append delivery records to rolling gzip segment files"""
+
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._file = None
+        self._written = 0
+        existing = sorted(self.directory.glob(SEGMENT_PATTERN))
+        self._index = int(existing[-1].name.split('-')[1].split('.')[0]) if existing else 0
+
+    def write(self, record):
+        line = (json.dumps(record, separators=(',', ':')) + '\n').encode()
+        if self._file is None or self._written + len(line) > self.max_bytes:
+            self._roll()
+        self._file.write(line)
+        self._written += len(line)
+
+    def _roll(self):
+        self.close()
+        self._index += 1
+        path = self.directory / f'webhooks-{self._index:06d}.jsonl.gz'
+        self._file = gzip.open(path, 'wb')
+        self._written = 0
+        logger.info(f"Recording webhooks to {path}")
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def delivery_record(delivery):
+    """Serialize a WebhookDelivery row into a segment record"""
+    return {
+        'id': delivery.pk,
+        'received_at': delivery.received_at.timestamp(),
+        'provider': delivery.provider,
+        'event': delivery.event,
+        'headers': delivery.headers,
+        'body': base64.b64encode(bytes(delivery.payload)).decode(),
+    }
+
+
+def iter_segments(directory):
+    """Yield recorded deliveries from every segment in ``directory``, oldest first"""
+    for path in sorted(Path(directory).glob(SEGMENT_PATTERN)):
+        with gzip.open(path, 'rb') as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    record['body'] = base64.b64decode(record['body'])
+                    yield record
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = math.ceil(pct / 100 * len(ordered)) - 1
+    return ordered[max(0, min(rank, len(ordered) - 1))]
+
+
+STUB_DIFF = """diff --git a/app/views.py b/app/views.py
+index 3b18e51..a9c2f4d 100644
+--- a/app/views.py
++++ b/app/views.py
+@@ -1,4 +1,6 @@
+ import os
++import subprocess
+
+ def handler(request):
+-    return os.environ.get('NAME')
++    name = request.GET.get('name')
++    return subprocess.run(f"echo {name}", shell=True)
+"""
+
+STUB_REVIEW = {
+    'summary': 'Stubbed review',
+    'riskScore': 40,
+    'issues': [{
+        'severity': 'high',
+        'title': 'Shell injection',
+        'file': 'app/views.py',
+        'line': 6,
+        'suggestion': 'Pass an argument list and drop shell=True',
+    }],
+    'recommendations': ['Add tests'],
+    'blockers': [],
+    'deploymentReady': False,
+}
+
+
+LATENCY_DISTRIBUTIONS = ('fixed', 'uniform', 'exponential', 'lognormal', 'pareto')
+REVIEW_MODES = ('canned', 'diff')
+# Provider API requests per hour the stub reports, like GitHub's authenticated limit
+PROVIDER_RATE_LIMIT = 5000
+
+# Issue severity per risky_code kind found in a hunk
+KIND_SEVERITY = {'exec': 'high', 'sql': 'medium', 'secret': 'medium', 'access': 'medium'}
+
+
+def sample_latency(rng, distribution, mean_ms):
+    """
+    Seconds of simulated latency drawn from ``distribution`` with mean ``mean_ms``
+
+    ``lognormal`` and ``pareto`` have the long tails real model latency
+    shows; ``uniform`` (0.5x to 1.5x the mean) is the old stub behaviour.
+    """
+    if mean_ms <= 0:
+        return 0.0
+    mean = mean_ms / 1000
+    if distribution == 'fixed':
+        return mean
+    if distribution == 'uniform':
+        return rng.uniform(0.5, 1.5) * mean
+    if distribution == 'exponential':
+        return rng.expovariate(1 / mean)
+    if distribution == 'lognormal':
+        sigma = 0.75
+        return rng.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma)
+    if distribution == 'pareto':
+        alpha = 2.5
+        return mean * (alpha - 1) / alpha * rng.paretovariate(alpha)
+    raise ValueError(f"Unknown latency distribution: {distribution}")
+
+
+def first_risky_line(hunk):
+    """New-file line number of the first added line matching CODE_RULES"""
+    line = hunk.new_start
+    for text in hunk.lines:
+        if text.startswith('+'):
+            if CODE_RULES.search(text):
+                return line
+            line += 1
+        elif not text.startswith('-') and not text.startswith('\\'):
+            line += 1
+    return hunk.new_start
+
+
+def review_from_prompt(prompt):
+    """
+    Deterministic review of the diff embedded in a prompt
+
+    One issue per hunk whose added lines contain risky code (see
+    ``context_packer.risky_code``), so output size and scores track the
+    diff the way a real review roughly does.
+    """
+    files = parse_diff(prompt)
+    hunks = [(f, h) for f in files for h in f.hunks]
+    issues = []
+    for (file_diff, hunk), kinds in zip(hunks, risky_code([h for _, h in hunks])):
+        if not kinds:
+            continue
+        severity = 'high' if any(KIND_SEVERITY[k] == 'high' for k in kinds) else 'medium'
+        issues.append({
+            'severity': severity,
+            'title': f"Risky change ({', '.join(sorted(kinds))})",
+            'file': file_diff.path,
+            'line': first_risky_line(hunk),
+            'suggestion': 'Review this change carefully and add tests covering it',
+        })
+
+    high = [i for i in issues if i['severity'] == 'high']
+    return {
+        'summary': f"Reviewed {len(files)} file(s) and {len(hunks)} hunk(s); {len(issues)} risky hunk(s)",
+        'riskScore': min(100, 10 + 15 * len(issues)),
+        'issues': issues,
+        'recommendations': ['Add tests for the flagged changes'] if issues else [],
+        'blockers': [f"{i['title']} in {i['file']}" for i in high],
+        'deploymentReady': not high,
+    }
+
+
+def synthetic_diff(rng, files=5, hunks=3, lines=8):
+    """Random multi-file diff with an occasional risky line, for benchmarks"""
+    risky = [
+        "    subprocess.run(cmd, shell=True)",
+        "    cursor.execute(f\"SELECT * FROM users WHERE id = {user_id}\")",
+        "    api_key = 'sk-test'",
+        "@csrf_exempt",
+    ]
+    parts = []
+    for f in range(files):
+        path = f"pkg/module_{f}_{rng.randrange(1 << 30):x}.py"
+        parts.append(f"diff --git a/{path} b/{path}\n--- a/{path}\n+++ b/{path}")
+        for h in range(hunks):
+            start = 1 + h * 100
+            body = [f" context_{start}()"]
+            for i in range(lines):
+                if rng.random() < 0.05:
+                    body.append('+' + rng.choice(risky))
+                else:
+                    body.append(f"+    value_{rng.randrange(1 << 20)} = compute({i})")
+            body.append(f"-    old_{h}()")
+            parts.append(f"@@ -{start},2 +{start},{lines + 1} @@\n" + '\n'.join(body))
+    return '\n'.join(parts) + '\n'
+
+
+def add_stub_arguments(parser):
+    """Command-line flags shared by the commands that run a ProviderStub"""
+    parser.add_argument('--llm-latency-ms', type=int, default=0,
+                        help='Mean stub model latency before the first token (default: 0)')
+    parser.add_argument('--latency-distribution', choices=LATENCY_DISTRIBUTIONS, default='uniform',
+                        help='Distribution of stub model latency (default: uniform)')
+    parser.add_argument('--tokens-per-second', type=float, default=0,
+                        help='Stub output token throughput per response; 0 is instant (default: 0)')
+    parser.add_argument('--rate-limit-rate', type=float, default=0,
+                        help='Fraction of model calls answered with 429 (default: 0)')
+    parser.add_argument('--overloaded-rate', type=float, default=0,
+                        help='Fraction of model calls answered with 529 (default: 0)')
+    parser.add_argument('--prefill-tokens-per-second', type=float, default=0,
+                        help='Stub processing rate for uncached input tokens; 0 is instant (default: 0)')
+    parser.add_argument('--review-mode', choices=REVIEW_MODES, default='canned',
+                        help='Canned review or one derived from the prompt diff (default: canned)')
+    parser.add_argument('--provider-latency-ms', type=int, default=0,
+                        help='Mean stub provider API latency (default: 0)')
+    parser.add_argument('--seed', type=int, help='Seed for the stub random number generator')
+
+
+def stub_from_options(options, address=('127.0.0.1', 0), **kwargs):
+    """ProviderStub configured from ``add_stub_arguments`` flags"""
+    return ProviderStub(
+        address,
+        llm_latency_ms=options['llm_latency_ms'],
+        latency_distribution=options['latency_distribution'],
+        tokens_per_second=options['tokens_per_second'],
+        prefill_tokens_per_second=options['prefill_tokens_per_second'],
+        rate_limit_rate=options['rate_limit_rate'],
+        overloaded_rate=options['overloaded_rate'],
+        review_mode=options['review_mode'],
+        provider_latency_ms=options['provider_latency_ms'],
+        seed=options['seed'],
+        **kwargs
+    )
+
+
+class ProviderStub(ThreadingHTTPServer):
+    """
+    Local stand-in for the Anthropic Messages API and the GitHub/Bitbucket
+    endpoints the reviewer calls, with injectable latency and errors; it
+    records when review comments are posted or edited
+
+    Point the app at it with ANTHROPIC_BASE_URL=<url>,
+    GITHUB_API_URL=<url> and BITBUCKET_API_URL=<url>/2.0.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), llm_latency_ms=0, provider_latency_ms=0,
+                 diff_text=STUB_DIFF, review=STUB_REVIEW, latency_distribution='uniform',
+                 tokens_per_second=0, rate_limit_rate=0.0, overloaded_rate=0.0,
+                 review_mode='canned', seed=None, prefill_tokens_per_second=0,
+                 cache_min_tokens=1024, cache_ttl=300, batch_latency_ms=0, pull_request_count=0,
+                 provider_failures=0):
+        if latency_distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {latency_distribution}")
+        if review_mode not in REVIEW_MODES:
+            raise ValueError(f"Unknown review mode: {review_mode}")
+        super().__init__(address, StubRequestHandler)
+        self.llm_latency_ms = llm_latency_ms
+        self.provider_latency_ms = provider_latency_ms
+        self.latency_distribution = latency_distribution
+        self.tokens_per_second = tokens_per_second
+        self.rate_limit_rate = rate_limit_rate
+        self.overloaded_rate = overloaded_rate
+        self.review_mode = review_mode
+        self.diff_text = diff_text
+        self.review = review
+        self.prefill_tokens_per_second = prefill_tokens_per_second
+        self.cache_min_tokens = cache_min_tokens
+        self.cache_ttl = cache_ttl
+        self.batch_latency_ms = batch_latency_ms
+        self.pull_request_count = pull_request_count
+        self.provider_failures = provider_failures
+        self.rate_limit_remaining = PROVIDER_RATE_LIMIT
+        self.rate_limit_reset = int(time.time()) + 3600
+        self.files = {}  # repository path -> content served by the contents endpoints
+        self.in_flight = self.max_in_flight = 0
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.comments = []  # (monotonic time, provider, full_name, pr_number) per review posted or edited
+        self.published = []  # (method, path, JSON body) of review and comment writes
+        self.comment_ids = itertools.count(1)
+        self.counts = {'llm': 0, 'diff': 0, 'comment': 0, 'rate_limited': 0, 'overloaded': 0, 'batch': 0,
+                       'connection': 0, 'provider_error': 0, 'not_modified': 0, 'inline': 0, 'edit': 0}
+        self.tokens = {'input': 0, 'output': 0, 'cache_write': 0, 'cache_read': 0}
+        self.prompt_cache = {}  # sha256 of a cached prefix -> monotonic expiry
+        self.batches = {}       # batch id -> created/ends_at datetimes and result lines
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def record(self, kind, comment=None):
+        with self.lock:
+            self.counts[kind] += 1
+            if comment:
+                self.comments.append((time.monotonic(),) + comment)
+
+    def latency(self, mean_ms, distribution='uniform'):
+        with self.lock:
+            return sample_latency(self.rng, distribution, mean_ms)
+
+    def injected_error(self):
+        """(status, error type) for a model call chosen to fail, else None"""
+        with self.lock:
+            roll = self.rng.random()
+        if roll < self.rate_limit_rate:
+            self.record('rate_limited')
+            return 429, 'rate_limit_error'
+        if roll < self.rate_limit_rate + self.overloaded_rate:
+            self.record('overloaded')
+            return 529, 'overloaded_error'
+        return None
+
+    def spend_rate_limit(self, cost):
+        """Take ``cost`` requests from the provider rate limit; returns what is left"""
+        with self.lock:
+            self.rate_limit_remaining = max(0, self.rate_limit_remaining - cost)
+            return self.rate_limit_remaining
+
+    def provider_failure(self):
+        """Whether this provider API request is one chosen to fail"""
+        with self.lock:
+            if self.provider_failures <= 0:
+                return False
+            self.provider_failures -= 1
+            self.counts['provider_error'] += 1
+            return True
+
+    def review_text(self, prompt):
+        review = review_from_prompt(prompt) if self.review_mode == 'diff' else self.review
+        return json.dumps(review)
+
+    def prompt_usage(self, request):
+        """
+        Input token usage of a request, emulating provider prompt caching
+
+        The prefix up to the last block marked with cache_control is cached
+        for ``cache_ttl`` seconds (refreshed on every hit) once it reaches
+        ``cache_min_tokens``; shorter prefixes are silently not cached, as
+        with the real API.
+        """
+        blocks = prompt_blocks(request)
+        total = sum(estimate_tokens(text) for _, text, _ in blocks)
+        marked = [i for i, (_, _, cached) in enumerate(blocks) if cached]
+        usage = {'input_tokens': total, 'cache_creation_input_tokens': 0, 'cache_read_input_tokens': 0}
+        if not marked:
+            return usage
+
+        prefix = blocks[:marked[-1] + 1]
+        prefix_tokens = sum(estimate_tokens(text) for _, text, _ in prefix)
+        if prefix_tokens < self.cache_min_tokens:
+            return usage
+
+        key = hashlib.sha256(json.dumps(prefix).encode()).hexdigest()
+        now = time.monotonic()
+        with self.lock:
+            hit = self.prompt_cache.get(key, 0) > now
+            self.prompt_cache[key] = now + self.cache_ttl
+        usage['input_tokens'] = total - prefix_tokens
+        usage['cache_read_input_tokens' if hit else 'cache_creation_input_tokens'] = prefix_tokens
+        return usage
+
+    def create_batch(self, requests):
+        """Answer every request of a message batch up front; returns the batch id"""
+        results = []
+        for entry in requests:
+            error = self.injected_error()
+            if error:
+                result = {'type': 'errored', 'error': {
+                    'type': 'error', 'error': {'type': error[1], 'message': f'Injected {error[1]}'},
+                }}
+            else:
+                params = entry.get('params') or {}
+                text = self.review_text(prompt_text(params))
+                usage = dict(self.prompt_usage(params), output_tokens=estimate_tokens(text))
+                self.add_tokens(usage, usage['output_tokens'])
+                result = {'type': 'succeeded', 'message': {
+                    'id': 'msg_stub', 'type': 'message', 'role': 'assistant', 'model': 'stub',
+                    'content': [{'type': 'text', 'text': text}],
+                    'stop_reason': 'end_turn', 'stop_sequence': None, 'usage': usage,
+                }}
+            results.append({'custom_id': entry.get('custom_id'), 'result': result})
+
+        batch_id = f'msgbatch_{uuid.uuid4().hex}'
+        created = datetime.now(timezone.utc)
+        with self.lock:
+            self.batches[batch_id] = {
+                'created': created,
+                'ends_at': created + timedelta(milliseconds=self.batch_latency_ms),
+                'results': results,
+            }
+        self.record('batch')
+        return batch_id
+
+    def batch_status(self, batch_id):
+        """MessageBatch body for a batch, or None if unknown"""
+        with self.lock:
+            batch = self.batches.get(batch_id)
+        if batch is None:
+            return None
+
+        ended = datetime.now(timezone.utc) >= batch['ends_at']
+        counts = {'processing': 0, 'succeeded': 0, 'errored': 0, 'canceled': 0, 'expired': 0}
+        for line in batch['results']:
+            counts[line['result']['type'] if ended else 'processing'] += 1
+        return {
+            'id': batch_id,
+            'type': 'message_batch',
+            'processing_status': 'ended' if ended else 'in_progress',
+            'request_counts': counts,
+            'created_at': batch['created'].isoformat(),
+            'expires_at': (batch['created'] + timedelta(days=1)).isoformat(),
+            'ended_at': batch['ends_at'].isoformat() if ended else None,
+            'archived_at': None,
+            'cancel_initiated_at': None,
+            'results_url': f'{self.url}/v1/messages/batches/{batch_id}/results' if ended else None,
+        }
+
+    def pull_requests(self, full_name, page, per_page):
+        """One page of a GitHub pull request listing, newest first"""
+        numbers = range(self.pull_request_count, 0, -1)[(page - 1) * per_page:page * per_page]
+        return [self.pull_request(full_name, number) for number in numbers]
+
+    def pull_request(self, full_name, number):
+        """A GitHub pull request object"""
+        return {
+            'number': number,
+            'title': f'Change {number}',
+            'body': '',
+            'state': 'open',
+            'html_url': f'https://github.com/{full_name}/pull/{number}',
+            'user': {'login': 'stub'},
+            'head': {'ref': f'feature-{number}', 'sha': hashlib.sha1(f'{full_name}#{number}'.encode()).hexdigest()},
+            'base': {'ref': 'main', 'sha': 'b' * 40},
+        }
+
+    def bitbucket_pull_request(self, full_name, number):
+        """A Bitbucket pull request object"""
+        return {
+            'id': number,
+            'title': f'Change {number}',
+            'description': '',
+            'state': 'OPEN',
+            'author': {'display_name': 'stub'},
+            'source': {'branch': {'name': f'feature-{number}'},
+                       'commit': {'hash': hashlib.sha1(f'{full_name}#{number}'.encode()).hexdigest()[:12]}},
+            'destination': {'branch': {'name': 'main'}},
+            'links': {'html': {'href': f'https://bitbucket.org/{full_name}/pull-requests/{number}'}},
+        }
+
+    @contextmanager
+    def provider_call(self):
+        """Count a provider API request as in flight while the block runs"""
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def add_tokens(self, usage, output_tokens):
+        with self.lock:
+            self.tokens['input'] += usage['input_tokens']
+            self.tokens['cache_write'] += usage['cache_creation_input_tokens']
+            self.tokens['cache_read'] += usage['cache_read_input_tokens']
+            self.tokens['output'] += output_tokens
+
+
+def prompt_blocks(request):
+    """
+    Text blocks of a Messages API request body in prompt order
+
+    Returns:
+        list: (source, text, whether the block carries cache_control)
+            with source 'system' or 'messages'
+    """
+    def blocks(source, content):
+        if isinstance(content, str):
+            return [(source, content, False)]
+        return [
+            (source, block.get('text', ''), bool(block.get('cache_control')))
+            for block in content or [] if isinstance(block, dict)
+        ]
+
+    found = blocks('system', request.get('system'))
+    for message in request.get('messages') or []:
+        found += blocks('messages', message.get('content'))
+    return found
+
+
+def prompt_text(request):
+    """Text of every message (not the system prompt) in a Messages API request body"""
+    return '\n'.join(text for source, text, _ in prompt_blocks(request) if source == 'messages')
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    GITHUB_DIFF = re.compile(r'^/repos/([^/]+/[^/]+)/pulls/(\d+)$')
+    GITHUB_PULLS = re.compile(r'^/repos/([^/]+/[^/]+)/pulls$')
+    GITHUB_COMMENT = re.compile(r'^/repos/([^/]+/[^/]+)/issues/(\d+)/comments$')
+    BITBUCKET_DIFF = re.compile(r'^/2\.0/repositories/([^/]+/[^/]+)/pullrequests/(\d+)/diff$')
+    BITBUCKET_COMMENT = re.compile(r'^/2\.0/repositories/([^/]+/[^/]+)/pullrequests/(\d+)/comments$')
+    GITHUB_COMPARE = re.compile(r'^/repos/([^/]+/[^/]+)/compare/([^/]+)$')
+    GITHUB_CONTENTS = re.compile(r'^/repos/([^/]+/[^/]+)/contents/(.+)$')
+    BITBUCKET_PULL = re.compile(r'^/2\.0/repositories/([^/]+/[^/]+)/pullrequests/(\d+)$')
+    BITBUCKET_COMPARE = re.compile(r'^/2\.0/repositories/([^/]+/[^/]+)/diff/([^/]+)$')
+    BITBUCKET_SRC = re.compile(r'^/2\.0/repositories/([^/]+/[^/]+)/src/[^/]+/(.+)$')
+    GITHUB_REVIEW = re.compile(r'^/repos/([^/]+/[^/]+)/pulls/(\d+)/reviews$')
+    GITHUB_REVIEW_EDIT = re.compile(r'^/repos/([^/]+/[^/]+)/pulls/(\d+)/reviews/(\d+)$')
+    BITBUCKET_COMMENT_EDIT = re.compile(r'^/2\.0/repositories/([^/]+/[^/]+)/pullrequests/(\d+)/comments/(\d+)$')
+    BATCH = re.compile(r'/v1/messages/batches/([^/]+)(/results)?$')
+
+    # Keep connections open between requests, like the real APIs
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        self.server.record('connection')
+
+    def _sleep(self, latency_ms, distribution='uniform'):
+        delay = self.server.latency(latency_ms, distribution)
+        if delay:
+            time.sleep(delay)
+
+    def _pace(self, started, tokens):
+        """Sleep until ``tokens`` output tokens are due at the stub's throughput"""
+        if self.server.tokens_per_second:
+            delay = started + tokens / self.server.tokens_per_second - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    def _send(self, status, body, content_type='application/json', headers=None):
+        if not isinstance(body, bytes):
+            body = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _send_provider(self, body, content_type='application/json'):
+        """
+        Provider API read with an ETag; a matching If-None-Match gets a 304
+        that, like GitHub's, does not use up rate limit
+        """
+        if not isinstance(body, bytes):
+            body = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        rate_limit = {'X-RateLimit-Limit': str(PROVIDER_RATE_LIMIT), 'X-RateLimit-Reset': str(self.server.rate_limit_reset)}
+        if self.headers.get('If-None-Match') == etag:
+            self.server.record('not_modified')
+            remaining = self.server.spend_rate_limit(0)
+            return self._send(304, b'', content_type, {'ETag': etag, 'X-RateLimit-Remaining': str(remaining), **rate_limit})
+        remaining = self.server.spend_rate_limit(1)
+        self._send(200, body, content_type, {'ETag': etag, 'X-RateLimit-Remaining': str(remaining), **rate_limit})
+
+    def _send_error(self, status, error_type):
+        self._send(status, {
+            'type': 'error',
+            'error': {'type': error_type, 'message': f'Injected {error_type}'},
+        })
+
+    def _send_message(self, text, usage):
+        output_tokens = estimate_tokens(text)
+        self._pace(time.monotonic(), output_tokens)
+        self.server.add_tokens(usage, output_tokens)
+        self._send(200, {
+            'id': 'msg_stub',
+            'type': 'message',
+            'role': 'assistant',
+            'model': 'stub',
+            'content': [{'type': 'text', 'text': text}],
+            'stop_reason': 'end_turn',
+            'stop_sequence': None,
+            'usage': dict(usage, output_tokens=output_tokens),
+        })
+
+    def _send_message_stream(self, text, usage, piece_size=40):
+        """Messages API server-sent events for one text block, paced at the stub's throughput"""
+        output_tokens = estimate_tokens(text)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def event(name, data):
+            payload = f"event: {name}\ndata: {json.dumps(data)}\n\n".encode()
+            self.wfile.write(f"{len(payload):x}\r\n".encode() + payload + b"\r\n")
+
+        event('message_start', {'type': 'message_start', 'message': {
+            'id': 'msg_stub', 'type': 'message', 'role': 'assistant', 'model': 'stub',
+            'content': [], 'stop_reason': None, 'stop_sequence': None,
+            'usage': dict(usage, output_tokens=1),
+        }})
+        event('content_block_start', {'type': 'content_block_start', 'index': 0,
+                                      'content_block': {'type': 'text', 'text': ''}})
+        started = time.monotonic()
+        for i in range(0, len(text), piece_size):
+            self._pace(started, estimate_tokens(text[:i + piece_size]))
+            event('content_block_delta', {'type': 'content_block_delta', 'index': 0,
+                                          'delta': {'type': 'text_delta', 'text': text[i:i + piece_size]}})
+            self.wfile.flush()
+        event('content_block_stop', {'type': 'content_block_stop', 'index': 0})
+        event('message_delta', {'type': 'message_delta',
+                                'delta': {'stop_reason': 'end_turn', 'stop_sequence': None},
+                                'usage': {'output_tokens': output_tokens}})
+        event('message_stop', {'type': 'message_stop'})
+        self.wfile.write(b"0\r\n\r\n")
+        self.server.add_tokens(usage, output_tokens)
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        if path.startswith('/v1/'):
+            return self._get_model_api(path)
+        if self.server.provider_failure():
+            return self._send(503, {'message': 'Service Unavailable'})
+        with self.server.provider_call():
+            self._get_provider_api(path)
+
+    def _get_provider_api(self, path):
+        match = self.GITHUB_DIFF.match(path)
+        if match and 'diff' not in self.headers.get('Accept', ''):
+            self._sleep(self.server.provider_latency_ms)
+            return self._send_provider(self.server.pull_request(match.group(1), int(match.group(2))))
+        match = self.BITBUCKET_PULL.match(path)
+        if match:
+            self._sleep(self.server.provider_latency_ms)
+            return self._send_provider(self.server.bitbucket_pull_request(match.group(1), int(match.group(2))))
+
+        if any(p.match(path) for p in (self.GITHUB_DIFF, self.BITBUCKET_DIFF, self.GITHUB_COMPARE, self.BITBUCKET_COMPARE)):
+            self._sleep(self.server.provider_latency_ms)
+            self.server.record('diff')
+            return self._send_provider(self.server.diff_text, 'text/plain')
+
+        match = self.GITHUB_CONTENTS.match(path) or self.BITBUCKET_SRC.match(path)
+        if match and match.group(2) in self.server.files:
+            self._sleep(self.server.provider_latency_ms)
+            return self._send_provider(self.server.files[match.group(2)], 'text/plain')
+
+        match = self.GITHUB_PULLS.match(path)
+        if match:
+            self._sleep(self.server.provider_latency_ms)
+            query = parse_qs(self.path.partition('?')[2])
+            page = int(query.get('page', ['1'])[0])
+            per_page = int(query.get('per_page', ['30'])[0])
+            return self._send_provider(self.server.pull_requests(match.group(1), page, per_page))
+
+        self._send(404, {'message': 'Not Found'})
+
+    def _get_model_api(self, path):
+        match = self.BATCH.search(path)
+        if match:
+            status = self.server.batch_status(match.group(1))
+            if status is None:
+                return self._send(404, {'type': 'error', 'error': {'type': 'not_found_error', 'message': 'No such batch'}})
+            if not match.group(2):
+                return self._send(200, status)
+            if status['processing_status'] != 'ended':
+                return self._send(404, {'type': 'error', 'error': {'type': 'not_found_error', 'message': 'Batch still processing'}})
+            with self.server.lock:
+                lines = self.server.batches[match.group(1)]['results']
+            return self._send(200, ''.join(json.dumps(line) + '\n' for line in lines), 'application/binary')
+
+        self._send(404, {'message': 'Not Found'})
+
+    def do_POST(self):
+        path = self.path.split('?', 1)[0]
+        body = self._read_body()
+
+        if path.endswith('/v1/messages/batches'):
+            request = json.loads(body or b'{}')
+            batch_id = self.server.create_batch(request.get('requests') or [])
+            return self._send(200, self.server.batch_status(batch_id))
+
+        if path.endswith('/v1/messages'):
+            self.server.record('llm')
+            error = self.server.injected_error()
+            if error:
+                return self._send_error(*error)
+
+            request = json.loads(body or b'{}')
+            usage = self.server.prompt_usage(request)
+            self._sleep(self.server.llm_latency_ms, self.server.latency_distribution)
+            if self.server.prefill_tokens_per_second:
+                # Cached prefix tokens are not processed again
+                time.sleep(usage['input_tokens'] / self.server.prefill_tokens_per_second)
+            text = self.server.review_text(prompt_text(request))
+            if request.get('stream'):
+                return self._send_message_stream(text, usage)
+            return self._send_message(text, usage)
+
+        for provider, pattern in (('github', self.GITHUB_COMMENT), ('bitbucket', self.BITBUCKET_COMMENT),
+                                  ('github', self.GITHUB_REVIEW)):
+            match = pattern.match(path)
+            if match:
+                self._sleep(self.server.provider_latency_ms)
+                data = json.loads(body or b'{}')
+                with self.server.lock:
+                    self.server.published.append(('POST', path, data))
+                    self.server.counts['inline'] += len(data.get('comments') or [])
+                if 'inline' in data:
+                    self.server.record('inline')
+                else:
+                    self.server.record('comment', (provider, match.group(1), int(match.group(2))))
+                return self._send(200 if pattern is self.GITHUB_REVIEW else 201, {'id': next(self.server.comment_ids)})
+
+        self._send(404, {'message': 'Not Found'})
+
+    def do_PUT(self):
+        path = self.path.split('?', 1)[0]
+        body = self._read_body()
+        for provider, pattern in (('github', self.GITHUB_REVIEW_EDIT), ('bitbucket', self.BITBUCKET_COMMENT_EDIT)):
+            match = pattern.match(path)
+            if match:
+                self._sleep(self.server.provider_latency_ms)
+                data = json.loads(body or b'{}')
+                with self.server.lock:
+                    self.server.published.append(('PUT', path, data))
+                # An edited review lands like a posted one, for replay latency
+                self.server.record('edit', (provider, match.group(1), int(match.group(2))))
+                return self._send(200, {'id': int(match.group(3))})
+
+        self._send(404, {'message': 'Not Found'})
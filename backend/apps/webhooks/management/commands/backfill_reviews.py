@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.repos.models import Repository
+from apps.webhooks import batch_review, provider_budget
+
+
+class Command(BaseCommand):
+    help = (
+        "Review a repository's existing pull requests through message batches; "
+        'results are imported by the poll-review-batches beat task (or --wait)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('full_name', help='Repository, e.g. octo/repo')
+        parser.add_argument('--state', choices=('open', 'closed', 'all'), default='all',
+                            help='Pull requests to include (default: all)')
+        parser.add_argument('--limit', type=int, help='Newest pull requests to include (default: every one)')
+        parser.add_argument('--wait', action='store_true',
+                            help='Poll until the submitted batches are imported')
+        parser.add_argument('--poll-seconds', type=float, default=60,
+                            help='Poll interval with --wait (default: 60)')
+
+    def handle(self, *args, **options):
+        repository = Repository.objects.filter(full_name=options['full_name']).first()
+        if repository is None:
+            raise CommandError(f"Unknown repository: {options['full_name']}")
+
+        try:
+            batches = batch_review.backfill_repository(repository, state=options['state'], limit=options['limit'])
+        except provider_budget.BudgetExhausted as e:
+            raise CommandError(f"Provider budget too low to list pull requests: {str(e)}")
+        for batch in batches:
+            self.stdout.write(f"Batch {batch.batch_id or batch.pk}: {batch.request_count} requests, {batch.status}")
+        if not batches:
+            self.stdout.write('Nothing to review')
+
+        while options['wait'] and any(batch.status == 'submitted' for batch in batches):
+            time.sleep(options['poll_seconds'])
+            batch_review.poll_batches()
+            for batch in batches:
+                batch.refresh_from_db()
+
+        for batch in batches:
+            if batch.status == 'imported':
+                self.stdout.write(f"Batch {batch.batch_id or batch.pk}: imported")
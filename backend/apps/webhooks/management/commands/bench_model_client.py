@@ -0,0 +1,90 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import anthropic
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from apps.webhooks import ai_analyzer, llm
+from apps.webhooks.loadtest import ProviderStub
+
+
+def fresh_client_review(base_url, prompts, limit):
+    """What analyze_pr_with_ai used to do: a new client (and connection pool) per review"""
+    client = anthropic.Anthropic(api_key='bench', base_url=base_url)
+    try:
+        with ThreadPoolExecutor(max_workers=limit) as pool:
+            return list(pool.map(lambda prompt: ai_analyzer.analyze_chunk(client, prompt), prompts))
+    finally:
+        client.close()
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark reviews/sec for a client per review, the shared sync client and the '
+        'shared async client against a local fake model server'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reviews', type=int, default=200,
+                            help='Reviews per mode (default: 200)')
+        parser.add_argument('--chunks', type=int, default=4,
+                            help='Model calls per review (default: 4)')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Reviews running at once, like worker threads (default: 8)')
+        parser.add_argument('--latency-ms', type=int, default=50,
+                            help='Mean fake model latency (default: 50)')
+        parser.add_argument('--max-inflight', type=int, default=32,
+                            help='AI_MAX_INFLIGHT_PER_WORKER for the async mode (default: 32)')
+
+    def handle(self, *args, **options):
+        stub = ProviderStub(llm_latency_ms=options['latency_ms'])
+        stub.start()
+        prompts = [f'chunk {i}' for i in range(options['chunks'])]
+        limit = options['chunks']
+
+        modes = [
+            ('client per review', lambda: fresh_client_review(stub.url, prompts, limit), False),
+            ('shared sync client', lambda: ai_analyzer.run_model_calls(prompts), False),
+            ('shared async client', lambda: ai_analyzer.run_model_calls(prompts), True),
+        ]
+
+        self.stdout.write(f"{'mode':<22} {'reviews/s':>10} {'p50 ms':>8} {'failed':>7}")
+        try:
+            for label, review, async_calls in modes:
+                with override_settings(
+                    ANTHROPIC_API_KEY='bench',
+                    ANTHROPIC_BASE_URL=stub.url,
+                    AI_ASYNC_CALLS=async_calls,
+                    AI_MAX_PARALLEL_CALLS=limit,
+                    AI_MAX_INFLIGHT_PER_WORKER=options['max_inflight'],
+                ):
+                    self.run_mode(label, review, options)
+                llm.registry.reset()
+                llm.runner.reset()
+        finally:
+            stub.shutdown()
+
+    def run_mode(self, label, review, options):
+        review()  # warm up
+
+        durations = []
+        failed = 0
+
+        def timed():
+            start = time.perf_counter()
+            results = review()
+            durations.append(time.perf_counter() - start)
+            return sum(1 for r in results if r is None)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            for count in pool.map(lambda _: timed(), range(options['reviews'])):
+                failed += count
+        elapsed = time.perf_counter() - start
+
+        durations.sort()
+        self.stdout.write(
+            f"{label:<22} {options['reviews'] / elapsed:>10.1f} "
+            f"{durations[len(durations) // 2] * 1000:>8.1f} {failed:>7}"
+        )
@@ -0,0 +1,118 @@
+import json
+import random
+import re
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.webhooks.response_parser import parse_ai_response
+
+
+def legacy_parse(text):
+    """What parse_ai_response used to do: strip fences, json.loads, else a placeholder"""
+    try:
+        return json.loads(text.replace('```json', '').replace('```', '').strip())
+    except Exception:
+        return {'summary': text[:500], 'riskScore': 50, 'issues': []}
+
+
+def build_reply(rng, issues):
+    return {
+        'summary': 'Reviewed the change. ' * rng.randint(1, 5),
+        'riskScore': rng.randint(0, 100),
+        'issues': [
+            {
+                'severity': rng.choice(['high', 'medium', 'low']),
+                'title': f'Issue {i}: ' + 'detail ' * rng.randint(3, 15),
+                'file': f'src/module_{i}.py',
+                'line': rng.randint(1, 500),
+                'suggestion': 'Do this instead. ' * rng.randint(1, 4),
+            }
+            for i in range(issues)
+        ],
+        'recommendations': ['Add tests'],
+        'blockers': [],
+        'deploymentReady': rng.random() < 0.5,
+    }
+
+
+def fenced(reply):
+    return 'Here is the review:\n```json\n' + json.dumps(reply, indent=2) + '\n```\nLet me know!'
+
+
+def trailing_commas(reply):
+    return re.sub(r'(["\d\]}e])(\n\s*[\]}])', r'\1,\2', json.dumps(reply, indent=2))
+
+
+def truncated(reply, rng):
+    text = json.dumps(reply, indent=2)
+    return text[:rng.randint(len(text) // 3, len(text) - 1)]
+
+
+def loose_fields(reply):
+    reply = json.loads(json.dumps(reply))
+    for issue in reply['issues']:
+        issue['severity'] = issue['severity'].upper()
+        issue['line'] = f"L{issue['line']}"
+    reply['riskScore'] = f"{reply['riskScore']}/100"
+    return json.dumps(reply)
+
+
+def build_corpus(rng, count):
+    """{kind: [(reply text, complete issue titles)]}"""
+    corpus = {kind: [] for kind in ('valid', 'fenced', 'trailing commas', 'truncated', 'loose fields')}
+    for _ in range(count):
+        reply = build_reply(rng, rng.randint(1, 12))
+        titles = [i['title'] for i in reply['issues']]
+        corpus['valid'].append((json.dumps(reply), titles))
+        corpus['fenced'].append((fenced(reply), titles))
+        corpus['trailing commas'].append((trailing_commas(reply), titles))
+
+        text = truncated(reply, rng)
+        # Only issues whose closing brace made it can be recovered
+        complete = [t for t in titles if json.dumps(t) in text and text.find('}', text.find(json.dumps(t))) != -1]
+        corpus['truncated'].append((text, complete))
+        corpus['loose fields'].append((loose_fields(reply), titles))
+    return corpus
+
+
+def recovered(analysis, titles):
+    """Share of expected issues present with usable severity and line"""
+    if not titles:
+        return 1.0
+    found = {
+        issue.get('title') for issue in analysis.get('issues') or []
+        if isinstance(issue, dict)
+        and issue.get('severity') in ('high', 'medium', 'low')
+        and isinstance(issue.get('line'), int)
+    }
+    return sum(1 for t in titles if t in found) / len(titles)
+
+
+class Command(BaseCommand):
+    help = 'Compare the tolerant response parser with the old json.loads-only parser on malformed replies'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--replies', type=int, default=300,
+                            help='Replies per kind (default: 300)')
+        parser.add_argument('--seed', type=int, default=7)
+
+    def handle(self, *args, **options):
+        corpus = build_corpus(random.Random(options['seed']), options['replies'])
+
+        self.stdout.write(
+            f"{'kind':<16} {'old recovery':>13} {'new recovery':>13} {'old µs':>8} {'new µs':>8}"
+        )
+        for kind, replies in corpus.items():
+            row = []
+            for parse in (legacy_parse, parse_ai_response):
+                start = time.perf_counter()
+                results = [parse(text) for text, _ in replies]
+                elapsed = time.perf_counter() - start
+                rate = sum(recovered(r, titles) for r, (_, titles) in zip(results, replies)) / len(replies)
+                row.append((rate, elapsed / len(replies) * 1e6))
+
+            (old_rate, old_us), (new_rate, new_us) = row
+            self.stdout.write(
+                f"{kind:<16} {old_rate:>12.1%} {new_rate:>12.1%} {old_us:>8.1f} {new_us:>8.1f}"
+            )
@@ -0,0 +1,200 @@
+import json
+import logging
+import os
+import random
+import resource
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from apps.auth_app.models import UserProfile
+from apps.repos.models import Repository
+from apps.webhooks import ai_analyzer, llm
+from apps.webhooks.loadtest import add_stub_arguments, percentile, stub_from_options, synthetic_diff
+from pitcrew.celery import app as celery_app
+
+BENCH_REPOSITORY = 'bench/repo'
+
+
+def peak_rss_mb():
+    """High-water resident set size of this process (ru_maxrss is in KB on Linux)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def pull_request_payload(number):
+    return {
+        'action': 'opened',
+        'number': number,
+        'pull_request': {
+            'number': number,
+            'title': f'Benchmark change {number}',
+            'body': 'Synthetic pull request',
+            'state': 'open',
+            'html_url': f'https://github.com/{BENCH_REPOSITORY}/pull/{number}',
+            'user': {'login': 'bench'},
+            'head': {'ref': f'feature-{number}', 'sha': uuid.uuid4().hex + '0' * 8},
+            'base': {'ref': 'main', 'sha': 'b' * 40},
+        },
+        'repository': {'full_name': BENCH_REPOSITORY},
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark analyze_pr_with_ai and the full webhook-to-comment pipeline against the '
+        'local fake model server; reports reviews/sec, latency percentiles and peak RSS'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=('analyzer', 'pipeline', 'both'), default='both',
+                            help='What to drive (default: both)')
+        parser.add_argument('--reviews', type=int, default=100,
+                            help='Reviews per mode (default: 100)')
+        parser.add_argument('--concurrency', type=int, default=4,
+                            help='Reviews running at once, like worker threads (default: 4)')
+        parser.add_argument('--files', type=int, default=8,
+                            help='Files per synthetic diff (default: 8)')
+        parser.add_argument('--hunks', type=int, default=3,
+                            help='Hunks per file (default: 3)')
+        parser.add_argument('--lines', type=int, default=12,
+                            help='Added lines per hunk (default: 12)')
+        parser.add_argument('--async-calls', action='store_true',
+                            help='Run model calls through the shared async client (AI_ASYNC_CALLS)')
+        parser.add_argument('--no-prompt-cache', action='store_true',
+                            help='Send the review instructions without a prompt-cache marker (AI_PROMPT_CACHE)')
+        add_stub_arguments(parser)
+
+    def handle(self, *args, **options):
+        # Per-request INFO logging would dominate the measurement
+        logging.disable(logging.INFO)
+        rng = random.Random(options['seed'])
+        stub = stub_from_options(options)
+        stub.start()
+
+        try:
+            with override_settings(
+                ANTHROPIC_API_KEY='bench',
+                ANTHROPIC_BASE_URL=stub.url,
+                GITHUB_API_URL=stub.url,
+                AI_ASYNC_CALLS=options['async_calls'],
+                AI_PROMPT_CACHE=not options['no_prompt_cache'],
+                REVIEW_CACHE_BACKEND='',
+                REVIEW_DEBOUNCE_SECONDS=0,
+            ):
+                self.stdout.write(
+                    f"{'mode':<10} {'reviews/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'failed':>7} "
+                    f"{'incomplete':>11} {'peak RSS MB':>12} {'RSS +MB':>8}"
+                )
+                if options['mode'] in ('analyzer', 'both'):
+                    diffs = [
+                        synthetic_diff(rng, options['files'], options['hunks'], options['lines'])
+                        for _ in range(options['reviews'] + 1)
+                    ]
+                    self.bench('analyzer', self.analyzer_review(diffs), options)
+                if options['mode'] in ('pipeline', 'both'):
+                    stub.diff_text = synthetic_diff(rng, options['files'], options['hunks'], options['lines'])
+                    self.bench_pipeline(stub, options)
+        finally:
+            logging.disable(logging.NOTSET)
+            stub.shutdown()
+            llm.registry.reset()
+            llm.runner.reset()
+
+        with stub.lock:
+            self.stdout.write(f"Stub calls: {stub.counts} tokens: {stub.tokens}")
+
+    def analyzer_review(self, diffs):
+        pr_data = {'title': 'Benchmark change', 'description': 'Synthetic pull request'}
+
+        def review(i):
+            analysis = ai_analyzer.analyze_pr_with_ai(pr_data, diffs[i])
+            return True, bool(analysis.get('incomplete'))
+
+        return review
+
+    def bench_pipeline(self, stub, options):
+        """
+        Post webhooks through the real view into a throwaway database
+
+        Celery runs eagerly, so each POST drains the inbox, runs the
+        scheduled review and posts the comment before returning. As with
+        ``manage.py testserver``, the database is created for the run and
+        destroyed afterwards.
+        """
+        old_name = connection.settings_dict['NAME']
+        directory = tempfile.mkdtemp(prefix='pitcrew-bench-')
+        connection.settings_dict['TEST']['NAME'] = os.path.join(directory, 'bench.sqlite3')
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        always_eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+
+        try:
+            owner = User.objects.create_user(username='bench')
+            UserProfile.objects.filter(user=owner).update(provider='github', access_token='bench-token')
+            Repository.objects.create(
+                owner=owner, provider='github', full_name=BENCH_REPOSITORY, name='repo',
+                url=f'https://github.com/{BENCH_REPOSITORY}',
+            )
+
+            if connection.vendor == 'sqlite' and options['concurrency'] > 1:
+                # SQLite fails concurrent writers with "database is locked" instead of queueing them
+                self.stdout.write(self.style.WARNING('SQLite database: running pipeline reviews one at a time'))
+                options = dict(options, concurrency=1)
+
+            url = reverse('webhooks:github_webhook')
+            comments_before = stub.counts['comment']
+
+            def review(i):
+                response = Client().post(
+                    url, data=json.dumps(pull_request_payload(i + 1)), content_type='application/json',
+                    HTTP_X_GITHUB_EVENT='pull_request', HTTP_X_GITHUB_DELIVERY=str(uuid.uuid4()),
+                )
+                connection.close()
+                return response.status_code == 202, False
+
+            self.bench('pipeline', review, options)
+            missing = options['reviews'] + 1 - (stub.counts['comment'] - comments_before)
+            if missing:
+                self.stdout.write(self.style.WARNING(f"{missing} pipeline review(s) posted no comment"))
+        finally:
+            celery_app.conf.task_always_eager = always_eager
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            os.rmdir(directory)
+
+    def bench(self, label, review, options):
+        review(options['reviews'])  # warm up connections and imports, on an extra index
+        rss_before = peak_rss_mb()
+
+        durations = []
+        failed = incomplete = 0
+
+        def timed(i):
+            start = time.perf_counter()
+            try:
+                ok, partial = review(i)
+            except Exception as e:
+                self.stderr.write(f"{label} review {i} failed: {e}")
+                ok, partial = False, False
+            durations.append(time.perf_counter() - start)
+            return ok, partial
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            for ok, partial in pool.map(timed, range(options['reviews'])):
+                failed += not ok
+                incomplete += partial
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(
+            f"{label:<10} {options['reviews'] / elapsed:>10.1f} "
+            f"{percentile(durations, 50) * 1000:>8.1f} {percentile(durations, 99) * 1000:>8.1f} "
+            f"{failed:>7} {incomplete:>11} {peak_rss_mb():>12.1f} {peak_rss_mb() - rss_before:>8.1f}"
+        )
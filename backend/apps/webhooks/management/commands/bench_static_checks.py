@@ -0,0 +1,49 @@
+import logging
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.webhooks import static_checks
+from apps.webhooks.diffs import parse_diff
+from apps.webhooks.loadtest import synthetic_diff
+
+
+class Command(BaseCommand):
+    help = 'Measure static check throughput in added lines per second, in-process and in a process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--files', type=int, default=200,
+                            help='Files in the synthetic diff (default: 200)')
+        parser.add_argument('--hunks', type=int, default=10,
+                            help='Hunks per file (default: 10)')
+        parser.add_argument('--lines', type=int, default=25,
+                            help='Added lines per hunk (default: 25)')
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4],
+                            help='Pool sizes to compare; 1 is in-process (default: 1 2 4)')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Runs per pool size; the best is reported (default: 3)')
+        parser.add_argument('--seed', type=int, default=7)
+
+    def handle(self, *args, **options):
+        logging.disable(logging.INFO)
+        rng = random.Random(options['seed'])
+        files = parse_diff(synthetic_diff(rng, options['files'], options['hunks'], options['lines']))
+        added = sum(f.additions for f in files)
+        self.stdout.write(f"{len(files)} files, {added} added lines")
+        self.stdout.write(f"{'workers':>8} {'lines/s':>12} {'ms':>8} {'findings':>9}")
+
+        try:
+            for workers in options['workers']:
+                # Start the pool before timing; a worker keeps it for its lifetime
+                static_checks.check_files(files[:1], workers=workers, min_parallel_lines=0)
+                best = None
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    found = static_checks.check_files(files, workers=workers, min_parallel_lines=0)
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                self.stdout.write(f"{workers:>8} {added / best:>12,.0f} {best * 1000:>8.1f} {len(found):>9}")
+        finally:
+            logging.disable(logging.NOTSET)
+            static_checks.pools.reset()
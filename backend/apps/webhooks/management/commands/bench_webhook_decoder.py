@@ -0,0 +1,122 @@
+import io
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.parsers import JSONParser
+
+from apps.webhooks import payloads
+
+
+def build_github_payload(target_kb):
+    """Synthetic pull_request payload padded with the kind of bulk GitHub sends"""
+    def account(login):
+        return {
+            'login': login,
+            'id': 1,
+            'node_id': 'MDQ6VXNlcjE=',
+            'avatar_url': f'https://avatars.githubusercontent.com/u/1?v=4&{login}',
+            'url': f'https://api.github.com/users/{login}',
+            'html_url': f'https://github.com/{login}',
+            'followers_url': f'https://api.github.com/users/{login}/followers',
+            'repos_url': f'https://api.github.com/users/{login}/repos',
+            'type': 'User',
+            'site_admin': False,
+        }
+
+    def repository():
+        repo = {
+            'id': 123,
+            'full_name': 'octo/repo',
+            'private': False,
+            'owner': account('octo'),
+            'description': 'x' * 200,
+            'topics': ['python', 'django', 'reviews'],
+        }
+        for i in range(60):
+            repo[f'endpoint_{i}_url'] = f'https://api.github.com/repos/octo/repo/endpoint/{i}{{/id}}'
+        return repo
+
+    payload = {
+        'action': 'synchronize',
+        'number': 42,
+        'pull_request': {
+            'number': 42,
+            'title': 'Refactor the review pipeline',
+            'body': 'Long description. ' * 50,
+            'state': 'open',
+            'draft': False,
+            'merged': False,
+            'html_url': 'https://github.com/octo/repo/pull/42',
+            'user': account('octocat'),
+            'head': {'ref': 'feature', 'sha': 'a' * 40, 'repo': repository(), 'user': account('octo')},
+            'base': {'ref': 'main', 'sha': 'b' * 40, 'repo': repository(), 'user': account('octo')},
+            'labels': [{'id': i, 'name': f'label-{i}', 'color': 'ededed'} for i in range(20)],
+            'requested_reviewers': [account(f'reviewer{i}') for i in range(10)],
+        },
+        'repository': repository(),
+        'sender': account('octocat'),
+    }
+
+    # Pad with extra repository-like objects until the body reaches the target size
+    padding = []
+    payload['installation'] = {'id': 1, 'extra': padding}
+    while len(json.dumps(payload)) < target_kb * 1024:
+        padding.append(repository())
+    return json.dumps(payload).encode()
+
+
+def drf_path(body):
+    """What the webhook view used to do: DRF JSONParser to a dict, then pick fields"""
+    data = JSONParser().parse(io.BytesIO(body))
+    pr = data.get('pull_request') or {}
+    return {
+        'full_name': (data.get('repository') or {}).get('full_name'),
+        'number': pr.get('number'),
+        'title': pr.get('title') or '',
+        'description': pr.get('body') or '',
+        'author': (pr.get('user') or {}).get('login', ''),
+        'state': pr.get('state'),
+        'source_branch': (pr.get('head') or {}).get('ref', ''),
+        'target_branch': (pr.get('base') or {}).get('ref', ''),
+        'url': pr.get('html_url', ''),
+        'head_sha': (pr.get('head') or {}).get('sha', ''),
+    }
+
+
+def fast_path(body):
+    return payloads.decode_github_pull_request(body)
+
+
+class Command(BaseCommand):
+    help = 'Micro-benchmark the typed webhook decoder against the DRF JSONParser path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='50,100,200',
+                            help='Comma-separated payload sizes in KB (default: 50,100,200)')
+        parser.add_argument('--iterations', type=int, default=200,
+                            help='Decodes per path and size (default: 200)')
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+
+        self.stdout.write(f"{'size':>8} {'drf µs':>10} {'typed µs':>10} {'speedup':>8}")
+        for size in [int(s) for s in options['sizes'].split(',')]:
+            body = build_github_payload(size)
+
+            slow = drf_path(body)
+            fast = fast_path(body)
+            assert fast.pr_number == slow['number'] and fast.fields['head_sha'] == slow['head_sha']
+
+            results = []
+            for func in (drf_path, fast_path):
+                func(body)  # warm up
+                start = time.perf_counter()
+                for _ in range(iterations):
+                    func(body)
+                results.append((time.perf_counter() - start) / iterations * 1e6)
+
+            self.stdout.write(
+                f"{len(body) // 1024:>6}KB {results[0]:>10.1f} {results[1]:>10.1f} "
+                f"{results[0] / results[1]:>7.1f}x"
+            )
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.webhooks.loadtest import STUB_DIFF, add_stub_arguments, stub_from_options
+
+
+class Command(BaseCommand):
+    help = 'Serve a local fake of the Anthropic Messages API (and the provider endpoints) for load tests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help='Interface to bind (default: 127.0.0.1)')
+        parser.add_argument('--port', type=int, default=8765, help='Port to listen on (default: 8765)')
+        parser.add_argument('--diff-file', help='Diff served for every pull request (default: a small stub diff)')
+        add_stub_arguments(parser)
+
+    def handle(self, *args, **options):
+        diff_text = STUB_DIFF
+        if options['diff_file']:
+            with open(options['diff_file']) as f:
+                diff_text = f.read()
+
+        stub = stub_from_options(options, (options['host'], options['port']), diff_text=diff_text)
+        stub.start()
+        self.stdout.write(
+            f"Fake model server listening on {stub.url}; point the app and workers at it with\n"
+            f"  ANTHROPIC_BASE_URL={stub.url} ANTHROPIC_API_KEY=fake "
+            f"GITHUB_API_URL={stub.url} BITBUCKET_API_URL={stub.url}/2.0"
+        )
+
+        try:
+            while True:
+                time.sleep(10)
+                with stub.lock:
+                    counts, tokens = dict(stub.counts), dict(stub.tokens)
+                self.stdout.write(f"calls: {counts} tokens: {tokens}")
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stub.shutdown()
@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.webhooks.loadtest import SegmentWriter, delivery_record
+from apps.webhooks.models import WebhookDelivery
+
+
+class Command(BaseCommand):
+    help = 'Record webhook deliveries (headers + raw body) from the inbox to compressed segment files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output_dir', help='Directory for webhooks-NNNNNN.jsonl.gz segments')
+        parser.add_argument('--since-id', type=int, default=0,
+                            help='Only record deliveries with id > this value')
+        parser.add_argument('--provider', choices=['github', 'bitbucket'],
+                            help='Only record deliveries from this provider')
+        parser.add_argument('--segment-mb', type=int, default=64,
+                            help='Roll to a new segment after this many uncompressed MB (default: 64)')
+        parser.add_argument('--follow', action='store_true',
+                            help='Keep polling for new deliveries until interrupted')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds between polls in --follow mode (default: 1.0)')
+
+    def handle(self, *args, **options):
+        last_id = options['since_id']
+        recorded = 0
+
+        with SegmentWriter(options['output_dir'], options['segment_mb'] * 1024 * 1024) as writer:
+            try:
+                while True:
+                    queryset = WebhookDelivery.objects.filter(id__gt=last_id).order_by('id')
+                    if options['provider']:
+                        queryset = queryset.filter(provider=options['provider'])
+
+                    batch = list(queryset[:500])
+                    for delivery in batch:
+                        writer.write(delivery_record(delivery))
+                        last_id = delivery.pk
+                    recorded += len(batch)
+                    writer.flush()
+
+                    if len(batch) < 500:
+                        if not options['follow']:
+                            break
+                        time.sleep(options['poll_interval'])
+            except KeyboardInterrupt:
+                pass
+
+        self.stdout.write(self.style.SUCCESS(f'Recorded {recorded} deliveries (last id {last_id})'))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from apps.webhooks import inbox
+from apps.webhooks.models import WebhookDelivery
+
+
+class Command(BaseCommand):
+    help = 'Re-queue webhook inbox deliveries for processing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--status', default='failed',
+                            help='Re-drive deliveries in this status (default: failed)')
+        parser.add_argument('--provider', choices=['github', 'bitbucket'],
+                            help='Only re-drive deliveries from this provider')
+        parser.add_argument('--since-id', type=int,
+                            help='Only re-drive deliveries with id >= this value')
+        parser.add_argument('--no-enqueue', action='store_true',
+                            help='Reset rows without enqueueing a drain task')
+
+    def handle(self, *args, **options):
+        queryset = WebhookDelivery.objects.filter(status=options['status'])
+        if options['provider']:
+            queryset = queryset.filter(provider=options['provider'])
+        if options['since_id']:
+            queryset = queryset.filter(id__gte=options['since_id'])
+
+        count = inbox.redrive(queryset)
+        if count and not options['no_enqueue']:
+            inbox.enqueue_drain()
+
+        self.stdout.write(self.style.SUCCESS(f'Re-queued {count} webhook deliveries'))
@@ -0,0 +1,165 @@
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.webhooks import payloads
+from apps.webhooks.loadtest import add_stub_arguments, iter_segments, percentile, stub_from_options
+
+WEBHOOK_PATHS = {
+    'github': '/api/webhooks/github/',
+    'bitbucket': '/api/webhooks/bitbucket/',
+}
+DELIVERY_ID_HEADERS = {
+    'github': 'X-GitHub-Delivery',
+    'bitbucket': 'X-Request-UUID',
+}
+
+
+def review_key(record):
+    """(provider, full_name, pr_number) for deliveries expected to produce a review"""
+    try:
+        if record['provider'] == 'github' and record['event'] == 'pull_request':
+            event = payloads.decode_github_pull_request(record['body'])
+        elif record['provider'] == 'bitbucket' and record['event'].startswith('pullrequest:'):
+            event = payloads.decode_bitbucket_pull_request(record['event'], record['body'])
+        else:
+            return None
+    except payloads.DECODE_ERRORS:
+        return None
+    return (event.provider, event.full_name, event.pr_number) if event.should_review else None
+
+
+class Command(BaseCommand):
+    help = 'Replay recorded webhook deliveries against the webhook endpoints and report latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input_dir', help='Directory holding recorded segments')
+        parser.add_argument('--target', default='http://127.0.0.1:8000',
+                            help='Base URL of the API under test (default: http://127.0.0.1:8000)')
+        parser.add_argument('--rate', type=float,
+                            help='Send at a fixed rate in requests/sec instead of the recorded timing')
+        parser.add_argument('--speed', type=float, default=1.0,
+                            help='Time-warp factor for recorded timing; 0 sends as fast as possible (default: 1.0)')
+        parser.add_argument('--concurrency', type=int, default=16,
+                            help='Maximum requests in flight (default: 16)')
+        parser.add_argument('--limit', type=int, help='Replay at most this many deliveries')
+        parser.add_argument('--keep-ids', action='store_true',
+                            help='Keep recorded delivery ids (duplicates are then dropped by the target)')
+        parser.add_argument('--stub-port', type=int,
+                            help='Run the LLM/provider stub on this port to measure end-to-end review latency')
+        parser.add_argument('--wait', type=float, default=120.0,
+                            help='Seconds to wait for review comments after the last send (default: 120)')
+        add_stub_arguments(parser)
+
+    def handle(self, *args, **options):
+        records = list(iter_segments(options['input_dir']))
+        if options['limit']:
+            records = records[:options['limit']]
+        if not records:
+            raise CommandError(f"No recorded deliveries in {options['input_dir']}")
+
+        stub = None
+        if options['stub_port']:
+            stub = stub_from_options(options, ('127.0.0.1', options['stub_port']))
+            stub.start()
+            self.stdout.write(
+                f"Stub listening on {stub.url}; run the app and workers with "
+                f"ANTHROPIC_BASE_URL={stub.url} GITHUB_API_URL={stub.url} "
+                f"BITBUCKET_API_URL={stub.url}/2.0"
+            )
+
+        offsets = self.schedule(records, options)
+        ingest_latencies = []
+        statuses = Counter()
+        last_sent = {}  # review key -> monotonic time of the latest accepted delivery
+        lock = threading.Lock()
+        local = threading.local()
+
+        def send(record):
+            if not hasattr(local, 'session'):
+                local.session = requests.Session()
+            headers = {k: v for k, v in record['headers'].items() if k.lower() != 'content-length'}
+            if not options['keep_ids']:
+                headers[DELIVERY_ID_HEADERS[record['provider']]] = str(uuid.uuid4())
+
+            start = time.monotonic()
+            try:
+                response = local.session.post(
+                    options['target'].rstrip('/') + WEBHOOK_PATHS[record['provider']],
+                    data=record['body'], headers=headers, timeout=30
+                )
+                status = response.status_code
+            except requests.RequestException:
+                status = 'error'
+            end = time.monotonic()
+
+            key = review_key(record)
+            with lock:
+                ingest_latencies.append(end - start)
+                statuses[status] += 1
+                if key and status == 202:
+                    last_sent[key] = end
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            for record, offset in zip(records, offsets):
+                delay = started + offset - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(send, record)
+        elapsed = time.monotonic() - started
+
+        self.stdout.write(f"Sent {len(records)} deliveries in {elapsed:.2f}s "
+                          f"({len(records) / elapsed if elapsed else 0:.1f} req/s)")
+        self.stdout.write(f"Status codes: {dict(statuses)}")
+        self.report('Ingest latency', ingest_latencies)
+
+        if stub:
+            self.report('End-to-end review latency', self.wait_for_reviews(stub, last_sent, options['wait']))
+            self.stdout.write(f"Stub calls: {stub.counts}")
+            stub.shutdown()
+
+    def schedule(self, records, options):
+        """Send offset in seconds for every record"""
+        if options['rate']:
+            return [i / options['rate'] for i in range(len(records))]
+        if not options['speed']:
+            return [0.0] * len(records)
+        first = records[0]['received_at']
+        return [max(0.0, (r['received_at'] - first) / options['speed']) for r in records]
+
+    def wait_for_reviews(self, stub, last_sent, timeout):
+        """Latency from each PR's last accepted delivery to the first comment posted after it"""
+        deadline = time.monotonic() + timeout
+        latencies = {}
+        while time.monotonic() < deadline and len(latencies) < len(last_sent):
+            with stub.lock:
+                comments = list(stub.comments)
+            for posted_at, provider, full_name, pr_number in comments:
+                key = (provider, full_name, pr_number)
+                if key in last_sent and key not in latencies and posted_at >= last_sent[key]:
+                    latencies[key] = posted_at - last_sent[key]
+            time.sleep(0.2)
+
+        if len(latencies) < len(last_sent):
+            self.stdout.write(self.style.WARNING(
+                f"{len(last_sent) - len(latencies)} of {len(last_sent)} reviews did not complete within {timeout}s"
+            ))
+        return list(latencies.values())
+
+    def report(self, label, values):
+        if not values:
+            self.stdout.write(f"{label}: no samples")
+            return
+        self.stdout.write(
+            f"{label} (n={len(values)}): "
+            f"p50={percentile(values, 50) * 1000:.1f}ms "
+            f"p95={percentile(values, 95) * 1000:.1f}ms "
+            f"p99={percentile(values, 99) * 1000:.1f}ms "
+            f"max={max(values) * 1000:.1f}ms"
+        )
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(choices=[('github', 'GitHub'), ('bitbucket', 'Bitbucket')], max_length=20)),
+                ('event', models.CharField(max_length=100)),
+                ('delivery_id', models.CharField(blank=True, default='', max_length=255)),
+                ('headers', models.JSONField(default=dict)),
+                ('payload', models.BinaryField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('processed', 'Processed'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('attempts', models.IntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'webhook_deliveries',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['status', 'id'], name='webhook_del_status_cb574f_idx'), models.Index(fields=['provider', 'event'], name='webhook_del_provide_7bed26_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webhooks', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='webhookdelivery',
+            constraint=models.UniqueConstraint(condition=models.Q(('delivery_id', ''), _negated=True), fields=('provider', 'delivery_id'), name='unique_webhook_delivery_id'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0002_pullrequest_head_sha'),
+        ('webhooks', '0002_webhookdelivery_unique_delivery_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduledReview',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('head_sha', models.CharField(blank=True, default='', max_length=64)),
+                ('generation', models.IntegerField(default=1)),
+                ('due_at', models.DateTimeField()),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('pull_request', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='scheduled_review', to='reviews.pullrequest')),
+            ],
+            options={
+                'db_table': 'scheduled_reviews',
+                'indexes': [models.Index(fields=['due_at'], name='scheduled_r_due_at_b87413_idx')],
+            },
+        ),
+    ]
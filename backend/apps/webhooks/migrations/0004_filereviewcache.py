@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webhooks', '0003_scheduledreview'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileReviewCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('data', models.JSONField(default=dict)),
+                ('last_used_at', models.DateTimeField(auto_now=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'file_review_cache',
+                'indexes': [models.Index(fields=['last_used_at'], name='file_review_last_us_1ef03b_idx')],
+            },
+        ),
+    ]
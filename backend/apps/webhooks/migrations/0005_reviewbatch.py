@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0004_review_status_provisional_issues'),
+        ('webhooks', '0004_filereviewcache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch_id', models.CharField(blank=True, default='', max_length=100)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('submitted', 'Submitted'), ('imported', 'Imported'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('request_count', models.IntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('submitted_at', models.DateTimeField(blank=True, null=True)),
+                ('ended_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'review_batches',
+            },
+        ),
+        migrations.CreateModel(
+            name='ReviewBatchItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('head_sha', models.CharField(blank=True, default='', max_length=64)),
+                ('plan', models.JSONField(default=dict)),
+                ('batch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='webhooks.reviewbatch')),
+                ('pull_request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='review_batch_items', to='reviews.pullrequest')),
+            ],
+            options={
+                'db_table': 'review_batch_items',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='reviewbatch',
+            index=models.Index(fields=['status'], name='review_batc_status_8a033d_idx'),
+        ),
+    ]
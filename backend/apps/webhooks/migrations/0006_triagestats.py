@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repos', '0002_rename_user_repository_owner_and_more'),
+        ('webhooks', '0005_reviewbatch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TriageStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('files_skipped', models.BigIntegerField(default=0)),
+                ('bytes_skipped', models.BigIntegerField(default=0)),
+                ('tokens_skipped', models.BigIntegerField(default=0)),
+                ('reviews_skipped', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('repository', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='triage_stats', to='repos.repository')),
+            ],
+            options={
+                'db_table': 'triage_stats',
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webhooks', '0006_triagestats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProviderApiStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('host', models.CharField(max_length=255, unique=True)),
+                ('requests', models.BigIntegerField(default=0)),
+                ('not_modified', models.BigIntegerField(default=0)),
+                ('rate_limit_remaining', models.IntegerField(blank=True, null=True)),
+                ('rate_limit_limit', models.IntegerField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'provider_api_stats',
+            },
+        ),
+        migrations.CreateModel(
+            name='ProviderResponseCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('etag', models.CharField(blank=True, max_length=255)),
+                ('last_modified', models.CharField(blank=True, max_length=64)),
+                ('content_type', models.CharField(blank=True, max_length=255)),
+                ('body', models.BinaryField()),
+                ('size', models.IntegerField(default=0)),
+                ('last_used_at', models.DateTimeField(auto_now=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'provider_response_cache',
+                'indexes': [models.Index(fields=['last_used_at'], name='provider_re_last_us_740145_idx')],
+            },
+        ),
+    ]
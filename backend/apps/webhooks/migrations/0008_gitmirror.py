@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repos', '0002_rename_user_repository_owner_and_more'),
+        ('webhooks', '0007_providerresponsecache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GitMirror',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('size_bytes', models.BigIntegerField(default=0)),
+                ('fetched_at', models.DateTimeField(blank=True, null=True)),
+                ('last_used_at', models.DateTimeField(auto_now=True)),
+                ('repository', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='git_mirror', to='repos.repository')),
+            ],
+            options={
+                'db_table': 'git_mirrors',
+                'indexes': [models.Index(fields=['last_used_at'], name='git_mirrors_last_us_e2c0d9_idx')],
+            },
+        ),
+    ]
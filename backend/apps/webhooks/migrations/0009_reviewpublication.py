@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0004_review_status_provisional_issues'),
+        ('webhooks', '0008_gitmirror'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewPublication',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('comment_id', models.CharField(max_length=64)),
+                ('inline_keys', models.JSONField(default=list)),
+                ('published_at', models.DateTimeField(auto_now=True)),
+                ('pull_request', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='review_publication', to='reviews.pullrequest')),
+            ],
+            options={
+                'db_table': 'review_publications',
+            },
+        ),
+    ]
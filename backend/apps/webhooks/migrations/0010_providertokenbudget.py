@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webhooks', '0009_reviewpublication'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProviderTokenBudget',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64, unique=True)),
+                ('host', models.CharField(max_length=255)),
+                ('remaining', models.IntegerField()),
+                ('limit', models.IntegerField()),
+                ('reset_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'provider_token_budgets',
+            },
+        ),
+    ]
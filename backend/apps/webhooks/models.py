@@ -1,3 +1,261 @@
 from django.db import models
+from apps.repos.models import Repository
+from apps.reviews.models import PullRequest
 
-# Create your models here.
+
+class WebhookDelivery(models.Model):
+    """Durable inbox entry holding one raw webhook delivery"""
+
+    PROVIDER_CHOICES = [
+        ('github', 'GitHub'),
+        ('bitbucket', 'Bitbucket'),
+    ]
+
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('processed', 'Processed'),
+        ('failed', 'Failed'),
+    ]
+
+    provider = models.CharField(max_length=20, choices=PROVIDER_CHOICES)
+    event = models.CharField(max_length=100)
+    delivery_id = models.CharField(max_length=255, blank=True, default='')
+    headers = models.JSONField(default=dict)
+    payload = models.BinaryField()  # Raw request body, exactly as signed
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    locked_at = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'webhook_deliveries'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'id']),
+            models.Index(fields=['provider', 'event']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['provider', 'delivery_id'],
+                condition=~models.Q(delivery_id=''),
+                name='unique_webhook_delivery_id',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.provider}:{self.event} #{self.pk} ({self.status})"
+
+
+class ScheduledReview(models.Model):
+    """Debounced review job for one pull request; each new head bumps the generation"""
+
+    pull_request = models.OneToOneField(
+        PullRequest,
+        on_delete=models.CASCADE,
+        related_name='scheduled_review'
+    )
+    head_sha = models.CharField(max_length=64, blank=True, default='')
+    generation = models.IntegerField(default=1)
+    due_at = models.DateTimeField()
+    started_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'scheduled_reviews'
+        indexes = [
+            models.Index(fields=['due_at']),
+        ]
+
+    def __str__(self):
+        return f"Review of PR #{self.pull_request.pr_number} @ {self.head_sha[:7]} (gen {self.generation})"
+
+
+class FileReviewCache(models.Model):
+    """Per-file analysis results keyed by a hash of the normalized file diff"""
+
+    key = models.CharField(max_length=64, unique=True)
+    data = models.JSONField(default=dict)
+    last_used_at = models.DateTimeField(auto_now=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'file_review_cache'
+        indexes = [
+            models.Index(fields=['last_used_at']),
+        ]
+
+    def __str__(self):
+        return self.key
+
+
+class ReviewBatch(models.Model):
+    """One provider message batch of backfill review requests"""
+
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('submitted', 'Submitted'),
+        ('imported', 'Imported'),
+        ('failed', 'Failed'),
+    ]
+
+    batch_id = models.CharField(max_length=100, blank=True, default='')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    request_count = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    submitted_at = models.DateTimeField(null=True, blank=True)
+    ended_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'review_batches'
+        indexes = [
+            models.Index(fields=['status']),
+        ]
+
+    def __str__(self):
+        return f"Review batch {self.batch_id or self.pk} ({self.status}, {self.request_count} requests)"
+
+
+class ReviewBatchItem(models.Model):
+    """One pull request in a ReviewBatch; its requests are ``item<pk>-<chunk index>``"""
+
+    batch = models.ForeignKey(
+        ReviewBatch,
+        on_delete=models.CASCADE,
+        related_name='items'
+    )
+    pull_request = models.ForeignKey(
+        PullRequest,
+        on_delete=models.CASCADE,
+        related_name='review_batch_items'
+    )
+    head_sha = models.CharField(max_length=64, blank=True, default='')
+    plan = models.JSONField(default=dict)  # ai_analyzer.ReviewPlan.to_dict()
+
+    class Meta:
+        db_table = 'review_batch_items'
+
+    def __str__(self):
+        return f"PR #{self.pull_request.pr_number} in batch {self.batch_id}"
+
+
+class TriageStats(models.Model):
+    """Per-repository totals of diff files skipped by triage before the model"""
+
+    repository = models.OneToOneField(
+        Repository,
+        on_delete=models.CASCADE,
+        related_name='triage_stats'
+    )
+    files_skipped = models.BigIntegerField(default=0)
+    bytes_skipped = models.BigIntegerField(default=0)
+    tokens_skipped = models.BigIntegerField(default=0)
+    reviews_skipped = models.IntegerField(default=0)  # completed without a model call
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'triage_stats'
+
+    def __str__(self):
+        return f"Triage for {self.repository.full_name}: {self.files_skipped} files, ~{self.tokens_skipped} tokens"
+
+
+class ProviderResponseCache(models.Model):
+    """Compressed provider API response bodies revalidated with ETag / Last-Modified"""
+
+    key = models.CharField(max_length=64, unique=True)  # URL, query, Accept and token
+    etag = models.CharField(max_length=255, blank=True)
+    last_modified = models.CharField(max_length=64, blank=True)
+    content_type = models.CharField(max_length=255, blank=True)
+    body = models.BinaryField()  # zlib
+    size = models.IntegerField(default=0)  # compressed bytes
+    last_used_at = models.DateTimeField(auto_now=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'provider_response_cache'
+        indexes = [
+            models.Index(fields=['last_used_at']),
+        ]
+
+    def __str__(self):
+        return self.key
+
+
+class ProviderApiStats(models.Model):
+    """Per-host provider API request counts and the last reported rate limit"""
+
+    host = models.CharField(max_length=255, unique=True)
+    requests = models.BigIntegerField(default=0)
+    not_modified = models.BigIntegerField(default=0)  # served from the response cache
+    rate_limit_remaining = models.IntegerField(null=True, blank=True)
+    rate_limit_limit = models.IntegerField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'provider_api_stats'
+
+    def __str__(self):
+        return f"{self.host}: {self.not_modified}/{self.requests} not modified"
+
+
+class GitMirror(models.Model):
+    """Local bare mirror of a repository, used for diffs and file contents"""
+
+    repository = models.OneToOneField(
+        Repository,
+        on_delete=models.CASCADE,
+        related_name='git_mirror'
+    )
+    size_bytes = models.BigIntegerField(default=0)
+    fetched_at = models.DateTimeField(null=True, blank=True)
+    last_used_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'git_mirrors'
+        indexes = [
+            models.Index(fields=['last_used_at']),
+        ]
+
+    def __str__(self):
+        return f"Mirror of {self.repository.full_name} ({self.size_bytes} bytes)"
+
+
+class ReviewPublication(models.Model):
+    """The provider comment a PR's review is published as, edited in place on later runs"""
+
+    pull_request = models.OneToOneField(
+        PullRequest,
+        on_delete=models.CASCADE,
+        related_name='review_publication'
+    )
+    comment_id = models.CharField(max_length=64)  # GitHub review id / Bitbucket comment id
+    inline_keys = models.JSONField(default=list)  # issues already posted as inline comments
+    published_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'review_publications'
+
+    def __str__(self):
+        return f"Review of PR #{self.pull_request.pr_number} as comment {self.comment_id}"
+
+
+class ProviderTokenBudget(models.Model):
+    """Last rate-limit budget a provider reported for one access token (identified by a hash)"""
+
+    token = models.CharField(max_length=64, unique=True)
+    host = models.CharField(max_length=255)
+    remaining = models.IntegerField()
+    limit = models.IntegerField()
+    reset_at = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'provider_token_budgets'
+
+    def __str__(self):
+        return f"{self.host} token {self.token[:8]}: {self.remaining}/{self.limit}"
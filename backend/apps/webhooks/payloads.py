@@ -0,0 +1,245 @@
+# apps/webhooks/payloads.py
+"""
+Typed fast-path decoders for pull request webhook payloads
+
+PR payloads run to 50-200 KB, but only a handful of fields feed the
+PullRequest and Repository rows. The structs below declare just those
+fields; msgspec decodes straight from the raw body bytes and skips
+everything else without building Python objects for it.
+"""
+from typing import Optional
+
+import msgspec
+
+GITHUB_REVIEW_ACTIONS = {'opened', 'reopened', 'synchronize', 'ready_for_review'}
+BITBUCKET_REVIEW_EVENTS = {'pullrequest:created', 'pullrequest:updated'}
+BITBUCKET_STATUS = {
+    'OPEN': 'open',
+    'MERGED': 'merged',
+    'DECLINED': 'closed',
+    'SUPERSEDED': 'closed',
+}
+
+DECODE_ERRORS = (msgspec.DecodeError, msgspec.ValidationError)
+
+
+# GitHub `pull_request` event
+
+class GitHubUser(msgspec.Struct):
+    login: str = ''
+
+
+class GitHubRef(msgspec.Struct):
+    ref: str = ''
+    sha: str = ''
+
+
+class GitHubPullRequest(msgspec.Struct):
+    number: int
+    title: str = ''
+    body: Optional[str] = None
+    state: str = 'open'
+    draft: bool = False
+    merged: bool = False
+    merged_at: Optional[str] = None  # list endpoints carry this instead of ``merged``
+    html_url: str = ''
+    user: Optional[GitHubUser] = None
+    head: GitHubRef = msgspec.field(default_factory=GitHubRef)
+    base: GitHubRef = msgspec.field(default_factory=GitHubRef)
+
+
+class GitHubRepository(msgspec.Struct):
+    full_name: str
+
+
+class GitHubPullRequestEvent(msgspec.Struct):
+    pull_request: GitHubPullRequest
+    repository: GitHubRepository
+    action: str = ''
+
+
+# Bitbucket `pullrequest:*` events
+
+class BitbucketAuthor(msgspec.Struct):
+    display_name: str = ''
+
+
+class BitbucketBranch(msgspec.Struct):
+    name: str = ''
+
+
+class BitbucketCommit(msgspec.Struct):
+    hash: str = ''
+
+
+class BitbucketEndpoint(msgspec.Struct):
+    branch: BitbucketBranch = msgspec.field(default_factory=BitbucketBranch)
+    commit: Optional[BitbucketCommit] = None
+
+
+class BitbucketLink(msgspec.Struct):
+    href: str = ''
+
+
+class BitbucketLinks(msgspec.Struct):
+    html: BitbucketLink = msgspec.field(default_factory=BitbucketLink)
+
+
+class BitbucketPullRequest(msgspec.Struct):
+    id: int
+    title: str = ''
+    description: Optional[str] = None
+    state: str = 'OPEN'
+    author: Optional[BitbucketAuthor] = None
+    source: BitbucketEndpoint = msgspec.field(default_factory=BitbucketEndpoint)
+    destination: BitbucketEndpoint = msgspec.field(default_factory=BitbucketEndpoint)
+    links: BitbucketLinks = msgspec.field(default_factory=BitbucketLinks)
+
+
+class BitbucketRepository(msgspec.Struct):
+    full_name: str
+
+
+class BitbucketPullRequestEvent(msgspec.Struct):
+    pullrequest: BitbucketPullRequest
+    repository: BitbucketRepository
+
+
+# Pull request listings (backfills)
+
+class BitbucketPullRequestPage(msgspec.Struct):
+    values: list[BitbucketPullRequest] = msgspec.field(default_factory=list)
+    next: Optional[str] = None
+
+
+_github_decoder = msgspec.json.Decoder(GitHubPullRequestEvent)
+_bitbucket_decoder = msgspec.json.Decoder(BitbucketPullRequestEvent)
+_github_list_decoder = msgspec.json.Decoder(list[GitHubPullRequest])
+_bitbucket_page_decoder = msgspec.json.Decoder(BitbucketPullRequestPage)
+_github_object_decoder = msgspec.json.Decoder(GitHubPullRequest)
+_bitbucket_object_decoder = msgspec.json.Decoder(BitbucketPullRequest)
+
+
+class PullRequestEvent(msgspec.Struct):
+    """Provider-neutral view of a PR event: what the handler needs, nothing more"""
+    provider: str
+    full_name: str
+    pr_number: int
+    should_review: bool
+    fields: dict
+
+
+def decode_github_pull_request(body):
+    """
+    Decode a GitHub ``pull_request`` event from raw body bytes
+
+    Raises:
+        msgspec.DecodeError / msgspec.ValidationError on malformed payloads
+    """
+    event = _github_decoder.decode(body)
+    fields = github_fields(event.pull_request)
+
+    return PullRequestEvent(
+        provider='github',
+        full_name=event.repository.full_name,
+        pr_number=event.pull_request.number,
+        should_review=event.action in GITHUB_REVIEW_ACTIONS and fields['status'] == 'open',
+        fields=fields,
+    )
+
+
+def decode_bitbucket_pull_request(event_key, body):
+    """
+    Decode a Bitbucket ``pullrequest:*`` event from raw body bytes
+
+    Raises:
+        msgspec.DecodeError / msgspec.ValidationError on malformed payloads
+    """
+    event = _bitbucket_decoder.decode(body)
+    fields = bitbucket_fields(event.pullrequest)
+
+    return PullRequestEvent(
+        provider='bitbucket',
+        full_name=event.repository.full_name,
+        pr_number=event.pullrequest.id,
+        should_review=event_key in BITBUCKET_REVIEW_EVENTS and fields['status'] == 'open',
+        fields=fields,
+    )
+
+
+def decode_github_pull_request_list(body):
+    """
+    Decode one page of GitHub's ``GET /repos/{repo}/pulls``
+
+    Returns:
+        list: (pr_number, PullRequest fields) per pull request
+    """
+    return [(pr.number, github_fields(pr)) for pr in _github_list_decoder.decode(body)]
+
+
+def decode_bitbucket_pull_request_page(body):
+    """
+    Decode one page of Bitbucket's ``GET /repositories/{repo}/pullrequests``
+
+    Returns:
+        tuple: ([(pr_number, PullRequest fields)], URL of the next page or None)
+    """
+    page = _bitbucket_page_decoder.decode(body)
+    return [(pr.id, bitbucket_fields(pr)) for pr in page.values], page.next
+
+
+def decode_github_pull_request_object(body):
+    """
+    Decode GitHub's ``GET /repos/{repo}/pulls/{number}``
+
+    Returns:
+        dict: PullRequest fields
+    """
+    return github_fields(_github_object_decoder.decode(body))
+
+
+def decode_bitbucket_pull_request_object(body):
+    """
+    Decode Bitbucket's ``GET /repositories/{repo}/pullrequests/{id}``
+
+    Returns:
+        dict: PullRequest fields
+    """
+    return bitbucket_fields(_bitbucket_object_decoder.decode(body))
+
+
+def github_fields(pr):
+    """PullRequest model fields from a GitHubPullRequest"""
+    if pr.merged or pr.merged_at:
+        status = 'merged'
+    elif pr.state == 'closed':
+        status = 'closed'
+    elif pr.draft:
+        status = 'draft'
+    else:
+        status = 'open'
+
+    return {
+        'title': pr.title or '',
+        'description': pr.body or '',
+        'author': pr.user.login if pr.user else '',
+        'status': status,
+        'source_branch': pr.head.ref,
+        'target_branch': pr.base.ref,
+        'url': pr.html_url,
+        'head_sha': pr.head.sha,
+    }
+
+
+def bitbucket_fields(pr):
+    """PullRequest model fields from a BitbucketPullRequest"""
+    return {
+        'title': pr.title or '',
+        'description': pr.description or '',
+        'author': pr.author.display_name if pr.author else '',
+        'status': BITBUCKET_STATUS.get(pr.state, 'open'),
+        'source_branch': pr.source.branch.name,
+        'target_branch': pr.destination.branch.name,
+        'url': pr.links.html.href,
+        'head_sha': pr.source.commit.hash if pr.source.commit else '',
+    }
@@ -0,0 +1,190 @@
+# apps/webhooks/provider_budget.py
+"""
+Provider API rate-limit budget per access token
+
+Every provider call is made with the repository owner's token. One busy
+owner's token could run out of its hourly quota partway through a review,
+and nothing stopped a backfill from using up the quota the webhook reviews
+needed. Each token's budget is now tracked in a Django cache shared by
+every worker (PROVIDER_BUDGET_CACHE, by default the 'shared' alias):
+
+- The X-RateLimit-Remaining / -Limit / -Reset headers of each response
+  set the token's budget until its reset. Calls made since the last
+  response are counted with ``incr``, so concurrent workers do not all
+  spend the same remaining requests.
+- Calls have a priority, set for a block of code with ``priority()``.
+  BACKGROUND calls (listings, backfills) are refused while less than
+  PROVIDER_BUDGET_BACKGROUND_RESERVE of the limit is left; REVIEW calls
+  (the default) while PROVIDER_BUDGET_PUBLISH_RESERVE requests or fewer
+  are left, so reviews already running can still post their results;
+  PUBLISH calls until the budget is gone.
+- A refused call raises BudgetExhausted before anything is sent. Reviews
+  are requeued for the token's reset, backfills stop and resume later.
+
+Tokens that report no rate limit (Bitbucket) are never refused.
+ProviderTokenBudget shows each token's budget in the admin; the row is
+written once per window and when the budget drops below a reserve, not on
+every response. Tokens are identified by a hash, never stored.
+"""
+import contextvars
+import hashlib
+import logging
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone as dt_timezone
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.cache import caches
+from requests.structures import CaseInsensitiveDict
+
+from .models import ProviderTokenBudget
+
+logger = logging.getLogger(__name__)
+
+PUBLISH = 'publish'
+REVIEW = 'review'
+BACKGROUND = 'background'
+# Budget window assumed when a response has no X-RateLimit-Reset
+DEFAULT_WINDOW = 3600
+
+current_priority = contextvars.ContextVar('provider_priority', default=REVIEW)
+
+
+class BudgetExhausted(Exception):
+    """Too little of a token's provider budget is left for this call; retry after ``retry_after`` seconds"""
+
+    def __init__(self, host, priority, remaining, retry_after):
+        super().__init__(
+            f"{host} budget too low for {priority} calls ({remaining} left), retry in {retry_after:.0f}s"
+        )
+        self.priority = priority
+        self.remaining = remaining
+        self.retry_after = retry_after
+
+
+@contextmanager
+def priority(level):
+    """Run the block's provider calls at ``level`` (PUBLISH, REVIEW or BACKGROUND)"""
+    token = current_priority.set(level)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+def token_id(url, headers):
+    """Hash of the host and Authorization header the budget is kept under, or None without one"""
+    authorization = CaseInsensitiveDict(headers or {}).get('Authorization')
+    if not authorization:
+        return None
+    return hashlib.sha256(f"{urlsplit(url).netloc}\0{authorization}".encode()).hexdigest()[:32]
+
+
+def reserve_for(level, limit):
+    """Requests of ``limit`` that calls at ``level`` must leave"""
+    if level == BACKGROUND:
+        return max(settings.PROVIDER_BUDGET_PUBLISH_RESERVE, int(limit * settings.PROVIDER_BUDGET_BACKGROUND_RESERVE))
+    if level == REVIEW:
+        return settings.PROVIDER_BUDGET_PUBLISH_RESERVE
+    return 0
+
+
+class BudgetScheduler:
+    prefix = 'provider-budget:'
+
+    @property
+    def cache(self):
+        return caches[settings.PROVIDER_BUDGET_CACHE]
+
+    def state(self, token):
+        """Last reported {'remaining', 'limit', 'reset'} of a token, or None if unknown or past its reset"""
+        state = self.cache.get(self.prefix + token)
+        if state is None or state['reset'] <= time.time():
+            return None
+        return state
+
+    def remaining(self, token):
+        """Requests the token has left, counting calls made since the last response; None if unknown"""
+        state = self.state(token)
+        if state is None:
+            return None
+        return state['remaining'] - self.cache.get(f'{self.prefix}{token}:spent', 0)
+
+    def spend(self, url, headers):
+        """
+        Take one request from the budget of the call's token
+
+        Raises:
+            BudgetExhausted: Too little is left for the current priority
+        """
+        token = token_id(url, headers)
+        if token is None:
+            return
+        state = self.state(token)
+        if state is None:
+            return
+
+        level = current_priority.get()
+        spent_key = f'{self.prefix}{token}:spent'
+        self.cache.add(spent_key, 0, timeout=max(1, int(state['reset'] - time.time())))
+        try:
+            spent = self.cache.incr(spent_key)
+        except ValueError:
+            # Expired with the budget: a new window starts
+            return
+        left = state['remaining'] - spent
+        if left < reserve_for(level, state['limit']):
+            self.cache.decr(spent_key)
+            raise BudgetExhausted(urlsplit(url).netloc, level, left + 1, state['reset'] - time.time())
+
+    def observe(self, url, headers, response):
+        """Set the call's token budget from the rate-limit headers of its response"""
+        token = token_id(url, headers)
+        remaining = response.headers.get('X-RateLimit-Remaining')
+        if token is None or remaining is None or not remaining.isdigit():
+            return
+        limit = response.headers.get('X-RateLimit-Limit', '')
+        reset = response.headers.get('X-RateLimit-Reset', '')
+        state = {
+            'remaining': int(remaining),
+            'limit': int(limit) if limit.isdigit() else int(remaining),
+            'reset': int(reset) if reset.isdigit() else time.time() + DEFAULT_WINDOW,
+        }
+        timeout = max(1, int(state['reset'] - time.time()) + 1)
+        self.cache.set(self.prefix + token, state, timeout=timeout)
+        # The headers account for every call answered so far
+        self.cache.set(f'{self.prefix}{token}:spent', 0, timeout=timeout)
+        self.record(url, token, state, timeout)
+
+    def record(self, url, token, state, timeout):
+        """
+        Update the token's ProviderTokenBudget row once per budget window,
+        and again each time the budget falls below a priority's reserve
+        """
+        # Priorities the budget no longer serves: 0, 1 (BACKGROUND) or 2 (REVIEW too)
+        refused = sum(state['remaining'] < reserve_for(level, state['limit']) for level in (BACKGROUND, REVIEW))
+        recorded_key = f'{self.prefix}{token}:recorded'
+        if self.cache.get(recorded_key) == refused:
+            return
+        self.cache.set(recorded_key, refused, timeout=timeout)
+
+        try:
+            ProviderTokenBudget.objects.update_or_create(token=token, defaults={
+                'host': urlsplit(url).netloc,
+                'remaining': state['remaining'],
+                'limit': state['limit'],
+                'reset_at': datetime.fromtimestamp(state['reset'], tz=dt_timezone.utc),
+            })
+        except Exception as e:
+            logger.warning(f"Could not record provider token budget: {str(e)}")
+
+    def reset(self, url, headers):
+        """Forget a token's budget (tests, after a quota increase)"""
+        token = token_id(url, headers)
+        if token is not None:
+            self.cache.delete_many([self.prefix + token, f'{self.prefix}{token}:spent',
+                                    f'{self.prefix}{token}:recorded'])
+
+
+budget = BudgetScheduler()
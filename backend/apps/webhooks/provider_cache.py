@@ -0,0 +1,219 @@
+# apps/webhooks/provider_cache.py
+"""
+Conditional-request cache for provider API reads
+
+Every GET to GitHub or Bitbucket spends rate limit even when nothing
+changed since the last read. Responses carrying an ETag or Last-Modified
+are stored zlib-compressed in ProviderResponseCache, keyed by URL, query,
+Accept header and token (one user's data is never served to another).
+The next read of the same resource sends If-None-Match /
+If-Modified-Since, and a 304 (which GitHub does not count against the
+rate limit) is answered from the stored body.
+
+Bodies over PROVIDER_CACHE_MAX_ENTRY_BYTES are not stored, and the least
+recently used rows are evicted once the table holds more than
+PROVIDER_CACHE_MAX_BYTES of compressed bodies. Streamed responses are
+captured as they are read and stored only when read to the end.
+
+ProviderApiStats counts requests and 304s per host and keeps the last
+X-RateLimit-Remaining / X-RateLimit-Limit the host reported. Counts are
+kept in shared cache counters and written to the row at most once per
+PROVIDER_STATS_FLUSH_SECONDS.
+"""
+import hashlib
+import logging
+import zlib
+from urllib.parse import urlencode, urlsplit
+
+import requests
+from django.conf import settings
+from django.db.models import F, Sum
+from django.utils import timezone
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from .counters import SharedCounters
+from .models import ProviderApiStats, ProviderResponseCache
+
+logger = logging.getLogger(__name__)
+
+# Fast compression: bodies are mostly diff text, which compresses well anyway
+COMPRESS_LEVEL = 1
+
+
+def cache_key(url, params=None, headers=None):
+    """Hash of everything that selects the response body"""
+    headers = CaseInsensitiveDict(headers or {})
+    query = urlencode(params, doseq=True) if params else ''
+    digest = hashlib.sha256()
+    for part in (url, query, headers.get('Accept', ''), headers.get('Authorization', '')):
+        digest.update(part.encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def lookup(key):
+    return ProviderResponseCache.objects.filter(key=key).first()
+
+
+def store(key, response, body=None, compressed=None):
+    """Save a 200 response body (or its zlib ``compressed`` form) under ``key`` if it is small enough"""
+    if body is not None:
+        if len(body) > settings.PROVIDER_CACHE_MAX_ENTRY_BYTES:
+            return
+        compressed = zlib.compress(body, COMPRESS_LEVEL)
+    try:
+        ProviderResponseCache.objects.update_or_create(key=key, defaults={
+            'etag': response.headers.get('ETag', ''),
+            'last_modified': response.headers.get('Last-Modified', ''),
+            'content_type': response.headers.get('Content-Type', ''),
+            'body': compressed,
+            'size': len(compressed),
+        })
+        evict()
+    except Exception as e:
+        logger.warning(f"Could not cache {response.url}: {str(e)}")
+
+
+def evict():
+    """Delete least recently used rows until the stored bodies fit PROVIDER_CACHE_MAX_BYTES"""
+    excess = (ProviderResponseCache.objects.aggregate(total=Sum('size'))['total'] or 0) \
+        - settings.PROVIDER_CACHE_MAX_BYTES
+    if excess <= 0:
+        return
+    stale = []
+    for pk, size in ProviderResponseCache.objects.order_by('last_used_at', 'pk').values_list('pk', 'size'):
+        stale.append(pk)
+        excess -= size
+        if excess <= 0:
+            break
+    ProviderResponseCache.objects.filter(pk__in=stale).delete()
+    logger.info(f"Evicted {len(stale)} provider response cache entries")
+
+
+def cached_response(entry, not_modified):
+    """A 200 ``requests.Response`` rebuilt from a stored entry for a 304"""
+    response = requests.Response()
+    response.status_code = 200
+    response.reason = 'OK'
+    response.url = not_modified.url
+    response.request = not_modified.request
+    response.headers = CaseInsensitiveDict(not_modified.headers)
+    if entry.content_type:
+        response.headers['Content-Type'] = entry.content_type
+    response.encoding = get_encoding_from_headers(response.headers)
+    response._content = zlib.decompress(entry.body)
+    response._content_consumed = True
+    response.from_cache = True
+    return response
+
+
+def capture_stream(key, response):
+    """
+    Store a streamed 200 response once the caller has read all of it
+
+    Chunks are compressed as they pass, so only the compressed body is held.
+    """
+    iter_content = response.iter_content
+    limit = settings.PROVIDER_CACHE_MAX_ENTRY_BYTES
+
+    def capturing(chunk_size=1, decode_unicode=False):
+        compressor = None if decode_unicode else zlib.compressobj(COMPRESS_LEVEL)
+        parts, size = [], 0
+        for chunk in iter_content(chunk_size=chunk_size, decode_unicode=decode_unicode):
+            if compressor is not None:
+                size += len(chunk)
+                if size > limit:
+                    compressor, parts = None, []
+                else:
+                    parts.append(compressor.compress(chunk))
+            yield chunk
+        if compressor is not None:
+            parts.append(compressor.flush())
+            store(key, response, compressed=b''.join(parts))
+
+    response.iter_content = capturing
+
+
+def api_counters(host):
+    return SharedCounters(f'provider_api:{host}', ('requests', 'not_modified'))
+
+
+def record(url, response, not_modified=False):
+    """
+    Count a response against its host
+
+    Counts are added to shared cache counters; the host's ProviderApiStats
+    row is written by the first response of each
+    PROVIDER_STATS_FLUSH_SECONDS window, so workers do not all contend on
+    that row for every GET.
+    """
+    host = urlsplit(url).netloc
+    counters = api_counters(host)
+    counters.add(requests=1, not_modified=int(not_modified))
+    if counters.cache.add(f'{counters.prefix}flushed', True, timeout=settings.PROVIDER_STATS_FLUSH_SECONDS):
+        flush_api_stats(host, response)
+
+
+def flush_api_stats(host, response=None):
+    """Move the host's counted requests into ProviderApiStats, with ``response``'s rate limit"""
+    counters = api_counters(host)
+    counts = counters.values()
+    updates = {
+        'requests': F('requests') + counts['requests'],
+        'not_modified': F('not_modified') + counts['not_modified'],
+        'updated_at': timezone.now(),
+    }
+    headers = response.headers if response is not None else {}
+    for header, field in (('X-RateLimit-Remaining', 'rate_limit_remaining'), ('X-RateLimit-Limit', 'rate_limit_limit')):
+        value = headers.get(header)
+        if value is not None and value.isdigit():
+            updates[field] = int(value)
+    try:
+        ProviderApiStats.objects.get_or_create(host=host)
+        ProviderApiStats.objects.filter(host=host).update(**updates)
+    except Exception as e:
+        # The counts stay in the cache for the next flush
+        logger.warning(f"Could not record provider API stats for {host}: {str(e)}")
+        return
+    # Subtract what was written rather than reset: other workers may have added since
+    counters.add(requests=-counts['requests'], not_modified=-counts['not_modified'])
+
+
+def conditional_get(session, url, params=None, headers=None, stream=False, **kwargs):
+    """
+    ``session.get`` revalidating a stored response when there is one
+
+    Returns:
+        requests.Response: The live response, or one rebuilt from the cache
+            (with ``from_cache`` set) when the provider answered 304
+    """
+    key = cache_key(url, params, headers)
+    entry = lookup(key)
+    headers = dict(headers or {})
+    if entry is not None:
+        if entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+
+    response = session.get(url, params=params, headers=headers, stream=stream, **kwargs)
+    not_modified = response.status_code == 304 and entry is not None
+    try:
+        record(url, response, not_modified)
+    except Exception as e:
+        logger.warning(f"Could not record provider API stats: {str(e)}")
+
+    if not_modified:
+        # Read the empty body so the connection goes back to the pool
+        response.content
+        response.close()
+        ProviderResponseCache.objects.filter(pk=entry.pk).update(last_used_at=timezone.now())
+        return cached_response(entry, response)
+
+    if response.status_code == 200 and (response.headers.get('ETag') or response.headers.get('Last-Modified')):
+        if stream:
+            capture_stream(key, response)
+        else:
+            store(key, response, response.content)
+    return response
@@ -0,0 +1,257 @@
+# apps/webhooks/publisher.py
+"""
+Review publishing on the PR
+
+``post_review_comment`` added a PR comment on every run, so each
+re-review left one more behind, and no issue showed on the line it is
+about. A review is now published once per PR and edited in place
+afterwards; ReviewPublication keeps the provider's id.
+
+- GitHub: the first run submits one pull-request review, the summary as
+  its body and the issues as inline comments, in a single call. Later
+  runs update that review's body, and submit one more review only when
+  there are inline comments not posted before.
+- Bitbucket has no batched review: the summary is one PR comment edited
+  in place, and new inline comments are posted with at most
+  REVIEW_PUBLISH_CONCURRENCY requests in flight.
+
+Only issues on a line of the reviewed diff become inline comments (GitHub
+rejects the others); every issue stays listed in the summary.
+
+``async_provider.AsyncProviderClient.publish_review`` does the same from
+async code.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import requests
+from django.conf import settings
+
+from . import provider_budget
+from .models import ReviewPublication
+from .ultis import http_post, http_put
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class InlineComment:
+    key: str
+    path: str
+    line: int
+    body: str
+
+
+def commentable_lines(files):
+    """
+    New-side line numbers shown in each file's diff, added or context
+
+    Args:
+        files: FileDiff instances
+
+    Returns:
+        dict: Path -> set of line numbers
+    """
+    lines = {}
+    for file_diff in files:
+        if file_diff.is_binary or file_diff.is_deleted:
+            continue
+        numbers = lines.setdefault(file_diff.path, set())
+        for hunk in file_diff.hunks:
+            number = hunk.new_start
+            for line in hunk.lines:
+                if line.startswith('-') or line.startswith('\\'):
+                    continue
+                numbers.add(number)
+                number += 1
+    return lines
+
+
+def inline_comments(review, commentable):
+    """InlineComment for each of the review's issues on a commentable line"""
+    comments = {}
+    for issue in review.issues.all():
+        if issue.line_number not in commentable.get(issue.file_path, ()):
+            continue
+        key = f"{issue.file_path}:{issue.line_number}:{issue.title}"
+        body = f"**{issue.severity.upper()}** {issue.title}"
+        if issue.suggestion:
+            body += f"\n\n{issue.suggestion}"
+        comments.setdefault(key, InlineComment(key, issue.file_path, issue.line_number, body))
+    return list(comments.values())
+
+
+def publish_review(pull_request, review, body, commentable=None):
+    """
+    Publish a review on the PR, editing the earlier publication if there is one
+
+    Args:
+        pull_request: PullRequest model instance
+        review: AIReview model instance
+        body: Summary markdown (see handler.format_review_comment)
+        commentable: Path -> new-side lines of the reviewed diff (see
+            commentable_lines); issues on them become inline comments
+
+    Returns:
+        bool: True if the summary was published
+    """
+    repo = pull_request.repository
+    access_token = repo.owner.profile.access_token
+    if not access_token:
+        logger.error(f"No access token for user {repo.owner.id}")
+        return False
+
+    publication, already_posted, comments = pending_publication(pull_request, review, commentable)
+
+    try:
+        with provider_budget.priority(provider_budget.PUBLISH):
+            if repo.provider == 'github':
+                comment_id, posted = publish_github(pull_request, access_token, body, comments, publication)
+            elif repo.provider == 'bitbucket':
+                comment_id, posted = publish_bitbucket(pull_request, access_token, body, comments, publication)
+            else:
+                logger.error(f"Unknown provider: {repo.provider}")
+                return False
+    except (requests.RequestException, provider_budget.BudgetExhausted, KeyError, ValueError) as e:
+        logger.error(f"Failed to publish review of PR #{pull_request.pr_number}: {str(e)}")
+        return False
+
+    save_publication(pull_request, publication, already_posted, comment_id, posted)
+    return True
+
+
+def pending_publication(pull_request, review, commentable=None):
+    """
+    The PR's ReviewPublication and the inline comments it has not posted yet
+
+    Returns:
+        tuple: (ReviewPublication or None, set of posted keys, list of InlineComment)
+    """
+    publication = ReviewPublication.objects.filter(pull_request=pull_request).first()
+    already_posted = set(publication.inline_keys) if publication else set()
+    comments = [c for c in inline_comments(review, commentable or {}) if c.key not in already_posted]
+    return publication, already_posted, comments
+
+
+def save_publication(pull_request, publication, already_posted, comment_id, posted):
+    """Record the published review's id and every inline comment posted so far"""
+    ReviewPublication.objects.update_or_create(pull_request=pull_request, defaults={
+        'comment_id': str(comment_id),
+        'inline_keys': sorted(already_posted | posted),
+    })
+    logger.info(
+        f"Published review of {pull_request.repository.provider} PR #{pull_request.pr_number} "
+        f"({'edited' if publication else 'new'}, {len(posted)} new inline comments)"
+    )
+
+
+def github_comment(comment):
+    return {'path': comment.path, 'line': comment.line, 'side': 'RIGHT', 'body': comment.body}
+
+
+def publish_github(pull_request, access_token, body, comments, publication):
+    """
+    Submit or update the PR's GitHub review
+
+    Returns:
+        tuple: (review id, keys of the inline comments posted)
+    """
+    repo = pull_request.repository
+    url = f"{settings.GITHUB_API_URL}/repos/{repo.full_name}/pulls/{pull_request.pr_number}/reviews"
+    headers = {
+        'Authorization': f'token {access_token}',
+        'Accept': 'application/vnd.github.v3+json'
+    }
+
+    if publication:
+        response = http_put(f"{url}/{publication.comment_id}", json={'body': body}, headers=headers)
+        if response.status_code != 404:
+            response.raise_for_status()
+            if not comments:
+                return publication.comment_id, set()
+            summary = new_issues_summary(pull_request, comments)
+            response = submit_github_review(url, headers, pull_request, summary, comments)
+            if response.status_code == 422:
+                logger.warning(f"GitHub rejected inline comments on PR #{pull_request.pr_number}: {response.text[:200]}")
+                return publication.comment_id, set()
+            response.raise_for_status()
+            return publication.comment_id, {c.key for c in comments}
+        logger.info(f"Review {publication.comment_id} on PR #{pull_request.pr_number} is gone, submitting a new one")
+
+    response = submit_github_review(url, headers, pull_request, body, comments)
+    if response.status_code == 422 and comments:
+        # One comment off the diff (the head moved on meanwhile) fails the whole review
+        logger.warning(f"GitHub rejected inline comments on PR #{pull_request.pr_number}, submitting the summary alone")
+        comments = []
+        response = submit_github_review(url, headers, pull_request, body, comments)
+    response.raise_for_status()
+    return response.json()['id'], {c.key for c in comments}
+
+
+def submit_github_review(url, headers, pull_request, body, comments):
+    return http_post(url, json=github_review(pull_request, body, comments), headers=headers)
+
+
+def github_review(pull_request, body, comments):
+    """Request body submitting one GitHub pull-request review"""
+    data = {
+        'body': body,
+        'event': 'COMMENT',
+        'comments': [github_comment(c) for c in comments],
+    }
+    if pull_request.head_sha:
+        # Line numbers refer to the reviewed head
+        data['commit_id'] = pull_request.head_sha
+    return data
+
+
+def new_issues_summary(pull_request, comments):
+    """Body of a follow-up GitHub review that only adds inline comments"""
+    return f"{len(comments)} new issue(s) at {pull_request.head_sha[:7]}; the review summary above is updated."
+
+
+def publish_bitbucket(pull_request, access_token, body, comments, publication):
+    """
+    Create or edit the PR's Bitbucket summary comment and post new inline comments
+
+    Returns:
+        tuple: (summary comment id, keys of the inline comments posted)
+    """
+    repo = pull_request.repository
+    workspace, repo_slug = repo.full_name.split('/', 1)
+    url = f"{settings.BITBUCKET_API_URL}/repositories/{workspace}/{repo_slug}/pullrequests/{pull_request.pr_number}/comments"
+    headers = {
+        'Authorization': f'Bearer {access_token}',
+        'Content-Type': 'application/json'
+    }
+
+    comment_id = publication.comment_id if publication else None
+    if comment_id:
+        response = http_put(f"{url}/{comment_id}", json={'content': {'raw': body}}, headers=headers)
+        if response.status_code == 404:
+            logger.info(f"Comment {comment_id} on PR #{pull_request.pr_number} is gone, posting a new one")
+            comment_id = None
+        else:
+            response.raise_for_status()
+    if not comment_id:
+        response = http_post(url, json={'content': {'raw': body}}, headers=headers)
+        response.raise_for_status()
+        comment_id = response.json()['id']
+
+    def post_inline(comment):
+        data = {'content': {'raw': comment.body}, 'inline': {'path': comment.path, 'to': comment.line}}
+        try:
+            # Pool threads do not inherit the caller's priority
+            with provider_budget.priority(provider_budget.PUBLISH):
+                http_post(url, json=data, headers=headers).raise_for_status()
+        except (requests.RequestException, provider_budget.BudgetExhausted) as e:
+            logger.warning(f"Failed to post inline comment on {comment.path}:{comment.line}: {str(e)}")
+            return None
+        return comment.key
+
+    posted = set()
+    if comments:
+        with ThreadPoolExecutor(max_workers=max(1, settings.REVIEW_PUBLISH_CONCURRENCY)) as pool:
+            posted = {key for key in pool.map(post_inline, comments) if key}
+    return comment_id, posted
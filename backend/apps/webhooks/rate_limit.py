@@ -0,0 +1,230 @@
+# apps/webhooks/rate_limit.py
+"""
+Model call rate limiting shared by every worker process
+
+Each Celery worker used to call the API on its own, so a burst of reviews
+ran into 429s everywhere at once and each review fell back to a degraded
+result. Calls now go through ``limiter``, whose state lives in a Django
+cache (AI_RATE_LIMIT_CACHE, by default the 'shared' alias; it must be
+Redis, via SHARED_CACHE_URL, for the limits to hold across processes, and
+a system check warns when it is not):
+
+- Requests and estimated tokens are counted in short windows with atomic
+  ``incr``; a call waits for a window with room under AI_RATE_LIMIT_RPM
+  and AI_RATE_LIMIT_TPM (0 means no limit). Short windows keep bursts to a
+  fraction of the per-minute budget, like a token bucket refilling every
+  few seconds.
+- A 429 or 529 pauses every worker until its ``retry-after`` has passed
+  and halves a shared rate factor (once per pause, whoever sees it first).
+  Successful calls raise the factor again in small steps. The factor
+  scales both the limits and each review's parallel calls (AIMD).
+- A call that cannot get capacity within AI_RATE_LIMIT_MAX_WAIT seconds,
+  or keeps being rate limited, raises RateLimited. The review is then
+  requeued instead of being stored with parts missing.
+"""
+import asyncio
+import logging
+import math
+import time
+
+import anthropic
+from django.conf import settings
+from django.core.cache import caches
+
+from .diffs import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+WINDOW_SECONDS = 10
+# Pause used when a rate-limit response carries no retry-after header
+DEFAULT_RETRY_AFTER = 10
+# AIMD: halve on a rate limit, recover 2% of full speed per successful call
+DECREASE_FACTOR = 0.5
+INCREASE_STEP = 0.02
+MIN_FACTOR = 0.05
+# Rate-limited attempts per call before the review is requeued
+MAX_ATTEMPTS = 3
+BACKPRESSURE_STATUS = (429, 529)
+
+
+class RateLimited(Exception):
+    """No model capacity now; retry the whole review after ``retry_after`` seconds"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Model API rate limited, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def retry_after(error):
+    """Seconds a 429/529 response asks clients to wait, if it says"""
+    response = getattr(error, 'response', None)
+    value = response.headers.get('retry-after') if response is not None else None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_backpressure(error):
+    return isinstance(error, anthropic.APIStatusError) and error.status_code in BACKPRESSURE_STATUS
+
+
+def request_tokens(request):
+    """Token estimate for one request: its prompt plus the full output allowance"""
+    system = request.get('system') or ''
+    if not isinstance(system, str):
+        system = ''.join(block.get('text', '') for block in system)
+    prompt = ''.join(str(message.get('content', '')) for message in request.get('messages') or [])
+    return estimate_tokens(system + prompt) + request.get('max_tokens', 0)
+
+
+class SharedLimiter:
+    prefix = 'ai-rate:'
+
+    @property
+    def cache(self):
+        return caches[settings.AI_RATE_LIMIT_CACHE]
+
+    def _incr(self, key, delta):
+        self.cache.add(key, 0, timeout=WINDOW_SECONDS * 3)
+        try:
+            return self.cache.incr(key, delta)
+        except ValueError:
+            # Expired between add and incr
+            self.cache.add(key, delta, timeout=WINDOW_SECONDS * 3)
+            return delta
+
+    def factor(self):
+        """Shared AIMD rate factor, 1.0 at full speed"""
+        return self.cache.get(self.prefix + 'factor', 1.0)
+
+    def concurrency(self, limit):
+        """Parallel calls a review may make at the current factor"""
+        return max(1, math.floor(limit * self.factor()))
+
+    def reserve(self, tokens):
+        """
+        Take one request and ``tokens`` from the current window if they fit
+
+        Returns:
+            float: 0 when reserved, else seconds until capacity may be free
+        """
+        now = time.time()
+        paused_until = self.cache.get(self.prefix + 'paused-until', 0)
+        if paused_until > now:
+            return paused_until - now
+
+        rpm, tpm = settings.AI_RATE_LIMIT_RPM, settings.AI_RATE_LIMIT_TPM
+        if not rpm and not tpm:
+            return 0
+
+        window = int(now // WINDOW_SECONDS)
+        share = self.factor() * WINDOW_SECONDS / 60
+        requests = self._incr(f'{self.prefix}requests:{window}', 1)
+        used = self._incr(f'{self.prefix}tokens:{window}', tokens)
+        # A request larger than a whole window still goes through, alone
+        if (rpm and requests > max(1, rpm * share)) or (tpm and used > tpm * share and used > tokens):
+            self._incr(f'{self.prefix}requests:{window}', -1)
+            self._incr(f'{self.prefix}tokens:{window}', -tokens)
+            return (window + 1) * WINDOW_SECONDS - now
+        return 0
+
+    def settle(self, request, usage):
+        """Correct the current window from the request's estimate to the tokens ``usage`` reports"""
+        if not settings.AI_RATE_LIMIT_TPM:
+            return
+        get = usage.get if isinstance(usage, dict) else lambda name: getattr(usage, name, None)
+        # Prompt-cache reads do not count towards input rate limits
+        actual = sum(get(name) or 0 for name in ('input_tokens', 'cache_creation_input_tokens', 'output_tokens'))
+        estimated = request_tokens(request)
+        if actual != estimated:
+            self._incr(f'{self.prefix}tokens:{int(time.time() // WINDOW_SECONDS)}', actual - estimated)
+
+    def acquire(self, tokens):
+        """Block until the call may start; raises RateLimited past AI_RATE_LIMIT_MAX_WAIT"""
+        deadline = time.monotonic() + settings.AI_RATE_LIMIT_MAX_WAIT
+        while True:
+            wait = self.reserve(tokens)
+            if not wait:
+                return
+            if time.monotonic() + wait > deadline:
+                raise RateLimited(wait)
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens):
+        """``acquire`` for coroutines; waits without blocking the event loop"""
+        deadline = time.monotonic() + settings.AI_RATE_LIMIT_MAX_WAIT
+        while True:
+            wait = self.reserve(tokens)
+            if not wait:
+                return
+            if time.monotonic() + wait > deadline:
+                raise RateLimited(wait)
+            await asyncio.sleep(wait)
+
+    def on_success(self):
+        factor = self.factor()
+        if factor < 1.0:
+            self.cache.set(self.prefix + 'factor', min(1.0, factor + INCREASE_STEP), timeout=None)
+
+    def on_backpressure(self, error):
+        """Pause every worker for the response's retry-after and cut the rate factor"""
+        wait = retry_after(error)
+        if wait is None:
+            wait = DEFAULT_RETRY_AFTER
+        paused_until = time.time() + wait
+        self.cache.set(
+            self.prefix + 'paused-until',
+            max(paused_until, self.cache.get(self.prefix + 'paused-until', 0)),
+            timeout=math.ceil(wait) + 1,
+        )
+        if self.cache.add(self.prefix + 'decreased', 1, timeout=max(1, math.ceil(wait))):
+            factor = max(MIN_FACTOR, self.factor() * DECREASE_FACTOR)
+            self.cache.set(self.prefix + 'factor', factor, timeout=None)
+            logger.warning(f"Model API returned {error.status_code}; pausing {wait:.0f}s, rate factor now {factor:.2f}")
+        return wait
+
+    def reset(self):
+        """Back to full speed with no pause (tests, after raising limits)"""
+        for name in ('factor', 'paused-until', 'decreased'):
+            self.cache.delete(self.prefix + name)
+
+    def call(self, request, send):
+        """
+        Run ``send()`` for ``request`` under the limiter
+
+        Rate-limited attempts wait out the shared pause and try again, up to
+        MAX_ATTEMPTS; then RateLimited is raised.
+        """
+        tokens = request_tokens(request)
+        for attempt in range(MAX_ATTEMPTS):
+            self.acquire(tokens)
+            try:
+                result = send()
+            except Exception as e:
+                if not is_backpressure(e):
+                    raise
+                wait = self.on_backpressure(e)
+                continue
+            self.on_success()
+            return result
+        raise RateLimited(wait)
+
+    async def call_async(self, request, send):
+        """``call`` for coroutines; ``send`` returns an awaitable"""
+        tokens = request_tokens(request)
+        for attempt in range(MAX_ATTEMPTS):
+            await self.acquire_async(tokens)
+            try:
+                result = await send()
+            except Exception as e:
+                if not is_backpressure(e):
+                    raise
+                wait = self.on_backpressure(e)
+                continue
+            self.on_success()
+            return result
+        raise RateLimited(wait)
+
+
+limiter = SharedLimiter()
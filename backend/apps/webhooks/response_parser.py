@@ -0,0 +1,435 @@
+# apps/webhooks/response_parser.py
+"""
+Parsing of model review responses
+
+``parse_ai_response`` recovers as much of a malformed reply as it can
+(prose around the JSON, trailing commas, ``max_tokens`` truncation) and
+normalizes it to the analysis schema, so slightly broken output does not
+cost another model call.
+
+``StreamingAnalysisParser`` consumes a streamed response piece by piece
+and hands back each element of the top-level ``issues`` array (an object,
+or a bare string like ``parse_ai_response`` accepts) as soon as it ends. Issue text is dropped once parsed, so only the
+small remainder of the object (summary, scores, lists) is buffered.
+"""
+import json
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+
+SEVERITY_ALIASES = {
+    'critical': 'high', 'blocker': 'high', 'major': 'high', 'error': 'high', 'high': 'high',
+    'medium': 'medium', 'moderate': 'medium', 'warning': 'medium', 'med': 'medium',
+    'low': 'low', 'minor': 'low', 'info': 'low', 'nit': 'low', 'trivial': 'low',
+}
+CLOSERS = {'{': '}', '[': ']'}
+# Strings (group 1 is the closing quote, missing if cut off), punctuation, bare literals
+TOKENS = re.compile(r'"(?:[^"\\]|\\.)*(")?|[{}\[\],:]|[^\s"{}\[\],:]+')
+LEADING_INT = re.compile(r'-?\d+')
+TRUE_WORDS = {'true', 'yes', 'y', '1'}
+
+
+def parse_ai_response(text):
+    """
+    Parse a model reply into a normalized analysis dict
+
+    Tolerates prose and code fences around the JSON, trailing commas and
+    replies cut off by ``max_tokens`` (open strings, arrays and objects are
+    closed at the last complete value). Fields are then validated and
+    normalized; ``salvaged`` lists everything that had to be repaired or
+    defaulted, and is empty for a well-formed reply.
+    """
+    raw, salvaged = extract_object(text)
+    if raw is None:
+        analysis, _ = normalize_analysis({})
+        analysis['summary'] = text.strip()[:500]
+        analysis['salvaged'] = ['unstructured']
+        return analysis
+
+    analysis, repaired = normalize_analysis(raw)
+    analysis['salvaged'] = salvaged + repaired
+    return analysis
+
+
+def extract_object(text):
+    """
+    The first JSON object in ``text``
+
+    Returns:
+        tuple: (dict or None, list of repair markers)
+    """
+    start = text.find('{')
+    if start == -1:
+        return None, []
+
+    # Fast path: one object, possibly wrapped in fences or prose
+    end = text.rfind('}')
+    if end > start:
+        try:
+            value = json.loads(text[start:end + 1])
+            if isinstance(value, dict):
+                return value, []
+        except ValueError:
+            pass
+
+    candidate, markers = balance(text, start)
+    try:
+        value = json.loads(candidate)
+    except ValueError:
+        return None, []
+    return (value, markers) if isinstance(value, dict) else (None, [])
+
+
+def balance(text, start):
+    """
+    Single pass from ``start`` to the end of the first balanced object
+
+    Trailing commas are dropped. If the text ends first, it is cut at the
+    last complete value and the open containers are closed; a partial
+    object inside an array (a half-written issue) is dropped whole.
+
+    Returns:
+        tuple: (JSON text, list of repair markers)
+    """
+    stack = []
+    element_cuts = {}     # stack depth of an object inside an array -> cut before it
+    drop = []             # indexes of trailing commas
+    last_comma = None     # index of a comma not yet followed by a value
+    cut = cut_depth = None
+    complete = False      # whether the text so far ends on a whole value
+
+    for match in TOKENS.finditer(text, start):
+        token = match.group()
+        char = token[0]
+        if char == '"':
+            if match.group(1) is None:
+                # Unterminated string: the text ends inside it
+                complete = False
+                break
+            last_comma = None
+            complete = True
+        elif char in '{[':
+            if char == '{' and stack and stack[-1] == '[':
+                element_cuts[len(stack) + 1] = (cut, cut_depth)
+            stack.append(char)
+            last_comma = None
+            cut, cut_depth = match.end(), len(stack)
+            complete = False
+        elif char in '}]':
+            if last_comma is not None:
+                drop.append(last_comma)
+                last_comma = None
+            if stack:
+                element_cuts.pop(len(stack), None)
+                stack.pop()
+            if not stack:
+                markers = ['trailing_commas'] if drop else []
+                return strip_indexes(text, start, match.end(), drop), markers
+            cut, cut_depth = match.end(), len(stack)
+            complete = False
+        elif char == ',':
+            last_comma = match.start()
+            cut, cut_depth = match.start(), len(stack)
+            complete = False
+        elif char == ':':
+            complete = False
+        else:
+            last_comma = None
+            # A literal running into the end of the text may be cut short ("tr", "4")
+            complete = match.end() < len(text) or token in ('true', 'false', 'null')
+
+    # Cut off mid-object: keep whole values only, then close what is open
+    if complete:
+        end, depth = len(text), len(stack)
+    else:
+        end, depth = cut, cut_depth
+    if element_cuts:
+        end, depth = element_cuts[min(element_cuts)]
+    closing = ''.join(CLOSERS[c] for c in reversed(stack[:depth]))
+    return strip_indexes(text, start, end, drop) + closing, ['truncated']
+
+
+def strip_indexes(text, start, end, drop):
+    """``text[start:end]`` without the characters at ``drop``"""
+    if not drop:
+        return text[start:end]
+    parts, previous = [], start
+    for index in drop:
+        if index < end:
+            parts.append(text[previous:index])
+            previous = index + 1
+    parts.append(text[previous:end])
+    return ''.join(parts)
+
+
+def normalize_analysis(raw):
+    """
+    Validate and normalize an analysis object
+
+    Returns:
+        tuple: (analysis dict with every expected field, list of the
+            fields that were missing or had to be coerced)
+    """
+    salvaged = []
+
+    summary = raw.get('summary')
+    if not isinstance(summary, str):
+        salvaged.append('summary')
+        summary = '' if summary is None else str(summary)
+
+    risk_score = to_int(raw.get('riskScore'))
+    if risk_score is None:
+        salvaged.append('riskScore')
+        risk_score = 50
+    elif not 0 <= risk_score <= 100 or not isinstance(raw.get('riskScore'), int):
+        salvaged.append('riskScore')
+    risk_score = min(100, max(0, risk_score))
+
+    issues = raw.get('issues')
+    if not isinstance(issues, list):
+        if issues is not None:
+            salvaged.append('issues')
+        issues = [] if issues is None else [issues]
+    normalized_issues = []
+    for issue in issues:
+        normalized, changed = normalize_issue(issue)
+        if normalized is not None:
+            normalized_issues.append(normalized)
+        if changed and 'issues' not in salvaged:
+            salvaged.append('issues')
+
+    lists = {}
+    for name in ('recommendations', 'blockers'):
+        value = raw.get(name)
+        if value is None:
+            value = []
+        elif isinstance(value, str):
+            value = [value]
+            salvaged.append(name)
+        elif not isinstance(value, list):
+            value = []
+            salvaged.append(name)
+        if any(not isinstance(item, str) for item in value):
+            value = [item if isinstance(item, str) else json.dumps(item) for item in value]
+            if name not in salvaged:
+                salvaged.append(name)
+        lists[name] = value
+
+    ready = raw.get('deploymentReady')
+    if not isinstance(ready, bool):
+        salvaged.append('deploymentReady')
+        ready = str(ready).strip().lower() in TRUE_WORDS if ready is not None else False
+
+    analysis = dict(raw)
+    analysis.update({
+        'summary': summary,
+        'riskScore': risk_score,
+        'issues': normalized_issues,
+        'recommendations': lists['recommendations'],
+        'blockers': lists['blockers'],
+        'deploymentReady': ready,
+    })
+    return analysis, salvaged
+
+
+def normalize_issue(issue):
+    """
+    Normalize one ``issues`` entry
+
+    Returns:
+        tuple: (issue dict or None if unusable, whether anything was coerced)
+    """
+    if isinstance(issue, str):
+        issue = {'title': issue}
+        changed = True
+    elif isinstance(issue, dict):
+        changed = False
+    else:
+        return None, True
+
+    severity = SEVERITY_ALIASES.get(str(issue.get('severity', '')).strip().lower())
+    if severity is None:
+        severity = 'low'
+        changed = True
+    elif severity != issue.get('severity'):
+        changed = True
+
+    line = issue.get('line')
+    if line is not None and not (isinstance(line, int) and not isinstance(line, bool) and line > 0):
+        line = to_int(line)
+        if line is not None and line < 1:
+            line = None
+        changed = True
+
+    title = issue.get('title') or issue.get('issue') or issue.get('message') or ''
+    path = issue.get('file') or issue.get('path') or issue.get('filename') or ''
+    suggestion = issue.get('suggestion') or issue.get('fix') or issue.get('recommendation') or ''
+    if not all(isinstance(v, str) for v in (title, path, suggestion)) or 'title' not in issue \
+            or 'file' not in issue or 'suggestion' not in issue:
+        changed = True
+
+    normalized = dict(issue)
+    normalized.update({
+        'severity': severity,
+        'title': str(title),
+        'file': str(path),
+        'line': line,
+        'suggestion': str(suggestion),
+    })
+    return normalized, changed
+
+
+def to_int(value):
+    """Leading integer of a number or string ("42", "42/100", "L12-15"), else None"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(round(value))
+    if isinstance(value, str):
+        match = LEADING_INT.search(value)
+        if match:
+            return int(match.group())
+    return None
+
+
+class StreamingAnalysisParser:
+    """
+    Incremental parser for one analysis object
+
+    Text before the first ``{`` (e.g. a code fence) and after the matching
+    ``}`` is ignored.
+    """
+
+    def __init__(self):
+        self.head = []          # raw text kept for non-JSON replies, capped
+        self.head_size = 0
+        self.started = False
+        self.done = False
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.skeleton = []      # the object minus issue elements
+        self.string = None      # chars of the depth-1 string being read
+        self.last_string = None
+        self.key = None
+        self.in_issues = False
+        self.element = None     # chars of the issue element being read
+        self.issues = []
+        self.issues_salvaged = False
+
+    def feed(self, text):
+        """
+        Consume the next piece of the response
+
+        Returns:
+            list: Issue dicts completed by this piece
+        """
+        if self.head_size < 500:
+            self.head.append(text[:500 - self.head_size])
+            self.head_size += len(self.head[-1])
+
+        completed = []
+        for char in text:
+            if self.done:
+                break
+            if not self.started:
+                if char == '{':
+                    self.started = True
+                    self.depth = 1
+                    self.skeleton.append(char)
+                continue
+            if self.element is not None:
+                self._element_char(char, completed)
+            elif self.in_issues and self.depth == 2 and char != ']':
+                if char != ',' and not char.isspace():
+                    # Start of the next element; separators are dropped
+                    self.element = []
+                    self._element_char(char, completed)
+            else:
+                self._skeleton_char(char)
+        return completed
+
+    def _element_char(self, char, completed):
+        """One character of an ``issues`` element: an object, a string or a bare literal"""
+        if self.in_string:
+            self.element.append(char)
+            if self.escape:
+                self.escape = False
+            elif char == '\\':
+                self.escape = True
+            elif char == '"':
+                self.in_string = False
+                if self.depth == 2:
+                    self._finish_element(completed)
+        elif char == '"':
+            self.element.append(char)
+            self.in_string = True
+        elif char in '{[':
+            self.element.append(char)
+            self.depth += 1
+        elif self.depth == 2 and (char in ',}]' or char.isspace()):
+            # End of a bare literal; a closing bracket still belongs to the skeleton
+            self._finish_element(completed)
+            if char in '}]':
+                self._skeleton_char(char)
+        elif char in '}]':
+            self.element.append(char)
+            self.depth -= 1
+            if self.depth == 2:
+                self._finish_element(completed)
+        else:
+            self.element.append(char)
+
+    def _finish_element(self, completed):
+        try:
+            issue, changed = normalize_issue(json.loads(''.join(self.element)))
+        except ValueError:
+            issue, changed = None, True
+        if issue is not None:
+            self.issues.append(issue)
+            completed.append(issue)
+        self.issues_salvaged = self.issues_salvaged or changed
+        self.element = None
+
+    def _skeleton_char(self, char):
+        self.skeleton.append(char)
+        if self.in_string:
+            if self.escape:
+                self.escape = False
+            elif char == '\\':
+                self.escape = True
+            elif char == '"':
+                self.in_string = False
+                if self.string is not None:
+                    self.last_string = ''.join(self.string)
+                    self.string = None
+            elif self.string is not None:
+                self.string.append(char)
+            return
+
+        if char == '"':
+            self.in_string = True
+            self.string = [] if self.depth == 1 else None
+        elif char == ':' and self.depth == 1:
+            self.key = self.last_string
+        elif char in '{[':
+            self.depth += 1
+            if char == '[' and self.depth == 2 and self.key == 'issues':
+                self.in_issues = True
+        elif char in '}]':
+            self.depth -= 1
+            if self.depth == 1:
+                self.in_issues = False
+            elif self.depth == 0:
+                self.done = True
+
+    def result(self):
+        """The complete analysis, normalized, with every parsed issue"""
+        text = ''.join(self.skeleton) if self.started else ''.join(self.head)
+        analysis = parse_ai_response(text)
+        analysis['issues'] = list(self.issues)
+        if self.issues_salvaged and 'issues' not in analysis['salvaged']:
+            analysis['salvaged'].append('issues')
+        return analysis
@@ -0,0 +1,113 @@
+# apps/webhooks/review_cache.py
+"""
+Content-addressed cache of per-file review results
+
+Entries are keyed by a hash of the normalized file diff plus the model
+name and prompt version, so an unchanged file is never sent to the model
+twice and a model or prompt change invalidates everything at once.
+
+Backends (REVIEW_CACHE_BACKEND):
+    'cache' - a Django cache alias (REVIEW_CACHE_ALIAS); eviction follows
+              that cache's own culling. Redis when SHARED_CACHE_URL is set
+    'db'    - the FileReviewCache table, trimmed to REVIEW_CACHE_MAX_ENTRIES
+              least recently used rows; the default otherwise, as a
+              per-process cache would miss across workers and restarts
+    ''      - disabled
+"""
+import hashlib
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from .models import FileReviewCache
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_file_diff(file_diff):
+    """
+    Diff text with incidental noise removed: ``index`` lines (blob hashes
+    change whenever the base moves) and trailing whitespace/CR characters
+    """
+    lines = [
+        line.rstrip()
+        for line in file_diff.text.splitlines()
+        if not line.startswith('index ')
+    ]
+    return '\n'.join(lines)
+
+
+def file_cache_key(file_diff, model, prompt_version):
+    """Content address for one file's review"""
+    digest = hashlib.sha256()
+    digest.update(f"{model}\0{prompt_version}\0".encode())
+    digest.update(normalize_file_diff(file_diff).encode())
+    return digest.hexdigest()
+
+
+class DjangoCacheBackend:
+    """Stores entries in a Django cache alias"""
+
+    prefix = 'review-file:'
+
+    def __init__(self, alias, timeout):
+        self.cache = caches[alias]
+        self.timeout = timeout
+
+    def get_many(self, keys):
+        found = self.cache.get_many([self.prefix + key for key in keys])
+        return {key[len(self.prefix):]: value for key, value in found.items()}
+
+    def set_many(self, entries):
+        self.cache.set_many(
+            {self.prefix + key: value for key, value in entries.items()},
+            timeout=self.timeout
+        )
+
+
+class DatabaseBackend:
+    """Stores entries in the FileReviewCache table with LRU trimming"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+
+    def get_many(self, keys):
+        rows = list(FileReviewCache.objects.filter(key__in=list(keys)))
+        if rows:
+            FileReviewCache.objects.filter(pk__in=[row.pk for row in rows]).update(
+                last_used_at=timezone.now()
+            )
+        return {row.key: row.data for row in rows}
+
+    def set_many(self, entries):
+        if not entries:
+            return
+        FileReviewCache.objects.bulk_create(
+            [FileReviewCache(key=key, data=value) for key, value in entries.items()],
+            ignore_conflicts=True
+        )
+        self.evict()
+
+    def evict(self):
+        """Delete the least recently used rows beyond ``max_entries``"""
+        excess = FileReviewCache.objects.count() - self.max_entries
+        if excess > 0:
+            stale = list(
+                FileReviewCache.objects
+                .order_by('last_used_at', 'pk')
+                .values_list('pk', flat=True)[:excess]
+            )
+            FileReviewCache.objects.filter(pk__in=stale).delete()
+            logger.info(f"Evicted {len(stale)} file review cache entries")
+
+
+def get_backend():
+    """Configured cache backend, or None when caching is disabled"""
+    backend = settings.REVIEW_CACHE_BACKEND
+    if backend == 'cache':
+        return DjangoCacheBackend(settings.REVIEW_CACHE_ALIAS, settings.REVIEW_CACHE_TIMEOUT)
+    if backend == 'db':
+        return DatabaseBackend(settings.REVIEW_CACHE_MAX_ENTRIES)
+    return None
@@ -0,0 +1,152 @@
+# apps/webhooks/scheduler.py
+"""
+Per-PR review coalescing
+
+Every review-triggering event bumps the PR's ScheduledReview generation
+and pushes its due time out by REVIEW_DEBOUNCE_SECONDS. A burst of pushes
+therefore collapses into a single review of the latest head SHA: delayed
+tasks carrying an older generation find the job moved on and exit, and a
+review already in flight checks the generation before each expensive step
+and abandons its result once a newer head has arrived.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import ScheduledReview
+
+logger = logging.getLogger(__name__)
+
+
+class ReviewSuperseded(Exception):
+    """Raised when a newer head SHA arrives while a review is running"""
+
+
+def schedule_review(pull_request, head_sha='', delay=None):
+    """
+    Schedule (or reschedule) the review of a pull request
+
+    Args:
+        pull_request: PullRequest model instance
+        head_sha: Head commit the review should cover
+        delay: Quiet window in seconds (defaults to REVIEW_DEBOUNCE_SECONDS)
+
+    Returns:
+        int: Generation of the scheduled job
+    """
+    if delay is None:
+        delay = settings.REVIEW_DEBOUNCE_SECONDS
+    due_at = timezone.now() + timedelta(seconds=delay)
+
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                job, created = ScheduledReview.objects.select_for_update().get_or_create(
+                    pull_request=pull_request,
+                    defaults={'head_sha': head_sha, 'due_at': due_at}
+                )
+        except IntegrityError:
+            # A concurrent first event created the row; lock it and coalesce into it
+            job, created = ScheduledReview.objects.select_for_update().get(pull_request=pull_request), False
+        if not created:
+            job.generation += 1
+            job.head_sha = head_sha
+            job.due_at = due_at
+            job.started_at = None
+            job.save(update_fields=['generation', 'head_sha', 'due_at', 'started_at', 'updated_at'])
+            logger.info(f"Coalesced review of PR #{pull_request.pr_number} into generation {job.generation}")
+
+    enqueue_review(pull_request.pk, job.generation, delay)
+    return job.generation
+
+
+def enqueue_review(pull_request_id, generation, delay=0):
+    """Send the delayed review task once the current transaction commits"""
+    from .tasks import run_scheduled_review
+
+    def _send():
+        try:
+            run_scheduled_review.apply_async((pull_request_id, generation), countdown=delay)
+        except Exception as e:
+            # The job row survives; dispatch_due_reviews re-sends it
+            logger.error(f"Failed to enqueue review for PR {pull_request_id}: {str(e)}")
+
+    transaction.on_commit(_send)
+
+
+def claim(pull_request_id, generation):
+    """
+    Mark a due job as started
+
+    Returns:
+        ScheduledReview: The claimed job, or None if it was superseded,
+        is not due yet or is already running elsewhere
+    """
+    now = timezone.now()
+    claimed = ScheduledReview.objects.filter(
+        pull_request_id=pull_request_id,
+        generation=generation,
+        started_at__isnull=True,
+        due_at__lte=now
+    ).update(started_at=now)
+
+    if not claimed:
+        return None
+    return ScheduledReview.objects.select_related('pull_request__repository').get(
+        pull_request_id=pull_request_id
+    )
+
+
+def is_current(pull_request_id, generation):
+    """Check that no newer event superseded this generation"""
+    return ScheduledReview.objects.filter(
+        pull_request_id=pull_request_id,
+        generation=generation
+    ).exists()
+
+
+def ensure_current(pull_request_id, generation):
+    """Raise ReviewSuperseded if a newer head arrived"""
+    if not is_current(pull_request_id, generation):
+        raise ReviewSuperseded(f"PR {pull_request_id} generation {generation} superseded")
+
+
+def release(pull_request_id, generation, countdown=0):
+    """
+    Return a claimed job to the queue, due again in ``countdown`` seconds
+
+    Pass the retry countdown, so dispatch_due_reviews does not re-send the
+    job before the retried task runs.
+    """
+    ScheduledReview.objects.filter(
+        pull_request_id=pull_request_id,
+        generation=generation
+    ).update(started_at=None, due_at=timezone.now() + timedelta(seconds=countdown))
+
+
+def finish(pull_request_id, generation):
+    """Remove a completed job unless a newer generation replaced it meanwhile"""
+    ScheduledReview.objects.filter(
+        pull_request_id=pull_request_id,
+        generation=generation
+    ).delete()
+
+
+def overdue_jobs():
+    """
+    Jobs whose task was lost: never started well past their due time, or
+    started by a worker that has held them longer than the lease
+    """
+    now = timezone.now()
+    grace = timedelta(seconds=max(settings.REVIEW_DEBOUNCE_SECONDS, 60))
+    lease = timedelta(seconds=settings.REVIEW_JOB_LEASE_SECONDS)
+
+    never_started = ScheduledReview.objects.filter(
+        started_at__isnull=True,
+        due_at__lte=now - grace
+    )
+    stuck = ScheduledReview.objects.filter(started_at__lte=now - lease)
+    return list(never_started) + list(stuck)
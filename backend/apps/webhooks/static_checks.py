@@ -0,0 +1,292 @@
+# apps/webhooks/static_checks.py
+"""
+Local static checks over diff hunks
+
+Hard-coded secrets, ``DEBUG = True``, ``eval``/``exec``, ``shell=True``,
+SQL built with string formatting and oversized migrations are found with
+regexes over added lines, and with the Python AST for ``.py`` hunks that
+parse on their own (so a match in a comment or string is not reported).
+Findings become ReviewIssues like model issues do, and each prompt lists
+the findings for its files so the model does not spend tokens reporting
+them again.
+
+Large diffs are checked in a process pool (STATIC_CHECK_WORKERS) once
+they reach STATIC_CHECK_PARALLEL_MIN_LINES added lines; below that the
+pool's IPC costs more than it saves.
+"""
+import ast
+import logging
+import multiprocessing
+import os
+import re
+import textwrap
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# kind -> (severity, title, suggestion)
+RULES = {
+    'secret': ('high', 'Hard-coded secret', 'Load the value from the environment or a secret store and rotate it'),
+    'debug': ('medium', 'DEBUG enabled', "Read DEBUG from the environment and keep it off in production"),
+    'eval': ('high', 'Dynamic code execution (eval/exec)', 'Parse the input explicitly instead of executing it'),
+    'shell': ('high', 'Subprocess call with shell=True', 'Pass an argument list without shell=True'),
+    'sql': ('high', 'SQL built with string formatting', 'Use query parameters instead of formatting values into SQL'),
+    'migration': ('medium', 'Oversized migration', 'Split the migration and check it against production-sized tables'),
+}
+
+# Well-known credential formats, checked on every added line
+TOKEN_SECRETS = re.compile(
+    r'AKIA[0-9A-Z]{16}|-----BEGIN (?:RSA |EC |DSA |OPENSSH )?PRIVATE KEY-----|\bgh[pousr]_[A-Za-z0-9]{36}'
+    r'|\bxox[baprs]-[A-Za-z0-9-]{10,}|\bsk-(?:ant-)?[A-Za-z0-9_-]{20,}'
+)
+SECRET_NAME = re.compile(r'(?i)(secret|passw(or)?d|api_?key|access_?key|auth_?token|private_?key)')
+# Line regexes, replaced by ``ast_findings`` for .py hunks that parse
+LINE_RULES = [
+    ('secret', re.compile(
+        r'(?i)\b\w*(?:secret|passw(?:or)?d|api_?key|access_?key|auth_?token|private_?key)\w*["\']?\s*[:=]\s*'
+        r'["\'][^"\'\s{}<>]{8,}["\']'
+    )),
+    ('debug', re.compile(r'^\s*DEBUG\s*=\s*True\b')),
+    ('eval', re.compile(r'(?<![\w.])(?:eval|exec)\s*\(')),
+    ('shell', re.compile(r'\bshell\s*=\s*True\b')),
+    ('sql', re.compile(
+        r'\.(?:execute|executemany|raw|extra)\s*\(\s*(?:f["\']|["\'][^"\']*["\']\s*(?:%|\.format\(|\+))'
+    )),
+]
+# Shorter values assigned to secret-looking names are usually placeholders
+MIN_SECRET_LENGTH = 8
+
+MIGRATION_PATH = re.compile(r'(^|/)migrations/[^/]+\.(py|sql)$')
+MIGRATION_MAX_LINES = 300
+
+
+def finding(kind, path, line):
+    severity, title, suggestion = RULES[kind]
+    return {
+        'severity': severity,
+        'title': title,
+        'file': path,
+        'line': line,
+        'suggestion': suggestion,
+        'source': 'static',
+        'rule': kind,
+    }
+
+
+def new_side(start, lines):
+    """
+    New-file line number and text of each added and context line of a hunk
+
+    Returns:
+        list: (line number, text, whether added)
+    """
+    numbered, number = [], start
+    for line in lines:
+        if line.startswith('+'):
+            numbered.append((number, line[1:], True))
+            number += 1
+        elif line.startswith(' ') or line == '':
+            numbered.append((number, line[1:], False))
+            number += 1
+    return numbered
+
+
+def check_hunk(path, start, lines):
+    """
+    Findings on the added lines of one hunk
+
+    Args:
+        path: File path
+        start: New-file line number of the hunk's first line
+        lines: Hunk body lines, with their +/-/space prefixes
+
+    Returns:
+        list: Finding dicts, at most one per kind and line
+    """
+    numbered = new_side(start, lines)
+    added = {number for number, _, is_added in numbered if is_added}
+    if not added:
+        return []
+
+    found = set()
+    line_rules = LINE_RULES
+    if path.endswith('.py'):
+        tree = parse_fragment([text for _, text, _ in numbered])
+        if tree is not None:
+            first = numbered[0][0]
+            found.update(
+                (kind, first + offset - 1) for kind, offset in ast_findings(tree)
+                if first + offset - 1 in added
+            )
+            line_rules = []
+
+    for number, text, is_added in numbered:
+        if not is_added:
+            continue
+        if TOKEN_SECRETS.search(text):
+            found.add(('secret', number))
+        for kind, pattern in line_rules:
+            if pattern.search(text):
+                found.add((kind, number))
+
+    return [finding(kind, path, line) for kind, line in sorted(found, key=lambda f: (f[1], f[0]))]
+
+
+def parse_fragment(lines):
+    """AST of a hunk's new side, or None if the fragment does not parse on its own"""
+    try:
+        return ast.parse(textwrap.dedent('\n'.join(lines)))
+    except (SyntaxError, ValueError):
+        return None
+
+
+def ast_findings(tree):
+    """(kind, line within the fragment) for each risky node"""
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call):
+            func = node.func
+            name = func.id if isinstance(func, ast.Name) else func.attr if isinstance(func, ast.Attribute) else ''
+            if name in ('eval', 'exec') and isinstance(func, ast.Name):
+                yield 'eval', node.lineno
+            if any(k.arg == 'shell' and isinstance(k.value, ast.Constant) and k.value.value is True
+                   for k in node.keywords):
+                yield 'shell', node.lineno
+            if name in ('execute', 'executemany', 'raw', 'extra') and node.args and formatted_string(node.args[0]):
+                yield 'sql', node.lineno
+
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            names = [t.id if isinstance(t, ast.Name) else t.attr if isinstance(t, ast.Attribute) else ''
+                     for t in targets]
+            value = node.value
+            if not isinstance(value, ast.Constant):
+                continue
+            if 'DEBUG' in names and value.value is True:
+                yield 'debug', node.lineno
+            if isinstance(value.value, str) and len(value.value) >= MIN_SECRET_LENGTH \
+                    and not re.search(r'[\s{}<>]', value.value) \
+                    and any(SECRET_NAME.search(name) for name in names):
+                yield 'secret', node.lineno
+
+
+def formatted_string(node):
+    """Whether an expression builds a string with f-strings, % or .format() / +"""
+    if isinstance(node, ast.JoinedStr):
+        return any(isinstance(v, ast.FormattedValue) for v in node.values)
+    if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Mod, ast.Add)):
+        left = node.left
+        return isinstance(left, ast.JoinedStr) or isinstance(left, ast.Constant) and isinstance(left.value, str)
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == 'format':
+        return isinstance(node.func.value, ast.Constant) and isinstance(node.func.value.value, str)
+    return False
+
+
+def check_units(units):
+    """``check_hunk`` over (path, start, lines) units; runs in pool workers"""
+    found = []
+    for unit in units:
+        found += check_hunk(*unit)
+    return found
+
+
+class PoolHolder:
+    """One lazily started process pool per process (a forked child builds its own)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid = None
+        self.pool = None
+        self.workers = 0
+
+    def get(self, workers):
+        with self.lock:
+            if self.pool is None or self.pid != os.getpid() or self.workers != workers:
+                if self.pool is not None and self.pid == os.getpid():
+                    self.pool.shutdown(wait=False)
+                self.pool = ProcessPoolExecutor(max_workers=workers)
+                self.pid = os.getpid()
+                self.workers = workers
+            return self.pool
+
+    def reset(self):
+        with self.lock:
+            if self.pool is not None and self.pid == os.getpid():
+                self.pool.shutdown()
+            self.pool = None
+
+
+pools = PoolHolder()
+
+
+def check_files(files, workers=None, min_parallel_lines=None):
+    """
+    Run every rule over the added lines of a diff
+
+    Args:
+        files: FileDiff list
+        workers: Pool size (default STATIC_CHECK_WORKERS); 0 or 1 checks in-process
+        min_parallel_lines: Added lines below which the pool is not used
+            (default STATIC_CHECK_PARALLEL_MIN_LINES)
+
+    Returns:
+        list: Finding dicts: oversized migrations, then hunk findings in diff order
+    """
+    workers = settings.STATIC_CHECK_WORKERS if workers is None else workers
+    if min_parallel_lines is None:
+        min_parallel_lines = settings.STATIC_CHECK_PARALLEL_MIN_LINES
+
+    found = []
+    units = []
+    for file_diff in files:
+        if file_diff.is_deleted or file_diff.is_binary:
+            continue
+        units += [(file_diff.path, hunk.new_start, hunk.lines) for hunk in file_diff.hunks]
+        if MIGRATION_PATH.search(file_diff.path) and file_diff.additions > MIGRATION_MAX_LINES:
+            found.append(finding('migration', file_diff.path, file_diff.hunks[0].new_start if file_diff.hunks else None))
+
+    added = sum(line.startswith('+') for _, _, lines in units for line in lines)
+    # Daemonic processes (e.g. some worker pools) may not start children
+    if workers > 1 and added >= min_parallel_lines and not multiprocessing.current_process().daemon:
+        size = max(1, len(units) // (workers * 4))
+        batches = [units[i:i + size] for i in range(0, len(units), size)]
+        try:
+            found += [f for batch_found in pools.get(workers).map(check_units, batches) for f in batch_found]
+        except BrokenProcessPool as e:
+            logger.warning(f"Static check pool failed, checking in-process: {str(e)}")
+            pools.reset()
+            found += check_units(units)
+    else:
+        found += check_units(units)
+
+    if found:
+        logger.info(f"Static checks: {len(found)} finding(s) in {added} added lines")
+    return found
+
+
+def format_hints(findings):
+    """Prompt lines for findings the model should not report again"""
+    return '\n'.join(f"- {f['file']}:{f['line'] or '?'} {f['title']}" for f in findings)
+
+
+def merge_findings(analysis, findings):
+    """
+    Add static findings to a model analysis
+
+    Model issues on a line a finding already covers are dropped, and a
+    high-severity finding makes the change not deployment ready.
+    """
+    if not findings:
+        return analysis
+    covered = {(f['file'], f['line']) for f in findings}
+    issues = [
+        issue for issue in analysis.get('issues') or []
+        if not isinstance(issue, dict) or (issue.get('file'), issue.get('line')) not in covered
+    ]
+    merged = dict(analysis, issues=list(findings) + issues)
+    if any(f['severity'] == 'high' for f in findings):
+        merged['deploymentReady'] = False
+    return merged
@@ -0,0 +1,132 @@
+# apps/webhooks/tasks.py
+"""
+Celery tasks for webhook processing
+"""
+import logging
+
+from celery import shared_task
+from django.conf import settings
+
+from apps.repos.models import Repository
+
+from . import batch_review, inbox, provider_budget, rate_limit, scheduler
+from .handler import process_delivery, review_pull_request
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True, ignore_result=True)
+def drain_webhook_inbox(self, batch_size=None):
+    """Process one batch of inbox deliveries, re-enqueueing while work remains"""
+    batch_size = batch_size or settings.WEBHOOK_INBOX_BATCH_SIZE
+    batch = inbox.claim_batch(batch_size)
+
+    for delivery in batch:
+        try:
+            process_delivery(delivery)
+            inbox.mark_processed(delivery)
+        except Exception as e:
+            logger.error(f"Error processing webhook delivery {delivery.pk}: {str(e)}", exc_info=True)
+            inbox.mark_failed(delivery, e)
+
+    # A full batch means there is probably more waiting behind it
+    if len(batch) >= batch_size:
+        drain_webhook_inbox.delay(batch_size)
+
+    return len(batch)
+
+
+@shared_task(bind=True, ignore_result=True, max_retries=3)
+def run_scheduled_review(self, pull_request_id, generation, requeues=None):
+    """
+    Run a debounced PR review unless a newer head superseded it
+
+    A review that runs out of model capacity, or of its token's provider
+    budget, is requeued for when the limit clears, rather than stored with
+    parts missing. ``requeues`` counts earlier requeues per cause, so each
+    cause is limited on its own instead of by the task's shared retry count.
+    """
+    requeues = requeues or {}
+    job = scheduler.claim(pull_request_id, generation)
+    if job is None:
+        logger.info(f"Skipping review of PR {pull_request_id} generation {generation}: superseded or not due")
+        return
+
+    try:
+        review_pull_request(job.pull_request, generation=generation)
+    except scheduler.ReviewSuperseded:
+        logger.info(f"Review of PR {pull_request_id} generation {generation} superseded mid-flight")
+        return
+    except rate_limit.RateLimited as e:
+        logger.warning(f"Review of PR {pull_request_id} rate limited, requeueing in {e.retry_after:.0f}s")
+        requeue(self, pull_request_id, generation, requeues, 'rate_limited', e, max(1, round(e.retry_after)),
+                settings.AI_RATE_LIMIT_MAX_REQUEUES)
+    except provider_budget.BudgetExhausted as e:
+        logger.warning(f"Review of PR {pull_request_id} deferred: {str(e)}")
+        requeue(self, pull_request_id, generation, requeues, 'budget', e, max(1, round(e.retry_after)),
+                settings.PROVIDER_BUDGET_MAX_REQUEUES)
+    except Exception as e:
+        logger.error(f"Error reviewing PR {pull_request_id}: {str(e)}", exc_info=True)
+        errors = requeues.get('error', 0)
+        if errors < self.max_retries:
+            requeue(self, pull_request_id, generation, requeues, 'error', e, 60 * (errors + 1),
+                    self.max_retries)
+
+    scheduler.finish(pull_request_id, generation)
+
+
+def requeue(task, pull_request_id, generation, requeues, cause, exc, countdown, max_requeues):
+    """
+    Retry a review task in ``countdown`` seconds, or drop its job once
+    ``max_requeues`` for ``cause`` are used up so it is not re-dispatched
+    forever
+
+    Raises:
+        celery.exceptions.Retry: The task was retried
+        Exception: ``exc``, when the requeues are used up
+    """
+    used = requeues.get(cause, 0)
+    if used >= max_requeues:
+        logger.error(f"Giving up on review of PR {pull_request_id} after {used} requeues ({cause})")
+        scheduler.finish(pull_request_id, generation)
+        raise exc
+    scheduler.release(pull_request_id, generation, countdown)
+    # The per-cause count above is the limit; Celery's own count spans every cause
+    raise task.retry(
+        args=(pull_request_id, generation),
+        kwargs={'requeues': dict(requeues, **{cause: used + 1})},
+        exc=exc,
+        countdown=countdown,
+        max_retries=task.request.retries + 1,
+    )
+
+
+@shared_task(ignore_result=True)
+def dispatch_due_reviews():
+    """Re-send review jobs whose delayed task was lost or whose worker died"""
+    for job in scheduler.overdue_jobs():
+        scheduler.release(job.pull_request_id, job.generation)
+        scheduler.enqueue_review(job.pull_request_id, job.generation)
+
+
+@shared_task(bind=True, ignore_result=True)
+def submit_review_backfill(self, repository_id, state='all', limit=None):
+    """
+    Submit batch reviews for a repository's unreviewed pull requests
+
+    Retried after the token's reset when its provider budget is too low to
+    list them.
+    """
+    repository = Repository.objects.get(pk=repository_id)
+    try:
+        batch_review.backfill_repository(repository, state=state, limit=limit)
+    except provider_budget.BudgetExhausted as e:
+        logger.warning(f"Backfill of {repository.full_name} deferred: {str(e)}")
+        raise self.retry(exc=e, countdown=max(1, round(e.retry_after)),
+                         max_retries=settings.PROVIDER_BUDGET_MAX_REQUEUES)
+
+
+@shared_task(ignore_result=True)
+def poll_review_batches():
+    """Import review batches the provider has finished"""
+    return batch_review.poll_batches()
@@ -0,0 +1,298 @@
+# apps/webhooks/triage.py
+"""
+Pre-model triage of diff files
+
+Lockfiles, generated and vendored code, minified assets, binaries and
+docs cost model tokens without yielding useful review comments. Each file
+is classified by path patterns, the repository's ``.gitattributes``
+linguist markers on the target branch (a PR cannot mark its own files as
+generated) and cheap content heuristics; files in a
+REVIEW_TRIAGE_SKIP category are dropped before the review is planned.
+When nothing reviewable remains the review is completed locally. Skipped
+generated and minified code still goes through the static checks, so a
+file mistaken for either cannot hide a finding.
+
+Skipped files, bytes and tokens are counted per repository (TriageStats).
+"""
+import logging
+import re
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db.models import F
+
+from . import static_checks
+from .ai_analyzer import SEVERITY_RISK
+from .diffs import estimate_tokens, parse_diff
+from .models import TriageStats
+from .ultis import fetch_file
+
+logger = logging.getLogger(__name__)
+
+# (category, pattern) matched against the file path; first match wins
+PATH_RULES = [
+    ('lockfile', re.compile(
+        r'(^|/)(package-lock\.json|npm-shrinkwrap\.json|yarn\.lock|pnpm-lock\.yaml|poetry\.lock|Pipfile\.lock'
+        r'|uv\.lock|Cargo\.lock|Gemfile\.lock|composer\.lock|go\.sum|mix\.lock|pubspec\.lock|packages\.lock\.json)$'
+    )),
+    ('vendored', re.compile(r'(^|/)(vendor|vendors|node_modules|third[_-]party|bower_components)/')),
+    ('generated', re.compile(
+        r'_pb2(_grpc)?\.pyi?$|\.pb\.(go|cc|h)$|\.g\.dart$|\.designer\.cs$|(^|/)__snapshots__/|\.snap$'
+        r'|(^|/)dist/'
+    )),
+    ('minified', re.compile(r'\.min\.(js|css)$|\.(js|css)\.map$')),
+    ('binary', re.compile(
+        r'\.(png|jpe?g|gif|bmp|ico|webp|pdf|zip|gz|tgz|jar|whl|woff2?|ttf|otf|eot|mp[34]|mov|so|dylib|dll|exe)$', re.I
+    )),
+    ('docs', re.compile(r'\.(md|markdown|rst|adoc)$|(^|/)docs?/|(^|/)(LICENSE|CHANGELOG|AUTHORS|NOTICE)[^/]*$', re.I)),
+]
+
+# .gitattributes linguist attributes and the category they mark
+ATTRIBUTE_CATEGORIES = {
+    'linguist-generated': 'generated',
+    'linguist-vendored': 'vendored',
+    'linguist-documentation': 'docs',
+    'binary': 'binary',
+}
+
+# Markers generators leave in the first lines of their output
+GENERATED_MARKER = re.compile(r'@generated|DO NOT EDIT|Code generated .* DO NOT EDIT|auto-?generated', re.I)
+GENERATED_MARKER_LINES = 10
+
+# Added lines this long on average are minified or machine-written, in
+# the asset types minifiers produce (a long line of source is still source)
+MINIFIED_MEAN_LINE = 300
+MINIFIABLE_PATH = re.compile(r'\.(js|mjs|cjs|css|map)$', re.I)
+# Skipped categories left out of the static checks: not code, or
+# third-party code whose findings the PR author cannot act on
+UNCHECKED_CATEGORIES = {'lockfile', 'binary', 'docs', 'vendored'}
+
+
+@dataclass
+class TriageResult:
+    kept: list = field(default_factory=list)     # FileDiff
+    skipped: list = field(default_factory=list)  # (path, category, bytes, tokens)
+    findings: list = field(default_factory=list)  # static check findings in skipped files
+
+    @property
+    def diff(self):
+        """Unified diff of the kept files"""
+        return ''.join(f.text + '\n' for f in self.kept)
+
+    @property
+    def skipped_bytes(self):
+        return sum(size for _, _, size, _ in self.skipped)
+
+    @property
+    def skipped_tokens(self):
+        return sum(tokens for _, _, _, tokens in self.skipped)
+
+    def counts(self):
+        """Skipped files per category"""
+        counts = {}
+        for _, category, _, _ in self.skipped:
+            counts[category] = counts.get(category, 0) + 1
+        return counts
+
+
+def skip_categories():
+    return {c.strip() for c in settings.REVIEW_TRIAGE_SKIP.split(',') if c.strip()}
+
+
+def glob_regex(pattern):
+    """
+    Regex for a .gitattributes pattern
+
+    Patterns without a slash match the file name at any depth; others are
+    anchored at the repository root. ``*`` stays within a directory and
+    ``**`` crosses them.
+    """
+    anchored = '/' in pattern.rstrip('/')
+    pattern = pattern.lstrip('/')
+    parts, i = [], 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            parts.append('(?:.*/)?')
+            i += 3
+        elif pattern.startswith('**', i):
+            parts.append('.*')
+            i += 2
+        elif pattern[i] == '*':
+            parts.append('[^/]*')
+            i += 1
+        elif pattern[i] == '?':
+            parts.append('[^/]')
+            i += 1
+        else:
+            parts.append(re.escape(pattern[i]))
+            i += 1
+    prefix = '' if anchored else '(?:.*/)?'
+    return re.compile(f"^{prefix}{''.join(parts)}(?:/.*)?$")
+
+
+def parse_gitattributes(text):
+    """
+    Linguist rules from a .gitattributes file
+
+    Returns:
+        list: (compiled pattern, {category: bool}) in file order; later
+            rules override earlier ones
+    """
+    rules = []
+    for line in (text or '').splitlines():
+        fields = line.split()
+        if not fields or fields[0].startswith('#'):
+            continue
+        marks = {}
+        for attribute in fields[1:]:
+            value = not attribute.startswith(('-', '!'))
+            name, _, setting = attribute.lstrip('-!').partition('=')
+            if setting:
+                value = setting.lower() in ('true', 'set', '1')
+            if name in ATTRIBUTE_CATEGORIES:
+                marks[ATTRIBUTE_CATEGORIES[name]] = value
+        if marks:
+            rules.append((glob_regex(fields[0]), marks))
+    return rules
+
+
+def attribute_marks(path, rules):
+    """{category: bool} a file is marked with in .gitattributes"""
+    marks = {}
+    for pattern, rule_marks in rules:
+        if pattern.match(path):
+            marks.update(rule_marks)
+    return marks
+
+
+def content_category(file_diff):
+    """Category from the diff content itself, or None"""
+    if file_diff.is_binary:
+        return 'binary'
+
+    if MINIFIABLE_PATH.search(file_diff.path):
+        added = [line[1:] for hunk in file_diff.hunks for line in hunk.lines if line.startswith('+')]
+        if added and sum(len(line) for line in added) / len(added) > MINIFIED_MEAN_LINE:
+            return 'minified'
+
+    for hunk in file_diff.hunks:
+        if hunk.new_start > GENERATED_MARKER_LINES:
+            continue
+        head = hunk.lines[:GENERATED_MARKER_LINES - hunk.new_start + 1]
+        if any(not line.startswith('-') and GENERATED_MARKER.search(line) for line in head):
+            return 'generated'
+    return None
+
+
+def classify(file_diff, rules=()):
+    """
+    Triage category of one file, or None if it should be reviewed
+
+    ``.gitattributes`` marks win over path patterns (``-linguist-generated``
+    keeps a file a path pattern would skip), which win over content
+    heuristics.
+    """
+    marks = attribute_marks(file_diff.path, rules)
+    category = next((category for category, value in marks.items() if value), None)
+    if category:
+        return category
+    for name, pattern in PATH_RULES:
+        if pattern.search(file_diff.path) and name not in marks:
+            return name
+    category = content_category(file_diff)
+    return None if category in marks else category
+
+
+def triage_diff(diff_content, gitattributes=''):
+    """
+    Split a diff into files to review and files to skip
+
+    Args:
+        diff_content: Unified diff text
+        gitattributes: The repository's .gitattributes on the target branch
+
+    Returns:
+        TriageResult: or None if the text is not a git diff
+    """
+    return triage_files(parse_diff(diff_content), gitattributes)
+
+
+def triage_files(files, gitattributes=''):
+    """
+    ``triage_diff`` over FileDiffs, e.g. a SpooledDiff's ``files()``
+
+    Only kept files are held on to, so skipped ones can be streamed past;
+    skipped code is run through the static checks on the way.
+
+    Returns:
+        TriageResult: or None if there are no files
+    """
+    skip = skip_categories()
+    rules = parse_gitattributes(gitattributes)
+    result = TriageResult()
+    for file_diff in files:
+        category = classify(file_diff, rules)
+        if category in skip:
+            text = file_diff.text
+            result.skipped.append((file_diff.path, category, len(text.encode()) + 1, estimate_tokens(text)))
+            if settings.STATIC_CHECKS and category not in UNCHECKED_CATEGORIES:
+                result.findings += static_checks.check_files([file_diff], workers=0)
+        else:
+            result.kept.append(file_diff)
+    if not result.kept and not result.skipped:
+        return None
+    return result
+
+
+def triage_pull_request(pull_request, diff, gitattributes=None):
+    """
+    ``triage_diff`` with the repository's .gitattributes on the PR's target
+    branch; read at the head, a PR could mark its own files to skip review
+
+    Args:
+        diff: Unified diff text, or an iterable of FileDiffs
+        gitattributes: The target branch's .gitattributes if the caller
+            already read it ('' when there is none); fetched when None
+
+    Returns:
+        TriageResult: or None when triage is off or there are no git diff files
+    """
+    if not skip_categories():
+        return None
+    base = pull_request.target_branch
+    if gitattributes is None and base:
+        gitattributes = fetch_file(pull_request, '.gitattributes', base)
+    files = parse_diff(diff) if isinstance(diff, str) else diff
+    return triage_files(files, gitattributes or '')
+
+
+def local_analysis(result):
+    """Review completed without the model: nothing reviewable remains but static findings"""
+    counts = ', '.join(f"{count} {category}" for category, count in sorted(result.counts().items()))
+    analysis = {
+        'summary': f"No reviewable code changes ({counts}); skipped without a model review.",
+        'riskScore': max([SEVERITY_RISK.get(f['severity'], 20) for f in result.findings], default=0),
+        'issues': [],
+        'recommendations': [],
+        'blockers': [],
+        'deploymentReady': True,
+        'triaged': [path for path, _, _, _ in result.skipped],
+    }
+    return static_checks.merge_findings(analysis, result.findings)
+
+
+def record(repository, result, completed_locally=False):
+    """Add a triage result to the repository's counters"""
+    if not result.skipped:
+        return
+    TriageStats.objects.get_or_create(repository=repository)
+    TriageStats.objects.filter(repository=repository).update(
+        files_skipped=F('files_skipped') + len(result.skipped),
+        bytes_skipped=F('bytes_skipped') + result.skipped_bytes,
+        tokens_skipped=F('tokens_skipped') + result.skipped_tokens,
+        reviews_skipped=F('reviews_skipped') + int(completed_locally),
+    )
+    logger.info(
+        f"Triage for {repository.full_name}: skipped {len(result.skipped)} file(s), "
+        f"~{result.skipped_tokens} tokens ({result.counts()})"
+    )
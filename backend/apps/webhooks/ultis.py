@@ -2,13 +2,152 @@
 """
 Utility functions for webhook handling
 """
+import hashlib
+import hmac
 import logging
+import os
+import threading
+from urllib.parse import urlsplit
+
 import requests
 from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import git_mirror, payloads, provider_budget, provider_cache
+from .diff_stream import read_response
 
 logger = logging.getLogger(__name__)
 
 
+class SessionRegistry:
+    """
+    Keep-alive ``requests`` sessions, one per provider host per process
+
+    A bare ``requests.get`` opens a new TCP + TLS connection for every
+    call; a session keeps up to PROVIDER_HTTP_POOL_SIZE connections to its
+    host open between calls. Idempotent requests are retried with backoff
+    on connection errors and 5xx responses (PROVIDER_HTTP_RETRIES); POSTs
+    are only retried when the connection could not be made.
+
+    Keyed by PID like the model clients: a forked Celery child must not
+    reuse its parent's sockets.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.sessions = {}
+
+    def get(self, url):
+        """Session for the scheme and host of ``url``"""
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        with self.lock:
+            if self.pid != os.getpid():
+                # Forked: drop the parent's sessions without closing its sockets
+                self.pid = os.getpid()
+                self.sessions = {}
+
+            session = self.sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                retries = Retry(
+                    total=settings.PROVIDER_HTTP_RETRIES,
+                    read=settings.PROVIDER_HTTP_RETRIES,
+                    status_forcelist=(500, 502, 503, 504),
+                    backoff_factor=settings.PROVIDER_HTTP_BACKOFF,
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=settings.PROVIDER_HTTP_POOL_SIZE,
+                    max_retries=retries,
+                )
+                session.mount(f'{parts.scheme}://', adapter)
+                self.sessions[key] = session
+                logger.info(f"Created HTTP session for {parts.netloc}")
+            return session
+
+    def reset(self):
+        """Close and forget every session (tests, settings changes)"""
+        with self.lock:
+            sessions, self.sessions = self.sessions, {}
+        if self.pid == os.getpid():
+            for session in sessions.values():
+                session.close()
+
+
+sessions = SessionRegistry()
+
+
+def http_timeout():
+    return (settings.PROVIDER_HTTP_CONNECT_TIMEOUT, settings.PROVIDER_HTTP_READ_TIMEOUT)
+
+
+def budgeted(url, kwargs, send):
+    """
+    Make a provider call under its token's rate-limit budget when PROVIDER_BUDGET is on
+
+    Raises:
+        provider_budget.BudgetExhausted: Too little budget left at the current priority
+    """
+    if not settings.PROVIDER_BUDGET:
+        return send()
+    provider_budget.budget.spend(url, kwargs.get('headers'))
+    response = send()
+    try:
+        provider_budget.budget.observe(url, kwargs.get('headers'), response)
+    except Exception as e:
+        logger.warning(f"Could not update provider budget: {str(e)}")
+    return response
+
+
+def http_get(url, **kwargs):
+    """
+    GET through the host's pooled session with the provider timeouts,
+    revalidating cached responses when PROVIDER_HTTP_CACHE is on
+    """
+    kwargs.setdefault('timeout', http_timeout())
+    if settings.PROVIDER_HTTP_CACHE:
+        return budgeted(url, kwargs, lambda: provider_cache.conditional_get(sessions.get(url), url, **kwargs))
+    return budgeted(url, kwargs, lambda: sessions.get(url).get(url, **kwargs))
+
+
+def http_post(url, **kwargs):
+    """POST through the host's pooled session with the provider timeouts"""
+    kwargs.setdefault('timeout', http_timeout())
+    return budgeted(url, kwargs, lambda: sessions.get(url).post(url, **kwargs))
+
+
+def http_put(url, **kwargs):
+    """PUT through the host's pooled session with the provider timeouts"""
+    kwargs.setdefault('timeout', http_timeout())
+    return budgeted(url, kwargs, lambda: sessions.get(url).put(url, **kwargs))
+
+
+def verify_signature(secret, body, signature_header):
+    """
+    Verify an HMAC-SHA256 webhook signature
+
+    Args:
+        secret: Shared webhook secret (verification is skipped when empty)
+        body: Raw request body bytes
+        signature_header: Header value in the form ``sha256=<hexdigest>``
+
+    Returns:
+        bool: True if the signature matches or no secret is configured
+    """
+    if not secret:
+        return True
+
+    if not signature_header or not signature_header.startswith('sha256='):
+        return False
+
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature_header[len('sha256='):])
+
+
 def fetch_pr_diff(pull_request):
     """
     Fetch diff content for a pull request
@@ -17,15 +156,39 @@ def fetch_pr_diff(pull_request):
         pull_request: PullRequest model instance
         
     Returns:
-        str: Diff content or None if failed
+        str: Diff content (complete files only past REVIEW_DIFF_MAX_BYTES)
+            or None if failed
+    """
+    diff = fetch_pr_diff_stream(pull_request)
+    if diff is None:
+        return None
+    with diff:
+        return diff.text()
+
+
+def fetch_pr_diff_stream(pull_request):
+    """
+    Stream a pull request's diff into a SpooledDiff
+
+    Args:
+        pull_request: PullRequest model instance
+
+    Returns:
+        SpooledDiff: The diff, to be closed by the caller, or None if failed
     """
     try:
         repo = pull_request.repository
-        access_token = repo.user.profile.access_token
+        access_token = repo.owner.profile.access_token
         
         if not access_token:
-            logger.error(f"No access token for user {repo.user.id}")
+            logger.error(f"No access token for user {repo.owner.id}")
             return None
+
+        if settings.GIT_MIRRORS and repo.provider in git_mirror.GIT_URLS:
+            try:
+                return git_mirror.pr_diff(pull_request, access_token)
+            except git_mirror.GitError as e:
+                logger.warning(f"{str(e)}; falling back to the API")
         
         if repo.provider == 'github':
             return fetch_github_diff(pull_request, access_token)
@@ -35,15 +198,17 @@ def fetch_pr_diff(pull_request):
             logger.error(f"Unknown provider: {repo.provider}")
             return None
             
+    except provider_budget.BudgetExhausted:
+        raise
     except Exception as e:
         logger.error(f"Error fetching PR diff: {str(e)}", exc_info=True)
         return None
 
 
 def fetch_github_diff(pull_request, access_token):
-    """Fetch diff from GitHub API"""
+    """Stream diff from GitHub API into a SpooledDiff"""
     repo = pull_request.repository
-    url = f"https://api.github.com/repos/{repo.full_name}/pulls/{pull_request.pr_number}"
+    url = f"{settings.GITHUB_API_URL}/repos/{repo.full_name}/pulls/{pull_request.pr_number}"
     
     headers = {
         'Authorization': f'token {access_token}',
@@ -51,33 +216,217 @@ def fetch_github_diff(pull_request, access_token):
     }
     
     try:
-        response = requests.get(url, headers=headers, timeout=30)
+        response = http_get(url, headers=headers, stream=True)
         response.raise_for_status()
-        return response.text
+        return read_response(response)
     except requests.RequestException as e:
         logger.error(f"GitHub diff fetch failed: {str(e)}")
         return None
 
 
 def fetch_bitbucket_diff(pull_request, access_token):
-    """Fetch diff from Bitbucket API"""
+    """Stream diff from Bitbucket API into a SpooledDiff"""
     repo = pull_request.repository
     workspace, repo_slug = repo.full_name.split('/', 1)
-    url = f"https://api.bitbucket.org/2.0/repositories/{workspace}/{repo_slug}/pullrequests/{pull_request.pr_number}/diff"
+    url = f"{settings.BITBUCKET_API_URL}/repositories/{workspace}/{repo_slug}/pullrequests/{pull_request.pr_number}/diff"
     
     headers = {
         'Authorization': f'Bearer {access_token}'
     }
     
     try:
-        response = requests.get(url, headers=headers, timeout=30)
+        response = http_get(url, headers=headers, stream=True)
         response.raise_for_status()
-        return response.text
+        return read_response(response)
     except requests.RequestException as e:
         logger.error(f"Bitbucket diff fetch failed: {str(e)}")
         return None
 
 
+def fetch_compare_diff(pull_request, base_sha, head_sha):
+    """
+    Fetch the diff between two commits of a pull request's repository
+
+    Args:
+        pull_request: PullRequest model instance
+        base_sha: Older commit (the previously reviewed head)
+        head_sha: Newer commit
+
+    Returns:
+        str: Diff content or None if failed (or larger than REVIEW_DIFF_MAX_BYTES)
+    """
+    try:
+        repo = pull_request.repository
+        access_token = repo.owner.profile.access_token
+
+        if not access_token:
+            logger.error(f"No access token for user {repo.owner.id}")
+            return None
+
+        if settings.GIT_MIRRORS and repo.provider in git_mirror.GIT_URLS:
+            try:
+                with git_mirror.compare_diff(pull_request, access_token, base_sha, head_sha) as diff:
+                    return None if diff.truncated else diff.text()
+            except git_mirror.GitError as e:
+                logger.warning(f"{str(e)}; falling back to the API")
+
+        if repo.provider == 'github':
+            url = f"{settings.GITHUB_API_URL}/repos/{repo.full_name}/compare/{base_sha}...{head_sha}"
+            headers = {
+                'Authorization': f'token {access_token}',
+                'Accept': 'application/vnd.github.v3.diff'
+            }
+        elif repo.provider == 'bitbucket':
+            workspace, repo_slug = repo.full_name.split('/', 1)
+            # Bitbucket specs are source..destination
+            url = f"{settings.BITBUCKET_API_URL}/repositories/{workspace}/{repo_slug}/diff/{head_sha}..{base_sha}"
+            headers = {
+                'Authorization': f'Bearer {access_token}'
+            }
+        else:
+            logger.error(f"Unknown provider: {repo.provider}")
+            return None
+
+        response = http_get(url, headers=headers, stream=True)
+        response.raise_for_status()
+        with read_response(response) as diff:
+            # A partial interdiff would pass missing files off as unchanged
+            return None if diff.truncated else diff.text()
+
+    except provider_budget.BudgetExhausted:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching compare diff {base_sha[:7]}..{head_sha[:7]}: {str(e)}")
+        return None
+
+
+def fetch_file(pull_request, path, ref):
+    """
+    Fetch one file of a pull request's repository at a commit
+
+    Args:
+        pull_request: PullRequest model instance
+        path: File path from the repository root
+        ref: Commit SHA (or branch)
+
+    Returns:
+        str: File content, or None if it does not exist or the fetch failed
+    """
+    try:
+        repo = pull_request.repository
+        access_token = repo.owner.profile.access_token
+
+        if not access_token:
+            logger.error(f"No access token for user {repo.owner.id}")
+            return None
+
+        if settings.GIT_MIRRORS and repo.provider in git_mirror.GIT_URLS:
+            try:
+                return git_mirror.file_content(pull_request, access_token, path, ref)
+            except git_mirror.GitError as e:
+                logger.warning(f"{str(e)}; falling back to the API")
+
+        if repo.provider == 'github':
+            url = f"{settings.GITHUB_API_URL}/repos/{repo.full_name}/contents/{path}"
+            headers = {
+                'Authorization': f'token {access_token}',
+                'Accept': 'application/vnd.github.v3.raw'
+            }
+            params = {'ref': ref}
+        elif repo.provider == 'bitbucket':
+            workspace, repo_slug = repo.full_name.split('/', 1)
+            url = f"{settings.BITBUCKET_API_URL}/repositories/{workspace}/{repo_slug}/src/{ref}/{path}"
+            headers = {
+                'Authorization': f'Bearer {access_token}'
+            }
+            params = None
+        else:
+            logger.error(f"Unknown provider: {repo.provider}")
+            return None
+
+        response = http_get(url, headers=headers, params=params)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.text
+
+    except provider_budget.BudgetExhausted:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching {path} at {ref[:7]}: {str(e)}")
+        return None
+
+
+GITHUB_LIST_STATES = {'open': 'open', 'closed': 'closed', 'all': 'all'}
+BITBUCKET_LIST_STATES = {
+    'open': ['OPEN'],
+    'closed': ['MERGED', 'DECLINED', 'SUPERSEDED'],
+    'all': ['OPEN', 'MERGED', 'DECLINED', 'SUPERSEDED'],
+}
+
+
+def list_pull_requests(repository, state='all', limit=None):
+    """
+    List a repository's pull requests from the provider, newest first
+
+    Args:
+        repository: Repository model instance
+        state: 'open', 'closed' or 'all'
+        limit: Stop after this many pull requests
+
+    Returns:
+        list: (pr_number, PullRequest fields) pairs; empty if listing failed
+    """
+    access_token = repository.owner.profile.access_token
+    if not access_token:
+        logger.error(f"No access token for user {repository.owner.id}")
+        return []
+
+    found = []
+    try:
+        if repository.provider == 'github':
+            url = f"{settings.GITHUB_API_URL}/repos/{repository.full_name}/pulls"
+            headers = {
+                'Authorization': f'token {access_token}',
+                'Accept': 'application/vnd.github.v3+json'
+            }
+            page = 1
+            while limit is None or len(found) < limit:
+                response = http_get(url, headers=headers, params={
+                    'state': GITHUB_LIST_STATES[state], 'sort': 'created', 'direction': 'desc',
+                    'per_page': 100, 'page': page,
+                })
+                response.raise_for_status()
+                batch = payloads.decode_github_pull_request_list(response.content)
+                found += batch
+                if len(batch) < 100:
+                    break
+                page += 1
+
+        elif repository.provider == 'bitbucket':
+            workspace, repo_slug = repository.full_name.split('/', 1)
+            url = f"{settings.BITBUCKET_API_URL}/repositories/{workspace}/{repo_slug}/pullrequests"
+            params = [('state', s) for s in BITBUCKET_LIST_STATES[state]] + [('pagelen', 50)]
+            headers = {
+                'Authorization': f'Bearer {access_token}'
+            }
+            while url and (limit is None or len(found) < limit):
+                response = http_get(url, headers=headers, params=params)
+                response.raise_for_status()
+                batch, url = payloads.decode_bitbucket_pull_request_page(response.content)
+                found += batch
+                params = None  # the next URL carries them
+
+        else:
+            logger.error(f"Unknown provider: {repository.provider}")
+
+    except (requests.RequestException, *payloads.DECODE_ERRORS) as e:
+        logger.error(f"Listing pull requests of {repository.full_name} failed: {str(e)}")
+        return []
+
+    return found[:limit]
+
+
 def post_review_comment(pull_request, comment_text):
     """
     Post a review comment to the PR
@@ -91,10 +440,10 @@ def post_review_comment(pull_request, comment_text):
     """
     try:
         repo = pull_request.repository
-        access_token = repo.user.profile.access_token
+        access_token = repo.owner.profile.access_token
         
         if not access_token:
-            logger.error(f"No access token for user {repo.user.id}")
+            logger.error(f"No access token for user {repo.owner.id}")
             return False
         
         if repo.provider == 'github':
@@ -113,7 +462,7 @@ def post_review_comment(pull_request, comment_text):
 def post_github_comment(pull_request, access_token, comment_text):
     """Post comment to GitHub PR"""
     repo = pull_request.repository
-    url = f"https://api.github.com/repos/{repo.full_name}/issues/{pull_request.pr_number}/comments"
+    url = f"{settings.GITHUB_API_URL}/repos/{repo.full_name}/issues/{pull_request.pr_number}/comments"
     
     headers = {
         'Authorization': f'token {access_token}',
@@ -123,7 +472,7 @@ def post_github_comment(pull_request, access_token, comment_text):
     data = {'body': comment_text}
     
     try:
-        response = requests.post(url, json=data, headers=headers, timeout=30)
+        response = http_post(url, json=data, headers=headers)
         response.raise_for_status()
         logger.info(f"Posted comment to GitHub PR #{pull_request.pr_number}")
         return True
@@ -136,7 +485,7 @@ def post_bitbucket_comment(pull_request, access_token, comment_text):
     """Post comment to Bitbucket PR"""
     repo = pull_request.repository
     workspace, repo_slug = repo.full_name.split('/', 1)
-    url = f"https://api.bitbucket.org/2.0/repositories/{workspace}/{repo_slug}/pullrequests/{pull_request.pr_number}/comments"
+    url = f"{settings.BITBUCKET_API_URL}/repositories/{workspace}/{repo_slug}/pullrequests/{pull_request.pr_number}/comments"
     
     headers = {
         'Authorization': f'Bearer {access_token}',
@@ -150,7 +499,7 @@ def post_bitbucket_comment(pull_request, access_token, comment_text):
     }
     
     try:
-        response = requests.post(url, json=data, headers=headers, timeout=30)
+        response = http_post(url, json=data, headers=headers)
         response.raise_for_status()
         logger.info(f"Posted comment to Bitbucket PR #{pull_request.pr_number}")
         return True
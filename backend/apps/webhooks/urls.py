@@ -1,9 +1,10 @@
 from django.urls import path
-from .views import github_webhook, bitbucket_webhook
+from .views import github_webhook, bitbucket_webhook, webhook_stats
 
 app_name = 'webhooks'
 
 urlpatterns = [
     path('github/', github_webhook, name='github_webhook'),
     path('bitbucket/', bitbucket_webhook, name='bitbucket_webhook'),
+    path('stats/', webhook_stats, name='webhook_stats'),
 ]
\ No newline at end of file
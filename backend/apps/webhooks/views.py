@@ -1,30 +1,92 @@
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 import logging
 
+from . import inbox, llm
+from .dedup import deduplicator
+from .ultis import verify_signature
+
 logger = logging.getLogger(__name__)
 
-@api_view(['POST'])
-@permission_classes([AllowAny])
+# Webhook endpoints are plain Django views: the body is stored as raw bytes
+# and decoded later by the typed decoders in payloads.py, so DRF's request
+# wrapping, content negotiation and JSONParser would be pure overhead here.
+
+
+@csrf_exempt
+@require_POST
 def github_webhook(request):
     """Handle GitHub webhook events"""
     event = request.headers.get('X-GitHub-Event', 'unknown')
-    logger.info(f'Received GitHub webhook: {event}')
-    
-    return Response({
-        'status': 'received',
+    body = request.body
+
+    if not verify_signature(settings.GITHUB_WEBHOOK_SECRET, body,
+                            request.headers.get('X-Hub-Signature-256')):
+        logger.warning(f'Rejected GitHub webhook with bad signature: {event}')
+        return JsonResponse({'error': 'Invalid signature'}, status=401)
+
+    delivery = inbox.record_delivery(
+        'github', event, request.headers, body,
+        delivery_id=request.headers.get('X-GitHub-Delivery', '')
+    )
+    if delivery is None:
+        logger.info(f'Dropped duplicate GitHub webhook: {event}')
+        return JsonResponse({
+            'status': 'duplicate',
+            'event': event
+        })
+
+    inbox.enqueue_drain()
+    logger.info(f'Queued GitHub webhook: {event} (delivery {delivery.pk})')
+
+    return JsonResponse({
+        'status': 'queued',
         'event': event
-    })
+    }, status=202)
+
 
-@api_view(['POST'])
-@permission_classes([AllowAny])
+@csrf_exempt
+@require_POST
 def bitbucket_webhook(request):
     """Handle Bitbucket webhook events"""
     event = request.headers.get('X-Event-Key', 'unknown')
-    logger.info(f'Received Bitbucket webhook: {event}')
-    
-    return Response({
-        'status': 'received',
+    body = request.body
+
+    if not verify_signature(settings.BITBUCKET_WEBHOOK_SECRET, body,
+                            request.headers.get('X-Hub-Signature')):
+        logger.warning(f'Rejected Bitbucket webhook with bad signature: {event}')
+        return JsonResponse({'error': 'Invalid signature'}, status=401)
+
+    delivery = inbox.record_delivery(
+        'bitbucket', event, request.headers, body,
+        delivery_id=request.headers.get('X-Request-UUID', '')
+    )
+    if delivery is None:
+        logger.info(f'Dropped duplicate Bitbucket webhook: {event}')
+        return JsonResponse({
+            'status': 'duplicate',
+            'event': event
+        })
+
+    inbox.enqueue_drain()
+    logger.info(f'Queued Bitbucket webhook: {event} (delivery {delivery.pk})')
+
+    return JsonResponse({
+        'status': 'queued',
         'event': event
-    })
\ No newline at end of file
+    }, status=202)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def webhook_stats(request):
+    """Webhook ingestion and model usage counters, summed over every process"""
+    return Response({
+        'dedup': deduplicator.stats(),
+        'model_usage': llm.usage.stats(),
+    })
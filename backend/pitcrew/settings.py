@@ -223,16 +223,161 @@ BITBUCKET_CLIENT_SECRET = os.environ.get('BITBUCKET_CLIENT_SECRET', '')
 BITBUCKET_REDIRECT_URI = os.environ.get('BITBUCKET_REDIRECT_URI', 'http://localhost:3000/auth/callback')
 BITBUCKET_WEBHOOK_SECRET = os.environ.get('BITBUCKET_WEBHOOK_SECRET', '')
 
+# Provider API endpoints (override to point at a local stub for load tests)
+GITHUB_API_URL = os.environ.get('GITHUB_API_URL', 'https://api.github.com')
+BITBUCKET_API_URL = os.environ.get('BITBUCKET_API_URL', 'https://api.bitbucket.org/2.0')
+
+# Provider API HTTP: keep-alive sessions per host (ultis.SessionRegistry)
+PROVIDER_HTTP_POOL_SIZE = int(os.environ.get('PROVIDER_HTTP_POOL_SIZE', '16'))
+PROVIDER_HTTP_RETRIES = int(os.environ.get('PROVIDER_HTTP_RETRIES', '3'))
+PROVIDER_HTTP_BACKOFF = float(os.environ.get('PROVIDER_HTTP_BACKOFF', '0.5'))
+PROVIDER_HTTP_CONNECT_TIMEOUT = float(os.environ.get('PROVIDER_HTTP_CONNECT_TIMEOUT', '5'))
+PROVIDER_HTTP_READ_TIMEOUT = float(os.environ.get('PROVIDER_HTTP_READ_TIMEOUT', '30'))
+# Concurrent calls per async provider client (async_provider.py)
+PROVIDER_ASYNC_CONCURRENCY = int(os.environ.get('PROVIDER_ASYNC_CONCURRENCY', '8'))
+# Conditional GETs: ETag/Last-Modified revalidation of compressed stored bodies
+PROVIDER_HTTP_CACHE = os.environ.get('PROVIDER_HTTP_CACHE', 'True') == 'True'
+PROVIDER_CACHE_MAX_BYTES = int(os.environ.get('PROVIDER_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+PROVIDER_CACHE_MAX_ENTRY_BYTES = int(os.environ.get('PROVIDER_CACHE_MAX_ENTRY_BYTES', str(16 * 1024 * 1024)))
+# Per-host ProviderApiStats rows are updated at most this often; counts in between
+# accumulate in STATS_CACHE
+PROVIDER_STATS_FLUSH_SECONDS = int(os.environ.get('PROVIDER_STATS_FLUSH_SECONDS', '60'))
+# Rate-limit budget per access token, shared by workers (provider_budget.py):
+# background calls leave a fraction of the limit, review reads leave room to publish
+PROVIDER_BUDGET = os.environ.get('PROVIDER_BUDGET', 'True') == 'True'
+PROVIDER_BUDGET_CACHE = os.environ.get('PROVIDER_BUDGET_CACHE', 'shared')
+PROVIDER_BUDGET_BACKGROUND_RESERVE = float(os.environ.get('PROVIDER_BUDGET_BACKGROUND_RESERVE', '0.25'))
+PROVIDER_BUDGET_PUBLISH_RESERVE = int(os.environ.get('PROVIDER_BUDGET_PUBLISH_RESERVE', '100'))
+PROVIDER_BUDGET_MAX_REQUEUES = int(os.environ.get('PROVIDER_BUDGET_MAX_REQUEUES', '5'))
+# Local bare git mirrors as the diff and file source, API as fallback (git_mirror.py)
+GIT_MIRRORS = os.environ.get('GIT_MIRRORS', 'False') == 'True'
+GIT_MIRROR_ROOT = os.environ.get('GIT_MIRROR_ROOT', str(BASE_DIR / 'git-mirrors'))
+GIT_MIRROR_QUOTA_BYTES = int(os.environ.get('GIT_MIRROR_QUOTA_BYTES', str(20 * 1024 ** 3)))
+GIT_MIRROR_TIMEOUT = int(os.environ.get('GIT_MIRROR_TIMEOUT', '300'))
+GIT_MIRROR_CONTEXT_LINES = int(os.environ.get('GIT_MIRROR_CONTEXT_LINES', '3'))
+GITHUB_GIT_URL = os.environ.get('GITHUB_GIT_URL', 'https://github.com')
+BITBUCKET_GIT_URL = os.environ.get('BITBUCKET_GIT_URL', 'https://bitbucket.org')
+
 # Anthropic API
 ANTHROPIC_API_KEY = os.environ.get('ANTHROPIC_API_KEY', '')
 ANTHROPIC_MODEL = os.environ.get('ANTHROPIC_MODEL', 'claude-sonnet-4-20250514')
+ANTHROPIC_BASE_URL = os.environ.get('ANTHROPIC_BASE_URL') or None
+
+# AI analysis: diffs are split into chunks analyzed in parallel, then merged
+AI_CHUNK_TOKEN_BUDGET = int(os.environ.get('AI_CHUNK_TOKEN_BUDGET', '6000'))
+AI_MAX_PARALLEL_CALLS = int(os.environ.get('AI_MAX_PARALLEL_CALLS', '8'))
+AI_MAX_CHUNKS = int(os.environ.get('AI_MAX_CHUNKS', '40'))
+# Diff tokens sent per review; beyond it the riskiest hunks go first. Leaves
+# headroom under AI_MAX_CHUNKS full chunks for imperfect chunk packing
+AI_CONTEXT_TOKEN_BUDGET = int(os.environ.get(
+    'AI_CONTEXT_TOKEN_BUDGET', str(AI_CHUNK_TOKEN_BUDGET * AI_MAX_CHUNKS * 3 // 4)
+))
+# Model clients are shared per worker process (apps/webhooks/llm.py)
+AI_HTTP_MAX_CONNECTIONS = int(os.environ.get('AI_HTTP_MAX_CONNECTIONS', '64'))
+AI_ASYNC_CALLS = os.environ.get('AI_ASYNC_CALLS', 'False') == 'True'
+AI_MAX_INFLIGHT_PER_WORKER = int(os.environ.get('AI_MAX_INFLIGHT_PER_WORKER', '32'))
+# Send the static review instructions as a provider prompt-cache prefix
+AI_PROMPT_CACHE = os.environ.get('AI_PROMPT_CACHE', 'True') == 'True'
+# Model call limits shared by all workers through a Django cache (rate_limit.py);
+# 0 leaves a limit off, 429/529 backoff still applies
+AI_RATE_LIMIT = os.environ.get('AI_RATE_LIMIT', 'True') == 'True'
+AI_RATE_LIMIT_CACHE = os.environ.get('AI_RATE_LIMIT_CACHE', 'shared')
+AI_RATE_LIMIT_RPM = int(os.environ.get('AI_RATE_LIMIT_RPM', '0'))
+AI_RATE_LIMIT_TPM = int(os.environ.get('AI_RATE_LIMIT_TPM', '0'))
+AI_RATE_LIMIT_MAX_WAIT = float(os.environ.get('AI_RATE_LIMIT_MAX_WAIT', '30'))
+AI_RATE_LIMIT_MAX_REQUEUES = int(os.environ.get('AI_RATE_LIMIT_MAX_REQUEUES', '10'))
+
+# Local static checks; large diffs are checked in a process pool
+STATIC_CHECKS = os.environ.get('STATIC_CHECKS', 'True') == 'True'
+STATIC_CHECK_WORKERS = int(os.environ.get('STATIC_CHECK_WORKERS', '4'))
+STATIC_CHECK_PARALLEL_MIN_LINES = int(os.environ.get('STATIC_CHECK_PARALLEL_MIN_LINES', '20000'))
+
+# Per-file review cache: 'cache' (Django cache alias), 'db' (table) or '' (off).
+# Every worker must see the same entries: the alias is Redis when
+# SHARED_CACHE_URL is set, otherwise the table is the default
+REVIEW_CACHE_BACKEND = os.environ.get(
+    'REVIEW_CACHE_BACKEND', 'cache' if os.environ.get('SHARED_CACHE_URL') else 'db'
+)
+REVIEW_CACHE_ALIAS = 'review-cache'
+REVIEW_CACHE_TIMEOUT = int(os.environ.get('REVIEW_CACHE_TIMEOUT', str(7 * 24 * 3600)))
+REVIEW_CACHE_MAX_ENTRIES = int(os.environ.get('REVIEW_CACHE_MAX_ENTRIES', '20000'))
+
+# Celery
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'django-db')
+CELERY_TASK_ACKS_LATE = True
+CELERY_BEAT_SCHEDULE = {
+    # Safety net: picks up deliveries whose enqueue failed or whose worker died
+    'drain-webhook-inbox': {
+        'task': 'apps.webhooks.tasks.drain_webhook_inbox',
+        'schedule': 60.0,
+    },
+    'dispatch-due-reviews': {
+        'task': 'apps.webhooks.tasks.dispatch_due_reviews',
+        'schedule': 60.0,
+    },
+    'poll-review-batches': {
+        'task': 'apps.webhooks.tasks.poll_review_batches',
+        'schedule': float(os.environ.get('REVIEW_BATCH_POLL_SECONDS', '300')),
+    },
+}
+
+# Webhook inbox
+WEBHOOK_INBOX_BATCH_SIZE = int(os.environ.get('WEBHOOK_INBOX_BATCH_SIZE', '25'))
+WEBHOOK_INBOX_LEASE_SECONDS = int(os.environ.get('WEBHOOK_INBOX_LEASE_SECONDS', '600'))
+WEBHOOK_INBOX_MAX_ATTEMPTS = int(os.environ.get('WEBHOOK_INBOX_MAX_ATTEMPTS', '5'))
+WEBHOOK_DEDUP_LRU_SIZE = int(os.environ.get('WEBHOOK_DEDUP_LRU_SIZE', '10000'))
+# Monitoring counters summed over every process (counters.py)
+STATS_CACHE = os.environ.get('STATS_CACHE', 'shared')
+
+# Review scheduling: quiet window that coalesces bursts of pushes per PR
+REVIEW_DEBOUNCE_SECONDS = int(os.environ.get('REVIEW_DEBOUNCE_SECONDS', '60'))
+REVIEW_JOB_LEASE_SECONDS = int(os.environ.get('REVIEW_JOB_LEASE_SECONDS', '900'))
+# Re-reviews analyze only the commits pushed since the last reviewed head
+REVIEW_INCREMENTAL = os.environ.get('REVIEW_INCREMENTAL', 'True') == 'True'
+# PR diffs are streamed: kept in memory up to the spill size, then in an
+# mmapped temp file; files past the cap are not reviewed (diff_stream.py)
+REVIEW_DIFF_MAX_BYTES = int(os.environ.get('REVIEW_DIFF_MAX_BYTES', str(64 * 1024 * 1024)))
+REVIEW_DIFF_SPILL_BYTES = int(os.environ.get('REVIEW_DIFF_SPILL_BYTES', str(4 * 1024 * 1024)))
+# Diff files in these triage categories never reach the model (empty: no triage)
+REVIEW_TRIAGE_SKIP = os.environ.get('REVIEW_TRIAGE_SKIP', 'lockfile,generated,vendored,minified,binary,docs')
+# Backfills go through the provider's message batches (up to 100k requests each)
+REVIEW_BATCH_MAX_REQUESTS = int(os.environ.get('REVIEW_BATCH_MAX_REQUESTS', '10000'))
+# Reviews are published once per PR and edited in place (publisher.py);
+# Bitbucket inline comments are posted this many at a time
+REVIEW_PUBLISH_CONCURRENCY = int(os.environ.get('REVIEW_PUBLISH_CONCURRENCY', '4'))
 
 # Cache Configuration (Simple cache for development)
+# 'shared' holds state every web and worker process must see (rate limits,
+# provider budgets, stats counters); set SHARED_CACHE_URL (e.g.
+# redis://localhost:6379/1) when running more than one process, otherwise
+# each process keeps its own. It backs 'review-cache' too
+SHARED_CACHE_URL = os.environ.get('SHARED_CACHE_URL', '')
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         'LOCATION': 'pitcrew-cache',
-    }
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': SHARED_CACHE_URL,
+    } if SHARED_CACHE_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'pitcrew-shared-cache',
+    },
+    'review-cache': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': SHARED_CACHE_URL,
+        'KEY_PREFIX': 'review',
+        'TIMEOUT': REVIEW_CACHE_TIMEOUT,
+    } if SHARED_CACHE_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'pitcrew-review-cache',
+        'TIMEOUT': REVIEW_CACHE_TIMEOUT,
+        'OPTIONS': {
+            'MAX_ENTRIES': REVIEW_CACHE_MAX_ENTRIES,
+        },
+    },
 }
 
 # Logging Configuration